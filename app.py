@@ -1,26 +1,32 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, extract
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import joinedload
-from sqlalchemy.exc import OperationalError
+from sqlalchemy import func, extract, event, text, tuple_
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.orm import joinedload, Session
+from sqlalchemy.exc import IntegrityError, OperationalError
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
-import asyncio
+import atexit
 import sys
 import base64
 import traceback
 import json
+import queue
+import threading
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(basedir, 'backend'))
 
-from rpa_service import scrape_fertipar_data
-from rpa_task_processor import process_agendamento_main_task
+from rpa_runtime import RuntimeRPA
+from rpa_service import SITUACOES_FINAIS
+from cache_utils import CacheLeituras, CachePeriodos, CacheTTL
+from canal_eventos import CanalEventos
 
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 from functools import wraps
+from collections import Counter, namedtuple
 
 from dotenv import load_dotenv
 
@@ -64,7 +70,7 @@ def login_required(f):
             flash('Você precisa estar logado para ver esta página.', 'warning')
             return redirect(url_for('login'))
         
-        user = db.session.get(Usuario, session['user_id'])
+        user = usuario_da_sessao(session['user_id'])
         if user is None:
             session.pop('user_id', None)
             if request.path.startswith('/api/'):
@@ -84,7 +90,7 @@ def admin_required(f):
             flash('Você precisa estar logado para ver esta página.', 'warning')
             return redirect(url_for('login'))
         
-        user = db.session.get(Usuario, session['user_id'])
+        user = usuario_da_sessao(session['user_id'])
         if user is None:
             session.pop('user_id', None)
             if request.path.startswith('/api/'): return jsonify(error="Sessão inválida"), 401
@@ -108,7 +114,7 @@ def dev_required(f):
             flash('Você precisa estar logado para ver esta página.', 'warning')
             return redirect(url_for('login'))
         
-        user = db.session.get(Usuario, session['user_id'])
+        user = usuario_da_sessao(session['user_id'])
         if user is None:
             session.pop('user_id', None)
             if request.path.startswith('/api/'): return jsonify(error="Sessão inválida"), 401
@@ -144,6 +150,40 @@ class Usuario(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+
+# Dados do usuário logado usados pelos decoradores e templates (g.user). Ficam em cache
+# por alguns segundos para que as requisições autenticadas (inclusive os pollings das
+# abas abertas) não consultem o banco a cada vez; alterações/exclusões de Usuario
+# descartam a entrada após o commit, neste e nos demais processos (ver canal_caches).
+UsuarioAutenticado = namedtuple('UsuarioAutenticado', 'id username nome email role foto_perfil')
+TTL_CACHE_USUARIOS_SEGUNDOS = 60
+cache_usuarios = CacheTTL(TTL_CACHE_USUARIOS_SEGUNDOS)
+
+def usuario_da_sessao(user_id):
+    """Retorna o UsuarioAutenticado do id da sessão (None se o usuário não existe mais)."""
+    def _carregar():
+        user = db.session.get(Usuario, user_id)
+        if user is None:
+            return None
+        return UsuarioAutenticado(user.id, user.username, user.nome, user.email, user.role, user.foto_perfil)
+    return cache_usuarios.obter(user_id, _carregar)
+
+@event.listens_for(Session, 'after_flush')
+def _marcar_usuarios_alterados(session, flush_context):
+    ids = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, Usuario)}
+    if ids:
+        session.info.setdefault('usuarios_alterados', set()).update(ids)
+        notificar_caches(session, usuarios=ids)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_usuarios_apos_commit(session):
+    for user_id in session.info.pop('usuarios_alterados', ()):
+        cache_usuarios.invalidar(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_usuarios_apos_rollback(session):
+    session.info.pop('usuarios_alterados', None)
+
 class Motorista(db.Model):
     __tablename__ = 'motorista'
     id = db.Column(db.Integer, primary_key=True)
@@ -167,6 +207,9 @@ class Caminhao(db.Model):
     placa_reboque3 = db.Column(db.String(10))
     uf3 = db.Column(db.String(2))
 
+# Versão monotônica compartilhada por agendas e remoções: cursor do feed /api/agendas/changes
+agenda_versao_seq = db.Sequence('agenda_versao_seq')
+
 class Agenda(db.Model):
     # ... (columns are the same)
     id = db.Column(db.Integer, primary_key=True)
@@ -181,54 +224,110 @@ class Agenda(db.Model):
     carga_solicitada = db.Column(db.Numeric(precision=10, scale=2), nullable=True)
     status = db.Column(db.String(50), nullable=False, default='espera')
     log_retorno = db.Column(db.Text, nullable=True)
-    data_agendamento = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    fertipar_situacao = db.Column(db.String(50), nullable=True) # 'Situação' na grade de cotações (vigia do rpa_worker)
+    prioridade = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Maior sai antes da fila do robô
+    data_agendamento = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+    versao = db.Column(db.BigInteger, agenda_versao_seq, server_default=agenda_versao_seq.next_value(), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), default=func.clock_timestamp(), onupdate=func.clock_timestamp())
 
     motorista = db.relationship('Motorista', backref=db.backref('agendas', lazy=True))
     caminhao = db.relationship('Caminhao', backref=db.backref('agendas', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_agenda_status_data_agendamento', 'status', 'data_agendamento'),
+    )
+
     def to_dict(self, for_socket=False):
-        motorista_info = self.motorista.nome
-        if self.motorista.cpf:
-            motorista_info += f" ({self.motorista.cpf})"
-        elif self.motorista.telefone:
-            motorista_info += f" ({self.motorista.telefone})"
-            
-        caminhao_obj = self.caminhao
-        reboques_list = []
-        if caminhao_obj.placa_reboque1:
-            reboques_list.append(f"Reb1: {caminhao_obj.placa_reboque1} ({caminhao_obj.uf1 or ''})")
-        if caminhao_obj.placa_reboque2:
-            reboques_list.append(f"Reb2: {caminhao_obj.placa_reboque2} ({caminhao_obj.uf2 or ''})")
-        if caminhao_obj.placa_reboque3:
-            reboques_list.append(f"Reb3: {caminhao_obj.placa_reboque3} ({caminhao_obj.uf3 or ''})")
-
-        caminhao_data = {
-            "placa": f"{caminhao_obj.placa} ({caminhao_obj.uf})",
-            "tipo_carroceria": caminhao_obj.tipo_carroceria,
-            "reboques": reboques_list
-        }
-        
-        # For UI rendering in the table, we need a simple string.
-        # For the DADOSBOT JSON, we use the structured object.
-        caminhao_display = f"{caminhao_data['placa']}"
-        if caminhao_data['tipo_carroceria']:
-            caminhao_display += f" - {caminhao_data['tipo_carroceria']}"
-        if caminhao_data['reboques']:
-            caminhao_display += f" | {', '.join(caminhao_data['reboques'])}"
+        motorista, caminhao = self.motorista, self.caminhao
+        return serializar_agenda({
+            'id': self.id, 'fertipar_protocolo': self.fertipar_protocolo, 'fertipar_pedido': self.fertipar_pedido,
+            'fertipar_destino': self.fertipar_destino, 'status': self.status, 'log_retorno': self.log_retorno,
+            'fertipar_situacao': self.fertipar_situacao, 'prioridade': self.prioridade,
+            'data_agendamento': self.data_agendamento, 'carga_solicitada': self.carga_solicitada,
+            'motorista_nome': motorista.nome, 'motorista_cpf': motorista.cpf, 'motorista_telefone': motorista.telefone,
+            'placa': caminhao.placa, 'uf': caminhao.uf, 'tipo_carroceria': caminhao.tipo_carroceria,
+            'placa_reboque1': caminhao.placa_reboque1, 'uf1': caminhao.uf1,
+            'placa_reboque2': caminhao.placa_reboque2, 'uf2': caminhao.uf2,
+            'placa_reboque3': caminhao.placa_reboque3, 'uf3': caminhao.uf3,
+        })
+
+
+def serializar_agenda(c):
+    """Monta o dicionário da agenda (formato de Agenda.to_dict) a partir dos valores das colunas (ver COLUNAS_AGENDA_DICT)."""
+    motorista_info = c['motorista_nome']
+    if c['motorista_cpf']:
+        motorista_info += f" ({c['motorista_cpf']})"
+    elif c['motorista_telefone']:
+        motorista_info += f" ({c['motorista_telefone']})"
+
+    reboques_list = []
+    for numero in (1, 2, 3):
+        if c[f'placa_reboque{numero}']:
+            reboques_list.append(f"Reb{numero}: {c[f'placa_reboque{numero}']} ({c[f'uf{numero}'] or ''})")
+
+    caminhao_data = {
+        "placa": f"{c['placa']} ({c['uf']})",
+        "tipo_carroceria": c['tipo_carroceria'],
+        "reboques": reboques_list
+    }
+
+    return {
+        'id': c['id'],
+        'motorista': motorista_info,
+        'caminhao': caminhao_data,
+        'protocolo': c['fertipar_protocolo'],
+        'pedido': c['fertipar_pedido'],
+        'destino': c['fertipar_destino'],
+        'status': c['status'],
+        'log_retorno': c['log_retorno'],
+        'situacao_fertipar': c['fertipar_situacao'],
+        'prioridade': c['prioridade'],
+        'data_agendamento': c['data_agendamento'].strftime('%d/%m/%Y %H:%M'),
+        'carga_solicitada': float(c['carga_solicitada']) if c['carga_solicitada'] else None
+    }
+
+# Colunas lidas pelas listagens de agendas: uma única consulta com JOIN, sem hidratar objetos ORM
+COLUNAS_AGENDA_DICT = (
+    Agenda.id, Agenda.fertipar_protocolo, Agenda.fertipar_pedido, Agenda.fertipar_destino, Agenda.status,
+    Agenda.log_retorno, Agenda.fertipar_situacao, Agenda.prioridade, Agenda.data_agendamento, Agenda.carga_solicitada,
+    Motorista.nome.label('motorista_nome'), Motorista.cpf.label('motorista_cpf'), Motorista.telefone.label('motorista_telefone'),
+    Caminhao.placa, Caminhao.uf, Caminhao.tipo_carroceria,
+    Caminhao.placa_reboque1, Caminhao.uf1, Caminhao.placa_reboque2, Caminhao.uf2, Caminhao.placa_reboque3, Caminhao.uf3,
+)
+
+def listar_agendas_dict(consulta):
+    """Executa uma consulta de Agenda (com filtros/ordem) projetando só as colunas do dicionário."""
+    linhas = consulta.join(Agenda.motorista).join(Agenda.caminhao).with_entities(*COLUNAS_AGENDA_DICT)
+    return [serializar_agenda(linha._mapping) for linha in linhas]
+
+
+@event.listens_for(Agenda, 'before_update')
+def _nova_versao_agenda(mapper, connection, target):
+    # before_update também é chamado para objetos sem alteração líquida; só esses ganham nova versão
+    if Session.object_session(target).is_modified(target, include_collections=False):
+        target.versao = agenda_versao_seq.next_value()
+
+class AgendaRemovida(db.Model):
+    """Registro das agendas excluídas, para que o feed incremental também entregue remoções."""
+    __tablename__ = 'agenda_removida'
+    agenda_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    versao = db.Column(db.BigInteger, agenda_versao_seq, server_default=agenda_versao_seq.next_value(), nullable=False, index=True)
+    removida_em = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), default=func.clock_timestamp())
 
-        return {
-            'id': self.id,
-            'motorista': motorista_info,
-            'caminhao': caminhao_data,
-            'protocolo': self.fertipar_protocolo,
-            'pedido': self.fertipar_pedido,
-            'destino': self.fertipar_destino,
-            'status': self.status,
-            'log_retorno': self.log_retorno,
-            'data_agendamento': self.data_agendamento.strftime('%d/%m/%Y %H:%M'),
-            'carga_solicitada': float(self.carga_solicitada) if self.carga_solicitada else None
-        }
 
+class AgendaRollupMensal(db.Model):
+    """
+    Totais de agendas por mês × destino × embalagem × motorista, mantidos de forma
+    incremental a cada flush (ver _atualizar_rollup_apos_flush). Destino/embalagem
+    ausentes são gravados como '' para que a chave composta funcione no ON CONFLICT.
+    """
+    __tablename__ = 'agenda_rollup_mensal'
+    mes = db.Column(db.Date, primary_key=True)
+    destino = db.Column(db.String(100), primary_key=True, default='')
+    embalagem = db.Column(db.String(100), primary_key=True, default='')
+    motorista_id = db.Column(db.Integer, db.ForeignKey('motorista.id'), primary_key=True)
+    total_agendamentos = db.Column(db.Integer, nullable=False, default=0)
+    total_carga = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0)
 
 
 class ConfiguracaoRobo(db.Model):
@@ -246,6 +345,11 @@ class ConfiguracaoRobo(db.Model):
     head_evento = db.Column(db.Boolean(), nullable=False, default=False)
     modo_execucao = db.Column(db.String(20), nullable=False, default='teste')
     tempo_espera_segundos = db.Column(db.Integer, nullable=False, default=30)
+    # Quantas agendas o worker executa ao mesmo tempo (abas/contextos no mesmo navegador)
+    max_execucoes_paralelas = db.Column(db.Integer, nullable=False, default=3, server_default='3')
+    cache_cotacoes_segundos = db.Column(db.Integer, nullable=False, default=60, server_default='60')
+    perfil_espera = db.Column(db.String(20), nullable=False, default='rapido', server_default='rapido') # 'rapido' ou 'seguro'
+    perfil_navegador = db.Column(db.String(20), nullable=False, default='completo', server_default='completo') # 'completo' ou 'enxuto'
 
     def set_senha_site(self, password):
         """Codifica a senha em base64 antes de salvar."""
@@ -266,11 +370,694 @@ class RpaSessao(db.Model):
     id = db.Column(db.Integer, primary_key=True, default=1)
     storage_state = db.Column(JSONB)
     last_updated = db.Column(db.DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    ultimo_uso = db.Column(db.DateTime(timezone=True), nullable=True) # Última vez que o site aceitou a sessão
+    duracao_medida_segundos = db.Column(db.Integer, nullable=True) # Ociosidade após a qual o site expirou a sessão
     
     __table_args__ = (
         db.CheckConstraint('id = 1', name='single_row_check'),
     )
 
+class RpaJob(db.Model):
+    """Fila de execuções do robô, consumida pelo worker (rpa_worker.py)."""
+    __tablename__ = 'rpa_job'
+    id = db.Column(db.Integer, primary_key=True)
+    agenda_id = db.Column(db.Integer, db.ForeignKey('agenda.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente') # pendente, executando, concluido, erro
+    modo = db.Column(db.String(10), nullable=False, default='normal') # normal, dev
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100), nullable=True)
+    resultado = db.Column(db.Text, nullable=True)
+    criado_em = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now())
+    iniciado_em = db.Column(db.DateTime(timezone=True), nullable=True)
+    finalizado_em = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    agenda = db.relationship('Agenda', backref=db.backref('jobs', lazy=True, passive_deletes=True))
+
+    __table_args__ = (
+        db.Index('ix_rpa_job_status_criado_em', 'status', 'criado_em'),
+        # No máximo um job ativo por agenda, mesmo com pedidos simultâneos (duplo clique, vários operadores)
+        db.Index('uq_rpa_job_agenda_ativa', 'agenda_id', unique=True,
+                 postgresql_where=db.text("status IN ('pendente', 'executando')")),
+    )
+
+    def to_dict(self):
+        resultado = json.loads(self.resultado) if self.resultado else None
+        return {
+            'id': self.id,
+            'agenda_id': self.agenda_id,
+            'status': self.status,
+            'modo': self.modo,
+            'tentativas': self.tentativas,
+            'resultado': resultado,
+            'agenda_status': self.agenda.status if self.agenda else None,
+            'criado_em': self.criado_em.strftime('%d/%m/%Y %H:%M:%S') if self.criado_em else None,
+            'finalizado_em': self.finalizado_em.strftime('%d/%m/%Y %H:%M:%S') if self.finalizado_em else None,
+        }
+
+# --- RPA Helpers ---
+def montar_config_rpa(config):
+    """Converte a ConfiguracaoRobo no dicionário 'config' esperado pelos módulos do robô."""
+    return {
+        "url_acesso": config.url_acesso,
+        "filial": config.filial,
+        "usuario_site": config.usuario_site,
+        "senha_site": config.senha_site, # senha_site é uma property que decodifica o valor
+        "email_retorno": config.email_retorno,
+        "pagina_raspagem": config.pagina_raspagem,
+        "contato": config.contato,
+        "telefone": config.telefone,
+        "head_evento": config.head_evento,
+        "tempo_espera_segundos": config.tempo_espera_segundos,
+        "modo_execucao": config.modo_execucao,
+        "max_execucoes_paralelas": config.max_execucoes_paralelas,
+        "cache_cotacoes_segundos": config.cache_cotacoes_segundos,
+        "perfil_espera": config.perfil_espera,
+        "perfil_navegador": config.perfil_navegador,
+    }
+
+def montar_rpa_params(agenda, config, motorista, caminhao, storage_state=None):
+    """Estrutura todos os dados de uma execução em um único dicionário (JSON) para o robô."""
+    return {
+        "config": montar_config_rpa(config),
+        "agenda": {
+            "id": agenda.id,
+            "fertipar_protocolo": agenda.fertipar_protocolo,
+            "fertipar_pedido": agenda.fertipar_pedido,
+            "fertipar_destino": agenda.fertipar_destino,
+            "carga_solicitada": float(agenda.carga_solicitada) if agenda.carga_solicitada else None,
+        },
+        "motorista": {
+            "id": motorista.id,
+            "nome": motorista.nome,
+            "cpf": motorista.cpf,
+        },
+        "caminhao": {
+            "id": caminhao.id,
+            "placa": caminhao.placa,
+            "uf": caminhao.uf,
+            "tipo_carroceria": caminhao.tipo_carroceria,
+            "placa_reboque1": caminhao.placa_reboque1,
+            "uf1": caminhao.uf1,
+            "placa_reboque2": caminhao.placa_reboque2,
+            "uf2": caminhao.uf2,
+            "placa_reboque3": caminhao.placa_reboque3,
+            "uf3": caminhao.uf3,
+        },
+        "storage_state": storage_state # Passa o estado da sessão para o robô
+    }
+
+def carregar_storage_state():
+    """Carrega o estado de sessão do RPA salvo no banco (ou None)."""
+    sessao_rpa = db.session.query(RpaSessao).first()
+    return sessao_rpa.storage_state if sessao_rpa else None
+
+def salvar_storage_state(new_storage_state):
+    """Persiste um novo estado de sessão do RPA, se houver."""
+    if not new_storage_state:
+        return
+    print("--- SALVANDO NOVO ESTADO DA SESSÃO NO BANCO DE DADOS ---")
+    agora = datetime.now(timezone.utc)
+    sessao_rpa = db.session.query(RpaSessao).first()
+    if sessao_rpa:
+        sessao_rpa.storage_state = new_storage_state
+        sessao_rpa.last_updated = agora
+        sessao_rpa.ultimo_uso = agora
+    else:
+        sessao_rpa = RpaSessao(storage_state=new_storage_state, ultimo_uso=agora)
+        db.session.add(sessao_rpa)
+    db.session.commit()
+    print("--- Novo estado da sessão salvo com sucesso. ---")
+
+# --- Sessão do Robô (keep-alive) ---
+# Até a primeira expiração observada supõe uma sessão curta (o padrão de sessões JSF é 30 min)
+DURACAO_SESSAO_PADRAO_S = 20 * 60
+DURACAO_SESSAO_MINIMA_S = 2 * 60
+# A sessão é renovada quando fica ociosa por esta fração da duração medida
+FRACAO_RENOVACAO_SESSAO = 0.5
+
+def registrar_uso_sessao(storage_state_usado, expirada=False):
+    """
+    Registra um uso da sessão salva pelo robô, iniciado com `storage_state_usado`. Se
+    `expirada` (o site pediu login), o tempo ocioso desde o último uso limita a duração da
+    sessão por cima e vira a medida; se a sessão ainda valia depois de ficar ociosa por mais
+    que a medida, a medida aumenta. Usos que partiram de um estado já substituído (ex.:
+    execuções paralelas que fizeram login com a mesma sessão antiga) não contam.
+    """
+    sessao_rpa = db.session.query(RpaSessao).first()
+    if not sessao_rpa or not storage_state_usado or sessao_rpa.storage_state != storage_state_usado:
+        return
+    agora = datetime.now(timezone.utc)
+    if sessao_rpa.ultimo_uso is None:
+        # Sessão salva antes da medição existir: começa a contar a partir deste uso
+        if not expirada:
+            sessao_rpa.ultimo_uso = agora
+            db.session.commit()
+        return
+    ociosa = max(int((agora - sessao_rpa.ultimo_uso).total_seconds()), DURACAO_SESSAO_MINIMA_S)
+    medida = sessao_rpa.duracao_medida_segundos
+    if expirada:
+        if medida is None or ociosa < medida:
+            sessao_rpa.duracao_medida_segundos = ociosa
+            print(f"[SESSAO] Sessão expirou após {ociosa}s ociosa; duração medida: {ociosa}s.")
+    else:
+        if medida is not None and ociosa > medida:
+            sessao_rpa.duracao_medida_segundos = ociosa
+        sessao_rpa.ultimo_uso = agora
+    db.session.commit()
+
+def segundos_para_renovar_sessao():
+    """Quanto falta para o keep-alive renovar a sessão salva (<= 0: renovar já)."""
+    sessao_rpa = db.session.query(RpaSessao).first()
+    if not sessao_rpa or not sessao_rpa.storage_state or not sessao_rpa.ultimo_uso:
+        return 0
+    duracao = sessao_rpa.duracao_medida_segundos or DURACAO_SESSAO_PADRAO_S
+    ociosa = (datetime.now(timezone.utc) - sessao_rpa.ultimo_uso).total_seconds()
+    return duracao * FRACAO_RENOVACAO_SESSAO - ociosa
+
+def aplicar_resultado_rpa(agenda, result, dev_mode=False):
+    """
+    Atualiza status e log_retorno da agenda a partir do retorno do robô.
+    Retorna (sucesso, mensagem_para_usuario).
+    """
+    sufixo_status = ' (Dev)' if dev_mode else ''
+    sufixo_log = ' (Dev Mode)' if dev_mode else ''
+
+    if result['success']:
+        agenda.status = 'agendado'
+        agenda.log_retorno = result.get('message', f'Agendamento concluído com sucesso{sufixo_log}.')
+        db.session.commit()
+        return True, result.get('user_facing_message', result.get('message', f'Agendamento concluído com sucesso{sufixo_log}.'))
+
+    # Verifica se há um status específico de falha retornado pelo RPA
+    if result.get('status') == 'falhou':
+        agenda.status = f'falhou{sufixo_status}'
+    else:
+        agenda.status = f'erro{sufixo_status}'
+    agenda.log_retorno = result.get('message', f'Erro desconhecido durante a execução do RPA{sufixo_log}.')
+
+    try:
+        db.session.commit()
+    except Exception as commit_e:
+        db.session.rollback()
+        print(f"ERROR app.py: db.session.commit() failed for agenda {agenda.id}{sufixo_log}: {commit_e}")
+        try:
+            agenda.log_retorno = f"Original commit{sufixo_log} failed: {commit_e}"
+            db.session.commit()
+        except Exception as final_e:
+            db.session.rollback()
+            print(f"CRITICAL ERROR app.py: Failed to commit commit error for agenda {agenda.id}{sufixo_log}: {final_e}")
+        return False, f"Erro ao persistir log{sufixo_log}: {commit_e}"
+
+    return False, result.get('user_facing_message', result.get('message', f'Ocorreu um erro durante a execução do RPA{sufixo_log}.'))
+
+# Jobs que ainda vão rodar ou estão rodando (no máximo um por agenda: uq_rpa_job_agenda_ativa)
+STATUS_JOB_ATIVO = ('pendente', 'executando')
+
+# Agendas que podem ser (re)executadas pelo robô: em espera ou após um erro de execução
+STATUS_AGENDA_EXECUTAVEL = ('espera', 'erro', 'erro (Dev)')
+
+# Agendas cuja 'Situação' na Fertipar é acompanhada pelo vigia do rpa_worker
+STATUS_SITUACAO_MONITORADA = ('espera', 'processando', 'processando (Dev)')
+
+def pares_monitorados():
+    """
+    Pares (protocolo, pedido) das agendas em STATUS_SITUACAO_MONITORADA cuja situação
+    ainda não é final (SITUACOES_FINAIS): depois de APROVADO/RECUSADO não há o que vigiar.
+    """
+    situacao = func.coalesce(Agenda.fertipar_situacao, '')
+    consulta = db.session.query(Agenda.fertipar_protocolo, func.coalesce(Agenda.fertipar_pedido, ''))\
+        .filter(Agenda.status.in_(STATUS_SITUACAO_MONITORADA),
+                ~db.or_(*(situacao.contains(final) for final in SITUACOES_FINAIS)))
+    return {(protocolo, pedido) for protocolo, pedido in consulta}
+
+def aplicar_situacoes_fertipar(situacoes):
+    """
+    Grava em um único UPDATE a 'Situação' lida na grade ({(protocolo, pedido): situação})
+    nas agendas monitoradas. Só as linhas que mudaram ganham nova versão e NOTIFY; agendas
+    em espera recusadas na Fertipar passam a 'recusado'. Retorna os ids alterados.
+    """
+    if not situacoes:
+        return []
+    lidas = db.values(
+        db.column('protocolo', db.String), db.column('pedido', db.String), db.column('situacao', db.String),
+        name='lidas',
+    ).data([(protocolo, pedido, situacao) for (protocolo, pedido), situacao in situacoes.items()])
+    stmt = (
+        db.update(Agenda)
+        .where(
+            Agenda.fertipar_protocolo == lidas.c.protocolo,
+            func.coalesce(Agenda.fertipar_pedido, '') == lidas.c.pedido,
+            Agenda.status.in_(STATUS_SITUACAO_MONITORADA),
+            Agenda.fertipar_situacao.is_distinct_from(lidas.c.situacao),
+        )
+        .values(
+            fertipar_situacao=lidas.c.situacao,
+            status=db.case(
+                (db.and_(Agenda.status == 'espera', lidas.c.situacao.contains('RECUSADO')), 'recusado'),
+                else_=Agenda.status,
+            ),
+            # O UPDATE em massa não passa pelo flush: versão e updated_at são definidos aqui
+            versao=agenda_versao_seq.next_value(),
+            updated_at=func.clock_timestamp(),
+        )
+        .returning(Agenda.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = [agenda_id for (agenda_id,) in db.session.execute(stmt)]
+    notificar_agendas(db.session, alterados=ids)
+    db.session.commit()
+    return ids
+
+def enfileirar_aprovadas():
+    """
+    Modo 'agendado': cria de uma vez os jobs das agendas em espera já APROVADAS na grade
+    (sem job pendente/em execução), em ordem de data_agendamento. Retorna os ids dos jobs.
+    """
+    config = db.session.query(ConfiguracaoRobo).first()
+    if not config or config.modo_execucao != 'agendado':
+        return []
+    ja_na_fila = db.select(RpaJob.id).where(RpaJob.agenda_id == Agenda.id, RpaJob.status.in_(STATUS_JOB_ATIVO)).exists()
+    aprovadas = db.select(Agenda.id, db.literal('normal'), db.literal('pendente'))\
+        .where(Agenda.status == 'espera', Agenda.fertipar_situacao.contains('APROVADO'), ~ja_na_fila)\
+        .order_by(Agenda.prioridade.desc(), Agenda.data_agendamento, Agenda.id)
+    stmt = pg_insert(RpaJob).from_select(['agenda_id', 'modo', 'status'], aprovadas)\
+        .on_conflict_do_nothing(index_elements=['agenda_id'], index_where=RpaJob.status.in_(STATUS_JOB_ATIVO))\
+        .returning(RpaJob.id, RpaJob.agenda_id)
+    criados = db.session.execute(stmt).all()
+    db.session.commit()
+    for job_id, agenda_id in criados:
+        print(f"--- Agenda {agenda_id} APROVADA na Fertipar: enviada para a fila do robô (job {job_id}) ---")
+    return [job_id for job_id, _ in criados]
+
+def enfileirar_agenda(agenda, modo='normal'):
+    """Cria um RpaJob para a agenda, reaproveitando um job ainda pendente/em execução."""
+    job = RpaJob.query.filter(RpaJob.agenda_id == agenda.id, RpaJob.status.in_(STATUS_JOB_ATIVO)).first()
+    if job:
+        return job, False
+    job = RpaJob(agenda_id=agenda.id, modo=modo, status='pendente')
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro pedido enfileirou a mesma agenda entre a consulta e o INSERT (uq_rpa_job_agenda_ativa)
+        db.session.rollback()
+        return RpaJob.query.filter(RpaJob.agenda_id == agenda.id, RpaJob.status.in_(STATUS_JOB_ATIVO)).one(), False
+    return job, True
+
+def reservar_agenda(agenda_id, status='processando'):
+    """
+    Passa a agenda de um STATUS_AGENDA_EXECUTAVEL para `status` em um único UPDATE
+    condicional: entre execuções concorrentes da mesma agenda, só uma reserva. Retorna True
+    se reservou (o commit fica com o chamador).
+    """
+    stmt = (
+        db.update(Agenda)
+        .where(Agenda.id == agenda_id, Agenda.status.in_(STATUS_AGENDA_EXECUTAVEL))
+        .values(status=status, versao=agenda_versao_seq.next_value(), updated_at=func.clock_timestamp())
+        .returning(Agenda.id)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(stmt).scalar() is None:
+        return False
+    notificar_agendas(db.session, alterados=[agenda_id])
+    return True
+
+def reivindicar_jobs(worker, limite=1):
+    """
+    Reserva até `limite` jobs pendentes para o worker. Usa SELECT ... FOR UPDATE SKIP LOCKED
+    para que vários workers possam drenar a fila em paralelo sem pegar o mesmo job.
+    Agendas com maior prioridade saem antes; depois, por ordem de chegada e, entre jobs
+    criados juntos (ex.: aprovações lidas na mesma rodada), por data_agendamento.
+    Protocolos que já têm um job em execução ficam para depois (um formulário por protocolo).
+    """
+    job_ativo, agenda_ativa = db.aliased(RpaJob), db.aliased(Agenda)
+    protocolo_em_execucao = db.select(job_ativo.id)\
+        .join(agenda_ativa, job_ativo.agenda_id == agenda_ativa.id)\
+        .where(job_ativo.status == 'executando', agenda_ativa.fertipar_protocolo == Agenda.fertipar_protocolo)\
+        .exists()
+    candidatos = RpaJob.query.join(Agenda, RpaJob.agenda_id == Agenda.id)\
+        .filter(RpaJob.status == 'pendente', ~protocolo_em_execucao)\
+        .order_by(Agenda.prioridade.desc(), RpaJob.criado_em, Agenda.data_agendamento, RpaJob.id)\
+        .with_for_update(of=RpaJob, skip_locked=True)\
+        .limit(limite).add_columns(Agenda.fertipar_protocolo).all()
+    jobs, protocolos = [], set()
+    for job, protocolo in candidatos:
+        if protocolo not in protocolos:
+            protocolos.add(protocolo)
+            jobs.append(job)
+    agora = datetime.now(timezone.utc)
+    for job in jobs:
+        job.status = 'executando'
+        job.worker = worker
+        job.tentativas += 1
+        job.iniciado_em = agora
+    db.session.commit()
+    return [job.id for job in jobs]
+
+def recuperar_jobs_orfaos(timeout_minutos=15, max_tentativas=3):
+    """Devolve à fila jobs 'executando' cujo worker morreu no meio da execução."""
+    limite = datetime.now(timezone.utc) - timedelta(minutes=timeout_minutos)
+    jobs = RpaJob.query.filter(RpaJob.status == 'executando', RpaJob.iniciado_em < limite)\
+        .with_for_update(skip_locked=True).all()
+    for job in jobs:
+        job.status = 'pendente' if job.tentativas < max_tentativas else 'erro'
+        # A agenda ficou reservada ('processando') pelo worker morto: libera para a nova reserva
+        if job.agenda and job.agenda.status.startswith('processando'):
+            job.agenda.status = 'espera' if job.status == 'pendente' else 'erro'
+    db.session.commit()
+    return len(jobs)
+
+# --- Filtros por Período ---
+# Ano/mês viram intervalos semiabertos [início, fim) sobre data_agendamento, que usam o
+# índice da coluna (extract(year/month) obrigaria uma varredura completa da tabela).
+def intervalo_mes(ano, mes):
+    """[início, fim) do mês. Levanta ValueError para mês fora de 1..12 ou ano inválido."""
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mês inválido: {mes}. Use um valor de 1 a 12.")
+    inicio = datetime(ano, mes, 1)
+    fim = datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+    return inicio, fim
+
+def intervalo_ano(ano):
+    return datetime(ano, 1, 1), datetime(ano + 1, 1, 1)
+
+def filtro_periodo(coluna, inicio, fim):
+    return db.and_(coluna >= inicio, coluna < fim)
+
+
+# --- Rollup Mensal de Agendas ---
+CAMPOS_ROLLUP = ('data_agendamento', 'fertipar_destino', 'fertipar_embalagem', 'motorista_id', 'carga_solicitada')
+
+def _acumular_rollup(deltas, valores, sinal):
+    """Soma (sinal=+1) ou subtrai (sinal=-1) uma agenda dos deltas por chave do rollup."""
+    if valores['data_agendamento'] is None or valores['motorista_id'] is None:
+        return
+    data = valores['data_agendamento']
+    chave = (date(data.year, data.month, 1), valores['fertipar_destino'] or '',
+             valores['fertipar_embalagem'] or '', valores['motorista_id'])
+    delta = deltas.setdefault(chave, [0, Decimal(0)])
+    delta[0] += sinal
+    delta[1] += sinal * Decimal(str(valores['carga_solicitada'] or 0))
+
+def aplicar_deltas_rollup(session, deltas):
+    """
+    Aplica os deltas no rollup com INSERT ... ON CONFLICT DO UPDATE somando aos totais.
+    As chaves são aplicadas em ordem para que transações concorrentes travem as linhas
+    na mesma sequência (sem deadlock).
+    """
+    linhas = [
+        {'mes': mes, 'destino': destino, 'embalagem': embalagem, 'motorista_id': motorista_id,
+         'total_agendamentos': total, 'total_carga': carga}
+        for (mes, destino, embalagem, motorista_id), (total, carga) in sorted(deltas.items())
+        if total or carga
+    ]
+    if not linhas:
+        return
+    tabela = AgendaRollupMensal.__table__
+    stmt = pg_insert(tabela)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[tabela.c.mes, tabela.c.destino, tabela.c.embalagem, tabela.c.motorista_id],
+        set_={
+            'total_agendamentos': tabela.c.total_agendamentos + stmt.excluded.total_agendamentos,
+            'total_carga': tabela.c.total_carga + stmt.excluded.total_carga,
+        },
+    )
+    conexao = session.connection()
+    conexao.execute(stmt, linhas)
+    session.info.setdefault('rollup_meses', set()).update(linha['mes'] for linha in linhas)
+    notificar_caches(session, meses={linha['mes'] for linha in linhas})
+    # Linhas zeradas são removidas (a FK para motorista impediria excluir o motorista)
+    chaves = [chave for chave, (total, _) in deltas.items() if total < 0]
+    if chaves:
+        colunas = (tabela.c.mes, tabela.c.destino, tabela.c.embalagem, tabela.c.motorista_id)
+        conexao.execute(tabela.delete().where(tuple_(*colunas).in_(chaves), tabela.c.total_agendamentos <= 0))
+
+def remover_do_rollup(session, consulta):
+    """Desconta do rollup as agendas da consulta; usar antes de um delete em massa (que não passa pelo flush)."""
+    deltas = {}
+    for linha in consulta.with_entities(*(getattr(Agenda, campo) for campo in CAMPOS_ROLLUP)):
+        _acumular_rollup(deltas, linha._mapping, -1)
+    aplicar_deltas_rollup(session, deltas)
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_rollup_apos_flush(session, flush_context):
+    # Em after_flush o histórico dos atributos ainda guarda os valores anteriores ao flush
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Agenda):
+            _acumular_rollup(deltas, {campo: getattr(obj, campo) for campo in CAMPOS_ROLLUP}, 1)
+    for obj in session.dirty | session.deleted:
+        if not isinstance(obj, Agenda):
+            continue
+        estado = db.inspect(obj)
+        historicos = {campo: estado.attrs[campo].history for campo in CAMPOS_ROLLUP}
+        removida = obj in session.deleted
+        if not removida and not any(h.has_changes() for h in historicos.values()):
+            continue
+        anteriores = {campo: (h.deleted or h.unchanged or [None])[0] for campo, h in historicos.items()}
+        _acumular_rollup(deltas, anteriores, -1)
+        if not removida:
+            _acumular_rollup(deltas, {campo: getattr(obj, campo) for campo in CAMPOS_ROLLUP}, 1)
+    aplicar_deltas_rollup(session, deltas)
+
+
+# Agregados de meses fechados (dashboard e resumo anual). As entradas dos meses
+# alterados são descartadas só depois do commit, para que uma leitura concorrente
+# não volte a guardar os totais antigos (nos outros processos, via canal_caches).
+cache_periodos = CachePeriodos()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_periodos_apos_commit(session):
+    cache_periodos.invalidar_meses(session.info.pop('rollup_meses', ()))
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_periodos_apos_rollback(session):
+    session.info.pop('rollup_meses', None)
+
+
+# --- Dashboard Metrics ---
+def _agregados_rollup(inicio=None, fim=None):
+    """Totais do rollup em [inicio, fim) por mês, por motorista e por destino."""
+    rollup = AgendaRollupMensal
+    consulta = db.session.query(rollup.mes, rollup.destino, rollup.motorista_id, func.sum(rollup.total_agendamentos))
+    if inicio is not None:
+        consulta = consulta.filter(rollup.mes >= inicio)
+    if fim is not None:
+        consulta = consulta.filter(rollup.mes < fim)
+    por_mes, motoristas, destinos = Counter(), Counter(), Counter()
+    for mes, destino, motorista_id, total in consulta.group_by(rollup.mes, rollup.destino, rollup.motorista_id):
+        por_mes[mes] += total
+        motoristas[motorista_id] += total
+        if destino:
+            destinos[destino] += total
+    return {'por_mes': por_mes, 'motoristas': motoristas, 'destinos': destinos}
+
+def calcular_metricas_dashboard(hoje=None):
+    """
+    Reúne os indicadores do dashboard a partir do rollup mensal (AgendaRollupMensal).
+    Os agregados dos meses anteriores ao atual ficam em cache_periodos até que uma
+    agenda desses meses mude; a cada chamada só o mês corrente é consultado.
+    """
+    hoje = hoje or datetime.now(timezone.utc).replace(tzinfo=None)
+    mes_atual = date(hoje.year, hoje.month, 1)
+    mes_anterior = (mes_atual - timedelta(days=1)).replace(day=1)
+
+    historico = cache_periodos.obter('dashboard', None, mes_atual, lambda: _agregados_rollup(fim=mes_atual))
+    atual = _agregados_rollup(inicio=mes_atual)
+    por_mes = historico['por_mes'] + atual['por_mes']
+    motoristas = historico['motoristas'] + atual['motoristas']
+    destinos = historico['destinos'] + atual['destinos']
+
+    cadastros = db.session.query(
+        db.select(func.count(Motorista.id)).scalar_subquery().label('total_motoristas'),
+        db.select(func.count(Caminhao.id)).scalar_subquery().label('total_caminhoes'),
+    ).one()
+
+    # Início dos 12 meses do gráfico (o mês atual é o último)
+    inicio_serie = mes_atual
+    for _ in range(11):
+        inicio_serie = (inicio_serie - timedelta(days=1)).replace(day=1)
+
+    agendamentos_12m_labels, agendamentos_12m_data = [], []
+    inicio = inicio_serie
+    while inicio <= mes_atual:
+        agendamentos_12m_labels.append(inicio.strftime('%m/%Y'))
+        agendamentos_12m_data.append(por_mes.get(inicio, 0))
+        inicio = (inicio + timedelta(days=32)).replace(day=1)
+
+    # Top 5 Motoristas
+    mais_frequentes = motoristas.most_common(5)
+    nomes = dict(
+        db.session.query(Motorista.id, Motorista.nome)
+        .filter(Motorista.id.in_([motorista_id for motorista_id, _ in mais_frequentes]))
+    ) if mais_frequentes else {}
+    top_motoristas = [
+        {'nome': nomes.get(motorista_id), 'total_agendamentos': total}
+        for motorista_id, total in mais_frequentes
+    ]
+
+    # Top 5 Destinos
+    top_destinos = [
+        {'fertipar_destino': destino, 'total_agendamentos': total}
+        for destino, total in destinos.most_common(5)
+    ]
+
+    agendamentos_mes_atual = por_mes.get(mes_atual, 0)
+    agendamentos_mes_anterior = por_mes.get(mes_anterior, 0)
+
+    # Trend calculation
+    tendencia_agendamentos = 0
+    if agendamentos_mes_anterior > 0:
+        tendencia_agendamentos = ((agendamentos_mes_atual - agendamentos_mes_anterior) / agendamentos_mes_anterior) * 100
+    elif agendamentos_mes_atual > 0:
+        tendencia_agendamentos = 100
+
+    # Anos para o resumo: apenas os que têm agendas, do mais recente ao mais antigo
+    available_years = sorted({mes.year for mes, total in por_mes.items() if total > 0}, reverse=True)
+
+    return {
+        'total_motoristas': cadastros.total_motoristas,
+        'total_caminhoes': cadastros.total_caminhoes,
+        'total_agendamentos': sum(por_mes.values()),
+        'agendamentos_mes_atual': agendamentos_mes_atual,
+        'agendamentos_mes_anterior': agendamentos_mes_anterior,
+        'tendencia_agendamentos': tendencia_agendamentos,
+        'top_motoristas': top_motoristas,
+        'top_destinos': top_destinos,
+        'agendamentos_12m_labels': agendamentos_12m_labels,
+        'agendamentos_12m_data': agendamentos_12m_data,
+        'available_years': available_years,
+    }
+
+
+# --- Eventos de Agenda (LISTEN/NOTIFY) ---
+CANAL_AGENDAS = 'agenda_alterada'
+
+def notificar_agendas(session, alterados=(), removidos=()):
+    """
+    Emite um NOTIFY por agenda alterada/removida na transação corrente da sessão.
+    O Postgres só entrega as notificações se a transação for confirmada.
+    """
+    payloads = [{'id': agenda_id, 'op': 'upsert'} for agenda_id in alterados]
+    payloads += [{'id': agenda_id, 'op': 'delete'} for agenda_id in removidos]
+    if not payloads or session.get_bind().dialect.name != 'postgresql':
+        return
+    conexao = session.connection()
+    for payload in payloads:
+        conexao.execute(text("SELECT pg_notify(:canal, :payload)"), {'canal': CANAL_AGENDAS, 'payload': json.dumps(payload)})
+
+def registrar_remocao_agendas(session, ids):
+    """Grava o registro de remoção (AgendaRemovida) das agendas excluídas na transação corrente."""
+    if ids:
+        session.connection().execute(AgendaRemovida.__table__.insert(), [{'agenda_id': agenda_id} for agenda_id in ids])
+
+@event.listens_for(Session, 'after_flush')
+def _notificar_agendas_apos_flush(session, flush_context):
+    alterados = {obj.id for obj in session.new | session.dirty if isinstance(obj, Agenda) and obj.id is not None}
+    removidos = {obj.id for obj in session.deleted if isinstance(obj, Agenda)}
+    registrar_remocao_agendas(session, removidos)
+    notificar_agendas(session, alterados - removidos, removidos)
+
+# Campos de Motorista/Caminhao que aparecem na agenda serializada (serializar_agenda): alterá-los
+# muda a agenda para o feed, o SSE e o ETag das listas, então as agendas ligadas ganham nova versão.
+CAMPOS_MOTORISTA_AGENDA = ('nome', 'cpf', 'telefone')
+CAMPOS_CAMINHAO_AGENDA = ('placa', 'uf', 'tipo_carroceria', 'placa_reboque1', 'uf1',
+                          'placa_reboque2', 'uf2', 'placa_reboque3', 'uf3')
+
+def _campos_alterados(obj, campos):
+    estado = db.inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in campos)
+
+@event.listens_for(Session, 'after_flush')
+def _versionar_agendas_de_cadastros_alterados(session, flush_context):
+    motoristas = {obj.id for obj in session.dirty
+                  if isinstance(obj, Motorista) and _campos_alterados(obj, CAMPOS_MOTORISTA_AGENDA)}
+    caminhoes = {obj.id for obj in session.dirty
+                 if isinstance(obj, Caminhao) and _campos_alterados(obj, CAMPOS_CAMINHAO_AGENDA)}
+    if not motoristas and not caminhoes:
+        return
+    stmt = (
+        db.update(Agenda)
+        .where(db.or_(Agenda.motorista_id.in_(motoristas), Agenda.caminhao_id.in_(caminhoes)))
+        # O UPDATE em massa não passa pelo flush: versão e updated_at são definidos aqui
+        .values(versao=agenda_versao_seq.next_value(), updated_at=func.clock_timestamp())
+        .returning(Agenda.id)
+    )
+    ids = [agenda_id for (agenda_id,) in session.connection().execute(stmt)]
+    notificar_agendas(session, alterados=ids)
+
+def _carregar_eventos_agenda(payloads):
+    """Transforma as notificações recebidas em eventos com a agenda já serializada (uma consulta por lote)."""
+    ultimos = {}
+    for payload in payloads:
+        ultimos.pop(payload.get('id'), None)
+        ultimos[payload.get('id')] = payload.get('op')  # Mantém só a última operação de cada agenda
+    ids = [agenda_id for agenda_id, op in ultimos.items() if op == 'upsert']
+    with app.app_context():
+        agendas = {}
+        if ids:
+            agendas = {agenda['id']: agenda for agenda in listar_agendas_dict(Agenda.query.filter(Agenda.id.in_(ids)))}
+    eventos = []
+    for agenda_id, op in ultimos.items():
+        if op == 'delete' or agenda_id not in agendas:
+            eventos.append({'op': 'delete', 'id': agenda_id})
+        else:
+            eventos.append({'op': 'upsert', 'agenda': agendas[agenda_id]})
+    return eventos
+
+canal_agendas = CanalEventos(CANAL_AGENDAS, app.config['SQLALCHEMY_DATABASE_URI'], _carregar_eventos_agenda)
+
+
+# --- Invalidação de Caches entre Processos ---
+# cache_usuarios e cache_periodos vivem em cada processo. Além da invalidação local após o
+# commit, cada transação que os afeta emite um NOTIFY, e todo processo web descarta as mesmas
+# entradas ao recebê-lo (commits de outros processos do servidor e do rpa_worker chegam aqui).
+CANAL_CACHES = 'cache_invalidado'
+
+def notificar_caches(session, usuarios=(), meses=()):
+    """Emite um NOTIFY com os usuários e meses (1º dia) a invalidar; entregue só se a transação for confirmada."""
+    payload = {}
+    if usuarios:
+        payload['usuarios'] = sorted(usuarios)
+    if meses:
+        payload['meses'] = sorted(mes.isoformat() for mes in meses)
+    if not payload or session.get_bind().dialect.name != 'postgresql':
+        return
+    session.connection().execute(text("SELECT pg_notify(:canal, :payload)"), {'canal': CANAL_CACHES, 'payload': json.dumps(payload)})
+
+def _aplicar_invalidacoes_caches(payloads):
+    for payload in payloads:
+        for user_id in payload.get('usuarios', ()):
+            cache_usuarios.invalidar(user_id)
+        cache_periodos.invalidar_meses(date.fromisoformat(mes) for mes in payload.get('meses', ()))
+    return []  # Nada a repassar: a invalidação já foi feita
+
+canal_caches = CanalEventos(CANAL_CACHES, app.config['SQLALCHEMY_DATABASE_URI'], _aplicar_invalidacoes_caches)
+_escuta_caches = None
+_lock_escuta_caches = threading.Lock()
+
+def _escutar_invalidacoes_caches():
+    while True:
+        fila = canal_caches.assinar()
+        # A fila só recebe a ressincronização (após reconectar ao Postgres) ou None (assinante descartado)
+        while fila.get() is not None:
+            # Invalidações emitidas enquanto a escuta esteve fora se perderam: descarta tudo
+            cache_usuarios.invalidar()
+            cache_periodos.limpar()
+        cache_usuarios.invalidar()
+        cache_periodos.limpar()
+
+@app.before_request
+def _iniciar_escuta_caches():
+    global _escuta_caches
+    if _escuta_caches is not None:
+        return
+    with _lock_escuta_caches:
+        if _escuta_caches is None:
+            _escuta_caches = threading.Thread(target=_escutar_invalidacoes_caches, name="escuta-caches", daemon=True)
+            _escuta_caches.start()
+
+
 # --- Routes ---
 @app.route('/teste')
 def teste():
@@ -284,7 +1071,7 @@ def index():
 def login():
     if 'user_id' in session:
         try:
-            user = db.session.get(Usuario, session.get('user_id'))
+            user = usuario_da_sessao(session.get('user_id'))
             if user:
                 return redirect(url_for('dashboard'))
             else:
@@ -326,144 +1113,69 @@ def login():
 @login_required
 def dashboard():
     user = g.user
-
-    # Basic KPIs
-    total_motoristas = db.session.query(func.count(Motorista.id)).scalar()
-    total_caminhoes = db.session.query(func.count(Caminhao.id)).scalar()
-    total_agendamentos = db.session.query(func.count(Agenda.id)).scalar()
-
-    # Monthly KPIs
-    today = datetime.now(timezone.utc)
-    # Current month
-    first_day_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    # To get next month, add 32 days to current date and then replace day with 1.
-    next_month_estimate = first_day_current_month + timedelta(days=32)
-    first_day_next_month = next_month_estimate.replace(day=1)
-    
-    agendamentos_mes_atual = db.session.query(func.count(Agenda.id)).filter(
-        Agenda.data_agendamento >= first_day_current_month,
-        Agenda.data_agendamento < first_day_next_month
-    ).scalar()
-
-    # Previous month
-    first_day_previous_month = (first_day_current_month - timedelta(days=1)).replace(day=1)
-    
-    agendamentos_mes_anterior = db.session.query(func.count(Agenda.id)).filter(
-        Agenda.data_agendamento >= first_day_previous_month,
-        Agenda.data_agendamento < first_day_current_month
-    ).scalar()
-
-    # Trend calculation
-    tendencia_agendamentos = 0
-    if agendamentos_mes_anterior > 0:
-        tendencia_agendamentos = ((agendamentos_mes_atual - agendamentos_mes_anterior) / agendamentos_mes_anterior) * 100
-    elif agendamentos_mes_atual > 0:
-        tendencia_agendamentos = 100
-
-    # Top 5 Motoristas
-    top_motoristas = db.session.query(
-        Motorista.nome,
-        func.count(Agenda.id).label('total_agendamentos')
-    ).join(Agenda, Agenda.motorista_id == Motorista.id)\
-     .group_by(Motorista.id)\
-     .order_by(func.count(Agenda.id).desc())\
-     .limit(5).all()
-
-    # Top 5 Destinos
-    top_destinos = db.session.query(
-        Agenda.fertipar_destino,
-        func.count(Agenda.id).label('total_agendamentos')
-    ).filter(Agenda.fertipar_destino.isnot(None))\
-     .group_by(Agenda.fertipar_destino)\
-     .order_by(func.count(Agenda.id).desc())\
-     .limit(5).all()
-
-    # Last 12 months chart data
-    agendamentos_12m_labels = []
-    agendamentos_12m_data = []
-    current_month_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    for i in range(12):
-        # Calculate the start and end for the month in the iteration
-        temp_date = today
-        for _ in range(i):
-            temp_date = (temp_date.replace(day=1) - timedelta(days=1))
-        start_of_month = temp_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-
-        next_month_estimate = start_of_month + timedelta(days=32)
-        end_of_month = next_month_estimate.replace(day=1)
-
-        count = db.session.query(func.count(Agenda.id)).filter(
-            Agenda.data_agendamento >= start_of_month,
-            Agenda.data_agendamento < end_of_month
-        ).scalar()
-        
-        agendamentos_12m_labels.insert(0, start_of_month.strftime('%m/%Y'))
-        agendamentos_12m_data.insert(0, count)
-
-    # Get distinct years for the new summary dropdown
-    years_query = db.session.query(extract('year', Agenda.data_agendamento)).distinct().order_by(extract('year', Agenda.data_agendamento).desc())
-    available_years = [y[0] for y in years_query.all() if y[0] is not None]
-
-
-    return render_template(
-        'dashboard_decisao.html',
-        user=user,
-        total_motoristas=total_motoristas,
-        total_caminhoes=total_caminhoes,
-        total_agendamentos=total_agendamentos,
-        agendamentos_mes_atual=agendamentos_mes_atual,
-        agendamentos_mes_anterior=agendamentos_mes_anterior,
-        tendencia_agendamentos=tendencia_agendamentos,
-        top_motoristas=top_motoristas,
-        top_destinos=top_destinos,
-        agendamentos_12m_labels=agendamentos_12m_labels,
-        agendamentos_12m_data=agendamentos_12m_data,
-        available_years=available_years
-    )
+    metricas = calcular_metricas_dashboard()
+
+    return render_template('dashboard_decisao.html', user=user, **metricas)
+
+def _resumo_rollup(inicio, fim):
+    rollup = AgendaRollupMensal
+    summary_query = db.session.query(
+        extract('month', rollup.mes).label('mes'),
+        rollup.destino.label('cidade'),
+        rollup.embalagem.label('embalagem'),
+        func.sum(rollup.total_carga).label('total_carga_solicitada'),
+        func.sum(rollup.total_agendamentos).label('total_agendamentos')
+    ).filter(filtro_periodo(rollup.mes, inicio, fim))\
+     .group_by('mes', 'cidade', 'embalagem')\
+     .order_by('mes', 'cidade', 'embalagem')\
+     .all()
+
+    return [
+        {
+            "mes": int(row.mes),
+            "cidade": row.cidade or None,
+            "embalagem": row.embalagem or None,
+            "total_carga_solicitada": float(row.total_carga_solicitada) if row.total_carga_solicitada else 0,
+            "total_agendamentos": int(row.total_agendamentos)
+        } for row in summary_query
+    ]
 
 @app.route('/api/resumo_agendamento/<int:year>')
 @login_required
 def resumo_agendamento(year):
     """
     Provides a summary of schedules for a given year, grouped by month,
-    destination city, and packaging.
+    destination city, and packaging (read from agenda_rollup_mensal).
+    Closed months come from cache_periodos; only the current month is queried.
     """
     try:
-        summary_query = db.session.query(
-            extract('month', Agenda.data_agendamento).label('mes'),
-            Agenda.fertipar_destino.label('cidade'),
-            Agenda.fertipar_embalagem.label('embalagem'),
-            func.sum(Agenda.carga_solicitada).label('total_carga_solicitada'),
-            func.count(Agenda.id).label('total_agendamentos')
-        ).filter(extract('year', Agenda.data_agendamento) == year)\
-         .group_by('mes', 'cidade', 'embalagem')\
-         .order_by('mes', 'cidade', 'embalagem')\
-         .all()
-
-        summary_list = [
-            {
-                "mes": row.mes,
-                "cidade": row.cidade,
-                "embalagem": row.embalagem,
-                "total_carga_solicitada": float(row.total_carga_solicitada) if row.total_carga_solicitada else 0,
-                "total_agendamentos": row.total_agendamentos
-            } for row in summary_query
-        ]
+        inicio_ano, fim_ano = (d.date() for d in intervalo_ano(year))
+        hoje = datetime.now(timezone.utc)
+        corte = min(max(date(hoje.year, hoje.month, 1), inicio_ano), fim_ano)
+
+        summary_list = cache_periodos.obter(('resumo', year), inicio_ano, corte, lambda: _resumo_rollup(inicio_ano, corte))
+        if corte < fim_ano:
+            summary_list = summary_list + _resumo_rollup(corte, fim_ano)
         
         return jsonify(success=True, data=summary_list)
 
     except OperationalError as e:
-        # This might happen if the migration for 'fertipar_embalagem' hasn't been run
+        # This might happen if the migration for 'agenda_rollup_mensal' hasn't been run
         db.session.rollback()
         print(f"ERROR in resumo_agendamento: {e}")
-        return jsonify(success=False, message="Erro de banco de dados. A coluna 'fertipar_embalagem' pode não existir. Execute as migrações."), 500
+        return jsonify(success=False, message="Erro de banco de dados. A tabela 'agenda_rollup_mensal' pode não existir. Execute as migrações."), 500
     except Exception as e:
         db.session.rollback()
         print(f"ERROR in resumo_agendamento: {e}")
         return jsonify(success=False, message="Ocorreu um erro ao gerar o resumo."), 500
 
+
+@app.route('/api/cache/periodos', methods=['GET'])
+@admin_required
+def estatisticas_cache_periodos():
+    """Acertos/falhas/invalidações do cache de períodos fechados (dashboard e resumo)."""
+    return jsonify(success=True, data=cache_periodos.estatisticas())
+
     
 @app.route('/cadastros', methods=['GET'])
 @login_required
@@ -498,6 +1210,10 @@ def get_agendas_executadas():
 
         if not ano or not mes:
             return jsonify(success=False, message="Parâmetros 'ano' e 'mes' são obrigatórios."), 400
+        try:
+            periodo = intervalo_mes(ano, mes)
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
 
         # Query agendas, joining with Motorista and Caminhao to get related data
         agendas = db.session.query(
@@ -505,8 +1221,7 @@ def get_agendas_executadas():
         ).join(Motorista, Agenda.motorista_id == Motorista.id
         ).join(Caminhao, Agenda.caminhao_id == Caminhao.id
         ).filter(
-            func.extract('year', Agenda.data_agendamento) == ano,
-            func.extract('month', Agenda.data_agendamento) == mes
+            filtro_periodo(Agenda.data_agendamento, *periodo)
         ).order_by(Agenda.data_agendamento.desc()).all()
 
         # Format data for JSON response
@@ -736,6 +1451,11 @@ def salvar_configuracao_robo():
         configuracao.head_evento = 'head_evento' in request.form
         configuracao.modo_execucao = 'agendado' if 'modo_execucao' in request.form else 'teste'
         configuracao.tempo_espera_segundos = int(request.form.get('tempo_espera_segundos', 30))
+        configuracao.max_execucoes_paralelas = max(1, int(request.form.get('max_execucoes_paralelas', 3)))
+        configuracao.cache_cotacoes_segundos = max(0, int(request.form.get('cache_cotacoes_segundos', 60)))
+        configuracao.perfil_espera = 'seguro' if request.form.get('perfil_espera') == 'seguro' else 'rapido'
+        configuracao.perfil_navegador = 'enxuto' if request.form.get('perfil_navegador') == 'enxuto' else 'completo'
+        cache_cotacoes.invalidar()
 
         db.session.add(configuracao)
         db.session.commit()
@@ -773,8 +1493,116 @@ def logout():
 @app.route('/api/agendas_processar') # Renamed from agendas_em_espera
 @login_required
 def agendas_processar():
-    agendas = Agenda.query.filter_by(status='espera').order_by(Agenda.data_agendamento.desc()).all()
-    return jsonify([agenda.to_dict() for agenda in agendas])
+    consulta = Agenda.query.filter_by(status='espera').order_by(Agenda.data_agendamento.desc())
+    return jsonify(listar_agendas_dict(consulta))
+
+# Grade de agendas: filtros por coluna (parâmetro -> coluna, busca parcial sem diferenciar
+# maiúsculas) e ordenações aceitas (parâmetro -> coluna, chave no dicionário da linha).
+FILTROS_AGENDA = {
+    'status': Agenda.status,
+    'motorista': Motorista.nome,
+    'placa': Caminhao.placa,
+    'protocolo': Agenda.fertipar_protocolo,
+    'pedido': Agenda.fertipar_pedido,
+    'destino': Agenda.fertipar_destino,
+}
+ORDENACOES_AGENDA = {
+    'data': (Agenda.data_agendamento, 'data_agendamento'),
+    'motorista': (Motorista.nome, 'motorista_nome'),
+    'protocolo': (Agenda.fertipar_protocolo, 'fertipar_protocolo'),
+    'status': (Agenda.status, 'status'),
+}
+ORDENACAO_PADRAO_AGENDA = '-data'
+MAX_PAGE_SIZE_AGENDAS = 200
+
+def filtrar_agendas(consulta, args):
+    """Une motorista/caminhão à consulta e aplica os filtros de coluna presentes em `args`."""
+    consulta = consulta.join(Agenda.motorista).join(Agenda.caminhao)
+    for parametro, coluna in FILTROS_AGENDA.items():
+        valor = (args.get(parametro) or '').strip()
+        if valor:
+            consulta = consulta.filter(coluna.icontains(valor, autoescape=True))
+    return consulta
+
+def _codificar_cursor(ordenacao, valor, agenda_id):
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    bruto = json.dumps([ordenacao, valor, agenda_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+def _decodificar_cursor(cursor, ordenacao):
+    try:
+        ordenacao_cursor, valor, agenda_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if ordenacao_cursor != ordenacao:
+            raise ValueError("cursor de outra ordenação")
+        if ordenacao.lstrip('-') == 'data':
+            valor = datetime.fromisoformat(valor)
+        return valor, int(agenda_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+
+def pagina_agendas(consulta_filtrada, args):
+    """
+    Uma página da consulta (já passada por filtrar_agendas) com paginação por chave:
+    em vez de OFFSET, a próxima página começa depois da (valor de ordenação, id) da
+    última linha, então o custo não cresce com o número da página.
+    Parâmetros: page_size, sort (campo de ORDENACOES_AGENDA, '-' para decrescente) e
+    cursor (next_cursor da página anterior). Levanta ValueError para parâmetros inválidos.
+    """
+    page_size = args.get('page_size', type=int)
+    if not page_size or not 1 <= page_size <= MAX_PAGE_SIZE_AGENDAS:
+        raise ValueError(f"page_size deve estar entre 1 e {MAX_PAGE_SIZE_AGENDAS}.")
+    ordenacao = args.get('sort') or ORDENACAO_PADRAO_AGENDA
+    if ordenacao.lstrip('-') not in ORDENACOES_AGENDA:
+        raise ValueError(f"sort inválido: {ordenacao}")
+    coluna, chave = ORDENACOES_AGENDA[ordenacao.lstrip('-')]
+    decrescente = ordenacao.startswith('-')
+
+    consulta = consulta_filtrada
+    if args.get('cursor'):
+        valor, agenda_id = _decodificar_cursor(args['cursor'], ordenacao)
+        posicao = tuple_(coluna, Agenda.id)
+        consulta = consulta.filter(posicao < (valor, agenda_id) if decrescente else posicao > (valor, agenda_id))
+    if decrescente:
+        consulta = consulta.order_by(coluna.desc(), Agenda.id.desc())
+    else:
+        consulta = consulta.order_by(coluna.asc(), Agenda.id.asc())
+
+    linhas = consulta.with_entities(*COLUNAS_AGENDA_DICT).limit(page_size + 1).all()
+    has_more = len(linhas) > page_size
+    linhas = linhas[:page_size]
+    ultima = linhas[-1]._mapping if linhas else None
+    return {
+        'agendas': [serializar_agenda(linha._mapping) for linha in linhas],
+        'next_cursor': _codificar_cursor(ordenacao, ultima[chave], ultima['id']) if has_more else None,
+        'has_more': has_more,
+    }
+
+def _lista_agendas_condicional(consulta):
+    """
+    Responde a lista de agendas da consulta com ETag (quantidade + maior versão do conjunto;
+    alterações no motorista/caminhão também dão nova versão às agendas ligadas).
+    Se o cliente já tem essa versão (If-None-Match), devolve 304 sem serializar nada.
+    Com `page_size`, aplica os filtros de coluna e responde uma página (ver pagina_agendas);
+    o ETag é o do conjunto filtrado, válido para qualquer página dele.
+    """
+    paginado = 'page_size' in request.args
+    if paginado:
+        consulta = filtrar_agendas(consulta, request.args)
+    quantidade, maior_versao = consulta.with_entities(func.count(Agenda.id), func.max(Agenda.versao)).one()
+    etag = f"agendas-{quantidade}-{maior_versao or 0}"
+    if etag in request.if_none_match:
+        resposta = Response(status=304)
+    elif paginado:
+        try:
+            resposta = jsonify(total=quantidade, **pagina_agendas(consulta, request.args))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    else:
+        resposta = jsonify(listar_agendas_dict(consulta.order_by(Agenda.data_agendamento.desc())))
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache' # O navegador sempre revalida com o ETag
+    return resposta
 
 @app.route('/api/agendas_agendadas') # New endpoint for agendado status
 @login_required
@@ -783,23 +1611,108 @@ def agendas_agendadas():
         year = request.args.get('year', default=datetime.now().year, type=int)
         month = request.args.get('month', default=datetime.now().month, type=int)
 
+        try:
+            periodo = intervalo_mes(year, month)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
         # Query agendas based on the provided year and month, for all statuses
-        agendas = Agenda.query.filter(
-            extract('year', Agenda.data_agendamento) == year,
-            extract('month', Agenda.data_agendamento) == month
-        ).order_by(Agenda.data_agendamento.desc()).all()
-        
-        return jsonify([agenda.to_dict(for_socket=True) for agenda in agendas])
+        consulta = Agenda.query.filter(filtro_periodo(Agenda.data_agendamento, *periodo))
+        return _lista_agendas_condicional(consulta)
     except Exception as e:
         print(f"Error in /api/agendas_agendadas: {e}")
         return jsonify(error=str(e)), 500
 
+# Alterações mais novas que isso ainda podem ter companheiras de versão menor não confirmadas
+# (a versão é tirada na escrita, não no commit); o cursor não avança sobre elas.
+JANELA_ESTABILIDADE_SEGUNDOS = 5
+LIMITE_ALTERACOES = 500
+
+@app.route('/api/agendas/changes')
+@login_required
+def agendas_changes():
+    """
+    Feed incremental: agendas alteradas e removidas depois do cursor `since`.
+    Resposta: {changes: [agenda], removed: [id], cursor, has_more}. Repetir a chamada com o
+    cursor devolvido; alterações recentes podem ser reenviadas (aplicar é idempotente).
+    Sem `since`, devolve apenas o cursor atual (para começar a acompanhar a partir de agora).
+    """
+    limite_estavel = db.session.execute(
+        text("SELECT clock_timestamp() - make_interval(secs => :s)"), {'s': JANELA_ESTABILIDADE_SEGUNDOS}
+    ).scalar()
+
+    if 'since' not in request.args:
+        cursor = max(
+            db.session.query(func.max(Agenda.versao)).filter(Agenda.updated_at <= limite_estavel).scalar() or 0,
+            db.session.query(func.max(AgendaRemovida.versao)).filter(AgendaRemovida.removida_em <= limite_estavel).scalar() or 0,
+        )
+        return jsonify(changes=[], removed=[], cursor=cursor, has_more=False)
+
+    since = request.args.get('since', default=0, type=int)
+    alteradas = (Agenda.query.options(joinedload(Agenda.motorista), joinedload(Agenda.caminhao))
+                 .filter(Agenda.versao > since).order_by(Agenda.versao).limit(LIMITE_ALTERACOES + 1).all())
+    removidas = (AgendaRemovida.query.filter(AgendaRemovida.versao > since)
+                 .order_by(AgendaRemovida.versao).limit(LIMITE_ALTERACOES + 1).all())
+
+    itens = sorted([(a.versao, a.updated_at, a) for a in alteradas] + [(r.versao, r.removida_em, r) for r in removidas],
+                   key=lambda item: item[0])
+    has_more = len(itens) > LIMITE_ALTERACOES
+    itens = itens[:LIMITE_ALTERACOES]
+
+    cursor = since
+    for versao, alterado_em, _ in itens:
+        if alterado_em > limite_estavel:
+            break
+        cursor = versao
+
+    return jsonify(
+        changes=[item.to_dict(for_socket=True) for _, _, item in itens if isinstance(item, Agenda)],
+        removed=[item.agenda_id for _, _, item in itens if isinstance(item, AgendaRemovida)],
+        cursor=cursor,
+        has_more=has_more,
+    )
+
+# Cada stream aberto prende uma thread do servidor (ASGI_THREADS no asgi.py) enquanto durar.
+# Acima do limite o stream responde 503 e a página passa a usar o polling de /api/agendas/changes.
+MAX_STREAMS_AGENDAS = int(os.getenv('MAX_STREAMS_AGENDAS', '16'))
+_vagas_streams_agendas = threading.BoundedSemaphore(MAX_STREAMS_AGENDAS)
+
+@app.route('/api/agendas/stream')
+@login_required
+def agendas_stream():
+    """Server-Sent Events com as agendas alteradas; substitui o polling da lista de agendas."""
+    if not _vagas_streams_agendas.acquire(blocking=False):
+        resposta = jsonify(error="Limite de conexões em tempo real atingido; use /api/agendas/changes.")
+        resposta.status_code = 503
+        resposta.headers['Retry-After'] = '60'
+        return resposta
+    fila = canal_agendas.assinar()
+
+    def gerar():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    evento = fila.get(timeout=15)
+                except queue.Empty:
+                    yield ': ping\n\n'  # Mantém a conexão viva e detecta clientes desconectados
+                    continue
+                if evento is None:
+                    return
+                yield f"event: agenda\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+        finally:
+            canal_agendas.cancelar(fila)
+
+    resposta = Response(gerar(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # call_on_close roda mesmo se o gerador nunca chegar a ser iniciado
+    resposta.call_on_close(_vagas_streams_agendas.release)
+    return resposta
+
 @app.route('/api/agendas/updates')
 @login_required
 def agendas_updates():
     # Este endpoint retorna agendas com status diferente de 'espera' para polling
-    agendas = Agenda.query.filter(Agenda.status != 'espera').order_by(Agenda.data_agendamento.desc()).all()
-    return jsonify([agenda.to_dict() for agenda in agendas])
+    return _lista_agendas_condicional(Agenda.query.filter(Agenda.status != 'espera'))
 
 @app.route('/agendar', methods=['POST'])
 @login_required
@@ -866,6 +1779,61 @@ def agendar():
         print(f"Erro ao criar agenda: {e}")
         return jsonify(success=False, message=f'Erro interno do servidor: {e}'), 500
 
+def _registrar_erro_raspagem(e):
+    """Grava o traceback da raspagem em scraping_error.log e retorna o caminho do arquivo."""
+    tb_str = traceback.format_exc()
+    error_log_message = f"--- ERRO EM {datetime.now()} ---\n"
+    error_log_message += f"Erro na rota /api/scrape_fertipar_data: {e}\n"
+    error_log_message += f"Traceback:\n{tb_str}\n"
+
+    # Use um caminho de arquivo temporário seguro se possível
+    log_file_path = os.path.join(os.path.dirname(__file__), 'scraping_error.log')
+    try:
+        with open(log_file_path, "a", encoding='utf-8') as f:
+            f.write(error_log_message)
+    except Exception as log_e:
+        print(f"Erro ao escrever no arquivo de log: {log_e}")
+    return log_file_path
+
+# Leituras da grade de cotações compartilhadas entre requisições (chave: filial + página)
+cache_cotacoes = CacheLeituras()
+
+# Event loop de longa duração que mantém o Playwright e os navegadores entre requisições
+rpa_runtime = RuntimeRPA()
+atexit.register(rpa_runtime.encerrar)
+
+def _iterar_raspagem(config_rpa):
+    """
+    Lê a grade pelo runtime do robô (driver e navegadores compartilhados), como um iterador comum.
+    Reaproveita a sessão salva em RpaSessao e grava de volta a nova sessão se houver login.
+    """
+    sessao = {}
+    try:
+        yield from rpa_runtime.raspar_cotacoes({**config_rpa, "storage_state": carregar_storage_state()}, sessao)
+    finally:
+        salvar_storage_state(sessao.get("new_storage_state"))
+
+def _linhas_cotacoes(config_rpa, forcar=False):
+    """Linhas da grade de cotações, servidas do cache enquanto estiverem dentro do TTL configurado."""
+    chave = (config_rpa.get('filial'), config_rpa.get('pagina_raspagem'))
+    ttl = config_rpa.get('cache_cotacoes_segundos') or 0
+    return cache_cotacoes.iterar(chave, ttl, lambda: _iterar_raspagem(config_rpa), forcar=forcar)
+
+def _stream_raspagem(config_rpa, forcar=False):
+    """Entrega cada linha da raspagem como uma linha NDJSON: {"type": "row"|"end"|"error", ...}."""
+    total = 0
+    try:
+        for row in _linhas_cotacoes(config_rpa, forcar):
+            total += 1
+            yield json.dumps({'type': 'row', 'data': row}, ensure_ascii=False) + '\n'
+        yield json.dumps({'type': 'end', 'total': total}) + '\n'
+    except ValueError as e:
+        yield json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False) + '\n'
+    except Exception as e:
+        log_file_path = _registrar_erro_raspagem(e)
+        print(f"Erro inesperado durante o scraping. Detalhes em {log_file_path}: {e}")
+        yield json.dumps({'type': 'error', 'message': 'Dados não coletados. O site pode estar bloqueado ou a estrutura mudou.'}, ensure_ascii=False) + '\n'
+
 @app.route('/api/scrape_fertipar_data')
 @login_required
 def scrape_data():
@@ -878,9 +1846,25 @@ def scrape_data():
     if not config.senha_site:
         return jsonify({'success': False, 'message': 'A senha para o site da Fertipar não está configurada.'}), 500
 
+    config_rpa = montar_config_rpa(config)
+    # ?perfil=enxuto|completo sobrepõe o perfil de navegador configurado só nesta leitura
+    if request.args.get('perfil') in ('enxuto', 'completo'):
+        config_rpa['perfil_navegador'] = request.args['perfil']
+    # ?force=1 ignora o cache e dispara uma nova leitura
+    forcar = request.args.get('force') == '1'
+
+    # ?stream=1: envia as linhas como NDJSON à medida que cada página da grade é lida
+    if request.args.get('stream') == '1':
+        return Response(stream_with_context(_stream_raspagem(config_rpa, forcar)), mimetype='application/x-ndjson')
+
     try:
-        # Executa a função de scraping assíncrona em um loop de eventos
-        data = asyncio.run(scrape_fertipar_data(config))
+        try:
+            data = list(_linhas_cotacoes(config_rpa, forcar))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Falha na raspagem: {e}")
+            data = None
         
         if data is None:
              return jsonify({'success': False, 'message': 'Dados não coletados. O site pode estar bloqueado ou a estrutura mudou.'})
@@ -892,19 +1876,8 @@ def scrape_data():
         return jsonify({'success': True, 'data': data})
     except Exception as e:
         # Log do erro detalhado em um arquivo para depuração
-        tb_str = traceback.format_exc()
-        error_log_message = f"--- ERRO EM {datetime.now()} ---\n"
-        error_log_message += f"Erro na rota /api/scrape_fertipar_data: {e}\n"
-        error_log_message += f"Traceback:\n{tb_str}\n"
-        
-        # Use um caminho de arquivo temporário seguro se possível
-        log_file_path = os.path.join(os.path.dirname(__file__), 'scraping_error.log')
-        try:
-            with open(log_file_path, "a", encoding='utf-8') as f:
-                f.write(error_log_message)
-        except Exception as log_e:
-            print(f"Erro ao escrever no arquivo de log: {log_e}")
-            
+        log_file_path = _registrar_erro_raspagem(e)
+
         # Resposta para o cliente
         print(f"Erro inesperado durante o scraping. Detalhes em {log_file_path}: {e}")
         return jsonify({
@@ -927,6 +1900,24 @@ def delete_agenda(agenda_id):
         db.session.rollback()
         return jsonify(success=False, message=f'Erro ao cancelar agenda: {e}'), 500
 
+@app.route('/api/agenda/<int:agenda_id>/prioridade', methods=['PUT'])
+@login_required
+def set_prioridade_agenda(agenda_id):
+    """Define a prioridade da agenda na fila do robô (maior sai antes; 0 = normal)."""
+    agenda = db.session.get(Agenda, agenda_id)
+    if not agenda:
+        return jsonify(success=False, message='Agenda não encontrada'), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        prioridade = int(data.get('prioridade', 0))
+    except (TypeError, ValueError):
+        return jsonify(success=False, message='Prioridade inválida.'), 400
+
+    agenda.prioridade = prioridade
+    db.session.commit()
+    return jsonify(success=True, prioridade=agenda.prioridade, message='Prioridade da agenda atualizada.')
+
 @app.route('/api/motoristas')
 @login_required
 def get_motoristas():
@@ -948,7 +1939,12 @@ def get_caminhoes():
 @dev_required
 def clear_agendas():
     try:
+        ids = [agenda_id for (agenda_id,) in db.session.query(Agenda.id).filter_by(status='espera')]
+        # O delete em massa não passa pelo flush: rollup, remoções e NOTIFY são tratados aqui
+        remover_do_rollup(db.session, db.session.query(Agenda).filter_by(status='espera'))
         num_deleted = db.session.query(Agenda).filter_by(status='espera').delete(synchronize_session=False)
+        registrar_remocao_agendas(db.session, ids)
+        notificar_agendas(db.session, removidos=ids)
         db.session.commit()
         return jsonify(success=True, message=f'{num_deleted} agendamentos em espera foram limpos.')
     except Exception as e:
@@ -956,290 +1952,82 @@ def clear_agendas():
         return jsonify(success=False, message=f'Erro ao limpar agendamentos: {e}'), 500
 
 
-@app.route('/api/agendas/execute/<int:agenda_id>', methods=['POST'])
-@dev_required
-def execute_agenda_task(agenda_id):
-    """
-    Executes the Playwright RPA task for a specific agenda item.
-    Handles loading and saving of the RPA session state.
-    """
-    print(f"--- Iniciando execute_agenda_task para agenda_id: {agenda_id} ---")
+def _enfileirar_execucao(agenda_id, modo):
+    """Valida a agenda e a coloca na fila do robô. Retorna a resposta HTTP (202 + job_id)."""
+    sufixo_log = ' (Dev Mode)' if modo == 'dev' else ''
     agenda = db.session.get(Agenda, agenda_id)
     if not agenda:
+        print(f"Agenda ID {agenda_id} não encontrada.")
         return jsonify(success=False, message="Agenda não encontrada."), 404
 
     config = db.session.query(ConfiguracaoRobo).first()
     if not config:
+        print("Configuracoes do Robo: Nenhuma")
         return jsonify(success=False, message="Configuração do robô não encontrada."), 500
 
     motorista = db.session.get(Motorista, agenda.motorista_id)
     caminhao = db.session.get(Caminhao, agenda.caminhao_id)
-
     if not motorista or not caminhao:
         return jsonify(success=False, message="Motorista ou Caminhão da agenda não encontrados."), 404
 
-    # --- LÓGICA DE SESSÃO: Carregar estado do banco de dados ---
-    print("--- Carregando estado de sessão do RPA do banco de dados... ---")
-    sessao_rpa = db.session.query(RpaSessao).first()
-    storage_state = sessao_rpa.storage_state if sessao_rpa else None
-    if storage_state:
-        print("Estado de sessão encontrado.")
-    else:
-        print("Nenhum estado de sessão encontrado. Será necessário um novo login.")
-
-
-    # --- Estruturar todos os dados em um único dicionário (JSON) ---
-    rpa_params = {
-        "config": {
-            "url_acesso": config.url_acesso,
-            "filial": config.filial,
-            "usuario_site": config.usuario_site,
-            "senha_site": config.senha_site, # senha_site é uma property que decodifica o valor
-            "email_retorno": config.email_retorno,
-            "pagina_raspagem": config.pagina_raspagem,
-            "contato": config.contato,
-            "telefone": config.telefone,
-            "head_evento": config.head_evento,
-            "tempo_espera_segundos": config.tempo_espera_segundos,
-            "modo_execucao": config.modo_execucao,
-        },
-        "agenda": {
-            "id": agenda.id,
-            "fertipar_protocolo": agenda.fertipar_protocolo,
-            "fertipar_pedido": agenda.fertipar_pedido,
-            "fertipar_destino": agenda.fertipar_destino,
-            "carga_solicitada": float(agenda.carga_solicitada) if agenda.carga_solicitada else None,
-        },
-        "motorista": {
-            "id": motorista.id,
-            "nome": motorista.nome,
-            "cpf": motorista.cpf,
-        },
-        "caminhao": {
-            "id": caminhao.id,
-            "placa": caminhao.placa,
-            "uf": caminhao.uf,
-            "tipo_carroceria": caminhao.tipo_carroceria,
-            "placa_reboque1": caminhao.placa_reboque1,
-            "uf1": caminhao.uf1,
-            "placa_reboque2": caminhao.placa_reboque2,
-            "uf2": caminhao.uf2,
-            "placa_reboque3": caminhao.placa_reboque3,
-            "uf3": caminhao.uf3,
-        },
-        "storage_state": storage_state # Passa o estado da sessão para o robô
-    }
-    
-    print("\n--- PARÂMETROS PARA EXECUÇÃO DO RPA (JSON) ---")
-    # Não imprimir o storage_state para não poluir o log
-    params_to_print = {k: v for k, v in rpa_params.items() if k != 'storage_state'}
-    print(json.dumps(params_to_print, indent=4))
-    print("--------------------------------------------\n")
-    
-    agenda.status = 'processando'
-    db.session.commit()
-
-    try:
-        run_headless_mode = False # Forçado para navegador visível a pedido do usuário
-        print(f"Chamando process_agendamento_main_task com run_headless={run_headless_mode}")
-        result = asyncio.run(process_agendamento_main_task(rpa_params, run_headless=run_headless_mode))
-        
-        # --- LÓGICA DE SESSÃO: Salvar novo estado se existir ---
-        new_storage_state = result.get('new_storage_state')
-        if new_storage_state:
-            print("--- SALVANDO NOVO ESTADO DA SESSÃO NO BANCO DE DADOS ---")
-            if sessao_rpa:
-                sessao_rpa.storage_state = new_storage_state
-                sessao_rpa.last_updated = datetime.now(timezone.utc)
-            else:
-                sessao_rpa = RpaSessao(storage_state=new_storage_state)
-                db.session.add(sessao_rpa)
-            db.session.commit()
-            print("--- Novo estado da sessão salvo com sucesso. ---")
+    if agenda.status not in STATUS_AGENDA_EXECUTAVEL:
+        return jsonify(success=False, message=f"Agenda não pode ser executada (status atual: {agenda.status})."), 409
 
+    job, criado = enfileirar_agenda(agenda, modo=modo)
+    if criado:
+        print(f"--- Agenda {agenda_id} enviada para a fila do robô (job {job.id}){sufixo_log} ---")
+        message = f"Agenda enviada para a fila do robô{sufixo_log}."
+    else:
+        print(f"--- Agenda {agenda_id} já está na fila do robô (job {job.id}){sufixo_log} ---")
+        message = f"Agenda já está na fila do robô{sufixo_log}."
+    return jsonify(success=True, queued=True, job_id=job.id, status=job.status, message=message), 202
 
-        if result['success']:
-            agenda.status = 'agendado'
-            agenda.log_retorno = result.get('message', 'Agendamento concluído com sucesso.')
-            db.session.commit()
-            return jsonify(success=True, message=result.get('user_facing_message', result.get('message', 'Agendamento concluído com sucesso.')))
-        else:
-            # Verifica se há um status específico de falha retornado pelo RPA
-            specific_status = result.get('status')
-            if specific_status == 'falhou':
-                agenda.status = 'falhou'
-            else:
-                agenda.status = 'erro'
-            
-            log_content_for_db = result.get('message', 'Erro desconhecido durante a execução do RPA.')
-            agenda.log_retorno = log_content_for_db
-
-            try:
-                db.session.commit()
-            except Exception as commit_e:
-                db.session.rollback()
-                print(f"ERROR app.py: db.session.commit() failed for agenda {agenda.id}: {commit_e}")
-                try:
-                    agenda.log_retorno = f"Original commit failed: {commit_e}"
-                    db.session.commit()
-                except Exception as final_e:
-                    db.session.rollback()
-                    print(f"CRITICAL ERROR app.py: Failed to commit commit error for agenda {agenda.id}: {final_e}")
-                return jsonify(success=False, message=f"Erro ao persistir log: {commit_e}"), 200
-
-            return jsonify(success=False, message=result.get('user_facing_message', result.get('message', 'Ocorreu um erro durante a execução do RPA.'))), 200
-    except Exception as e:
-        db.session.rollback()
-        agenda.status = 'erro'
-        agenda.log_retorno = f"Erro inesperado no servidor: {e}"
-        db.session.commit()
-        print(f"Erro ao executar automação para agenda {agenda_id}: {e}")
-        return jsonify(success=False, message="Erro interno ao executar a automação do robô."), 500
+@app.route('/api/agendas/execute/<int:agenda_id>', methods=['POST'])
+@dev_required
+def execute_agenda_task(agenda_id):
+    """
+    Enfileira a execução do robô (Playwright) para uma agenda.
+    A execução é feita pelo worker (rpa_worker.py); o endpoint responde 202 com o job_id.
+    """
+    print(f"--- Iniciando execute_agenda_task para agenda_id: {agenda_id} ---")
+    return _enfileirar_execucao(agenda_id, modo='normal')
 
 @app.route('/api/agendas/execute_dev_mode/<int:agenda_id>', methods=['POST'])
 @dev_required
 def execute_agenda_task_dev_mode(agenda_id):
     """
-    Executes the Playwright RPA task for a specific agenda item in non-headless mode,
-    passing all necessary data as a single JSON object.
-    Handles loading and saving of the RPA session state.
+    Enfileira a execução do robô para uma agenda em modo dev (status com sufixo '(Dev)').
     """
     print(f"--- Iniciando execute_agenda_task_dev_mode para agenda_id: {agenda_id} ---")
-    agenda = db.session.get(Agenda, agenda_id)
-    if not agenda:
-        print(f"Agenda ID {agenda_id} não encontrada.")
-        return jsonify(success=False, message="Agenda não encontrada."), 404
-
-    config = db.session.query(ConfiguracaoRobo).first()
-    if not config:
-        print("Configuracoes do Robo: Nenhuma")
-        return jsonify(success=False, message="Configuração do robô não encontrada."), 500
-
-    motorista = db.session.get(Motorista, agenda.motorista_id)
-    caminhao = db.session.get(Caminhao, agenda.caminhao_id)
-    if not motorista or not caminhao:
-        return jsonify(success=False, message="Motorista ou Caminhão da agenda não encontrados."), 404
-
-    # --- LÓGICA DE SESSÃO: Carregar estado do banco de dados ---
-    print("--- Carregando estado de sessão do RPA do banco de dados (Dev Mode)... ---")
-    sessao_rpa = db.session.query(RpaSessao).first()
-    storage_state = sessao_rpa.storage_state if sessao_rpa else None
-    if storage_state:
-        print("Estado de sessão encontrado (Dev Mode).")
-    else:
-        print("Nenhum estado de sessão encontrado. Será necessário um novo login (Dev Mode).")
-
-
-    # --- 1. Estruturar todos os dados em um único dicionário (JSON) ---
-    rpa_params = {
-        "config": {
-            "url_acesso": config.url_acesso,
-            "filial": config.filial,
-            "usuario_site": config.usuario_site,
-            "senha_site": config.senha_site, # senha_site é uma property que decodifica o valor
-            "email_retorno": config.email_retorno,
-            "pagina_raspagem": config.pagina_raspagem,
-            "contato": config.contato,
-            "telefone": config.telefone,
-            "head_evento": config.head_evento,
-            "tempo_espera_segundos": config.tempo_espera_segundos,
-            "modo_execucao": config.modo_execucao,
-        },
-        "agenda": {
-            "id": agenda.id,
-            "fertipar_protocolo": agenda.fertipar_protocolo,
-            "fertipar_pedido": agenda.fertipar_pedido,
-            "fertipar_destino": agenda.fertipar_destino,
-            "carga_solicitada": float(agenda.carga_solicitada) if agenda.carga_solicitada else None,
-        },
-        "motorista": {
-            "id": motorista.id,
-            "nome": motorista.nome,
-            "cpf": motorista.cpf,
-        },
-        "caminhao": {
-            "id": caminhao.id,
-            "placa": caminhao.placa,
-            "uf": caminhao.uf,
-            "tipo_carroceria": caminhao.tipo_carroceria,
-            "placa_reboque1": caminhao.placa_reboque1,
-            "uf1": caminhao.uf1,
-            "placa_reboque2": caminhao.placa_reboque2,
-            "uf2": caminhao.uf2,
-            "placa_reboque3": caminhao.placa_reboque3,
-            "uf3": caminhao.uf3,
-        },
-        "storage_state": storage_state # Passa o estado da sessão para o robô
-    }
-
-    # --- 2. Remover prints antigos e imprimir o JSON formatado ---
-    print("\n--- PARÂMETROS PARA EXECUÇÃO DO RPA (JSON) (Dev Mode) ---")
-    params_to_print = {k: v for k, v in rpa_params.items() if k != 'storage_state'}
-    print(json.dumps(params_to_print, indent=4))
-    print("--------------------------------------------\n")
-
-    agenda.status = 'processando (Dev)'
-    db.session.commit()
-
-    try:
-        run_headless_mode = False  # Sempre visível para modo dev
-        print(f"Chamando process_agendamento_main_task com run_headless={run_headless_mode} (Dev Mode)")
-        
-        # --- 3. Passar o dicionário `rpa_params` que agora contém o storage_state ---
-        result = asyncio.run(process_agendamento_main_task(rpa_params, run_headless=run_headless_mode))
-        
-        # --- LÓGICA DE SESSÃO: Salvar novo estado se existir (Dev Mode) ---
-        new_storage_state = result.get('new_storage_state')
-        if new_storage_state:
-            print("--- SALVANDO NOVO ESTADO DA SESSÃO NO BANCO DE DADOS (Dev Mode) ---")
-            if sessao_rpa:
-                sessao_rpa.storage_state = new_storage_state
-                sessao_rpa.last_updated = datetime.now(timezone.utc)
-            else:
-                sessao_rpa = RpaSessao(storage_state=new_storage_state)
-                db.session.add(sessao_rpa)
-            db.session.commit()
-            print("--- Novo estado da sessão salvo com sucesso (Dev Mode). ---")
-
-        if result['success']:
-            agenda.status = 'agendado'
-            agenda.log_retorno = result.get('message', 'Agendamento concluído com sucesso (Dev Mode).')
-            db.session.commit()
-            return jsonify(success=True, message=result.get('user_facing_message', result.get('message', 'Agendamento concluído com sucesso (Dev Mode).')))
-        else:
-            # Verifica se há um status específico de falha retornado pelo RPA
-            specific_status = result.get('status')
-            if specific_status == 'falhou':
-                agenda.status = 'falhou (Dev)'
-            else:
-                agenda.status = 'erro (Dev)'
-
-            log_content_for_db = result.get('message', 'Erro desconhecido durante a execução do RPA (Dev Mode).')
-            agenda.log_retorno = log_content_for_db
-            
-            try:
-                db.session.commit()
-            except Exception as commit_e:
-                db.session.rollback()
-                print(f"ERROR app.py: db.session.commit() failed for agenda {agenda.id} (Dev Mode): {commit_e}")
-                try:
-                    agenda.log_retorno = f"Original commit (Dev Mode) failed: {commit_e}"
-                    db.session.commit()
-                except Exception as final_e:
-                    db.session.rollback()
-                    print(f"CRITICAL ERROR app.py: Failed to commit commit error for agenda {agenda.id} (Dev Mode): {final_e}")
-                return jsonify(success=False, message=f"Erro ao persistir log (Dev Mode): {commit_e}"), 200
-
-            return jsonify(success=False, message=result.get('user_facing_message', result.get('message', 'Ocorreu um erro durante a execução do RPA (Dev Mode).'))), 200
-    except Exception as e:
-        db.session.rollback()
-        agenda.status = 'erro (Dev)'
-        agenda.log_retorno = f"Erro inesperado no servidor (Dev Mode): {e}"
-        db.session.commit()
-        print(f"Erro ao executar automação (Dev Mode) para agenda {agenda_id}: {e}")
-        return jsonify(success=False, message="Erro interno ao executar a automação do robô (Dev Mode)."), 500
-
-
-
-
+    return _enfileirar_execucao(agenda_id, modo='dev')
 
+@app.route('/api/agendas/execute_batch', methods=['POST'])
+@dev_required
+def execute_agendas_batch():
+    """
+    Enfileira várias agendas de uma vez (por padrão, todas em 'espera').
+    O worker as executa em paralelo, até 'max_execucoes_paralelas' por vez.
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    query = Agenda.query.filter_by(status='espera')
+    if ids:
+        query = query.filter(Agenda.id.in_(ids))
+    agendas = query.order_by(Agenda.data_agendamento).all()
+    if not agendas:
+        return jsonify(success=False, message='Nenhuma agenda em espera para executar.'), 404
+
+    jobs = []
+    for agenda in agendas:
+        job, _ = enfileirar_agenda(agenda)
+        jobs.append({'agenda_id': agenda.id, 'job_id': job.id})
+    print(f"--- {len(jobs)} agendas enviadas para a fila do robô em lote ---")
+    return jsonify(success=True, queued=True, jobs=jobs, message=f'{len(jobs)} agendas enviadas para a fila do robô.'), 202
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def get_rpa_job(job_id):
+    job = db.session.get(RpaJob, job_id)
+    if not job:
+        return jsonify(success=False, message='Job não encontrado.'), 404
+    return jsonify(success=True, job=job.to_dict())
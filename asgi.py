@@ -0,0 +1,92 @@
+# asgi.py
+"""
+Ponto de entrada ASGI da aplicação (alternativa ao run_app.py):
+
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+
+As rotas Flask continuam síncronas. Diferente do WsgiToAsgi padrão do asgiref, que
+executa todas as requisições em uma única thread, cada requisição roda em uma thread
+do pool, então as conexões longas (SSE das agendas, NDJSON da raspagem) não bloqueiam
+as demais; as respostas em streaming são enviadas à medida que são geradas e
+interrompidas quando o cliente desconecta. O Playwright vive no RuntimeRPA do app,
+iniciado no startup e encerrado no shutdown do servidor (protocolo lifespan).
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+
+from app import app, rpa_runtime
+
+# Cada conexão SSE aberta ocupa uma thread enquanto durar (no máximo MAX_STREAMS_AGENDAS do app)
+THREADS_WSGI = int(os.environ.get("ASGI_THREADS", "64"))
+_executor = ThreadPoolExecutor(max_workers=THREADS_WSGI, thread_name_prefix="wsgi")
+
+
+class _InstanciaWsgi(WsgiToAsgiInstance):
+    async def __call__(self, scope, receive, send):
+        self._receive = receive
+        self.desconectado = threading.Event()
+        await super().__call__(scope, receive, send)
+
+    async def run_wsgi_app(self, body):
+        vigia = asyncio.create_task(self._vigiar_desconexao())
+        try:
+            await sync_to_async(self._executar_wsgi, thread_sensitive=False, executor=_executor)(body)
+        finally:
+            vigia.cancel()
+
+    async def _vigiar_desconexao(self):
+        while True:
+            mensagem = await self._receive()
+            if mensagem["type"] == "http.disconnect":
+                self.desconectado.set()
+                return
+
+    def _executar_wsgi(self, body):
+        environ = self.build_environ(self.scope, body)
+        resposta = self.wsgi_application(environ, self.start_response)
+        try:
+            for trecho in resposta:
+                if self.desconectado.is_set():
+                    break
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if trecho:
+                    self.sync_send({"type": "http.response.body", "body": trecho, "more_body": True})
+        finally:
+            # Executa a limpeza dos geradores da resposta (ex.: fechar o navegador da raspagem)
+            if hasattr(resposta, "close"):
+                resposta.close()
+        if self.desconectado.is_set():
+            return
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await asyncio.get_running_loop().run_in_executor(None, rpa_runtime.iniciar)
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(None, rpa_runtime.encerrar)
+            _executor.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif scope["type"] == "http":
+        await _InstanciaWsgi(app)(scope, receive, send)
+    else:
+        raise ValueError(f"Tipo de conexão ASGI não suportado: {scope['type']}")
@@ -0,0 +1,252 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from playwright.async_api import async_playwright, Browser, BrowserContext
+
+
+@dataclass
+class _BrowserSlot:
+    browser: Browser
+    usos: int = 0
+    ativos: int = 0
+    ultimo_uso: float = field(default_factory=time.monotonic)
+    aposentado: bool = False
+
+
+@dataclass
+class _ContextoAquecido:
+    slot: _BrowserSlot
+    context: BrowserContext
+    semente: Optional[str]
+    criado_em: float = field(default_factory=time.monotonic)
+
+
+def _semente_storage_state(storage_state) -> Optional[str]:
+    """Identifica o storage_state usado para aquecer um contexto (cookies de sessão)."""
+    if not storage_state:
+        return None
+    cookies = storage_state.get("cookies", []) if isinstance(storage_state, dict) else []
+    return "|".join(sorted(f"{c.get('domain')}:{c.get('name')}={c.get('value')}" for c in cookies))
+
+
+class BrowserPool:
+    """
+    Pool de navegadores Chromium de longa duração, pertencente a um processo worker.
+
+    Entrega BrowserContexts já aquecidos (com o storage_state da RpaSessao),
+    verifica a saúde dos navegadores antes de usá-los, recicla cada navegador
+    após `max_usos_por_browser` contextos e fecha navegadores ociosos após
+    `tempo_ocioso_segundos`.
+    """
+
+    def __init__(self, max_browsers: int = 1, max_usos_por_browser: int = 50,
+                 tempo_ocioso_segundos: int = 300, contextos_aquecidos: int = 1,
+                 launch_options: Optional[dict] = None, playwright=None):
+        self.max_browsers = max_browsers
+        self.max_usos_por_browser = max_usos_por_browser
+        self.tempo_ocioso_segundos = tempo_ocioso_segundos
+        self.contextos_aquecidos = contextos_aquecidos
+        self.launch_options = launch_options or {"headless": True, "slow_mo": 50, "args": ["--start-fullscreen"]}
+
+        # Driver compartilhado (ex.: RuntimeRPA): o pool usa, mas não inicia nem encerra
+        self._playwright = playwright
+        self._playwright_proprio = playwright is None
+        self._slots: list[_BrowserSlot] = []
+        self._aquecidos: list[_ContextoAquecido] = []
+        self._lock = asyncio.Lock()
+        self._manutencao_task: Optional[asyncio.Task] = None
+        self._storage_state_atual = None
+        self._tarefas: set[asyncio.Task] = set()
+
+    # --- Ciclo de vida ---
+    async def start(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+            print("[POOL] Playwright iniciado.")
+        if self._manutencao_task is None:
+            self._manutencao_task = asyncio.create_task(self._loop_manutencao())
+        return self
+
+    async def stop(self):
+        if self._manutencao_task:
+            self._manutencao_task.cancel()
+            self._manutencao_task = None
+        async with self._lock:
+            for aquecido in self._aquecidos:
+                await self._fechar_silencioso(aquecido.context)
+            self._aquecidos.clear()
+            for slot in self._slots:
+                await self._fechar_silencioso(slot.browser)
+            self._slots.clear()
+        if self._playwright and self._playwright_proprio:
+            await self._playwright.stop()
+            self._playwright = None
+            print("[POOL] Playwright finalizado.")
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    # --- API pública ---
+    @asynccontextmanager
+    async def contexto(self, storage_state=None, **context_options):
+        """
+        Entrega um BrowserContext pronto para uso. Se houver um contexto aquecido
+        com o mesmo storage_state ele é reaproveitado; caso contrário um novo
+        contexto é criado no navegador mais livre do pool.
+        O contexto é sempre fechado ao final; o navegador permanece vivo.
+        """
+        await self.start()
+        self._storage_state_atual = storage_state
+        slot, context = await self._obter_contexto(storage_state, context_options)
+        try:
+            yield context
+        finally:
+            await self._fechar_silencioso(context)
+            slot.ativos -= 1
+            slot.ultimo_uso = time.monotonic()
+            if slot.aposentado and slot.ativos == 0:
+                await self._descartar_slot(slot)
+            if not context_options:
+                tarefa = asyncio.create_task(self._repor_aquecidos())
+                self._tarefas.add(tarefa)
+                tarefa.add_done_callback(self._tarefas.discard)
+
+    async def aquecer(self, storage_state=None):
+        """Pré-cria contextos com o storage_state informado para o próximo uso."""
+        await self.start()
+        self._storage_state_atual = storage_state
+        await self._repor_aquecidos()
+
+    async def reconfigurar(self, launch_options: dict):
+        """
+        Troca as opções de lançamento: navegadores livres são fechados agora e os ocupados
+        ao terminar seus contextos; os próximos contextos já usam um navegador novo.
+        """
+        async with self._lock:
+            self.launch_options = launch_options
+            for slot in self._slots:
+                slot.aposentado = True
+            for aquecido in self._aquecidos:
+                await self._liberar_aquecido(aquecido)
+            self._aquecidos.clear()
+            for slot in [s for s in self._slots if s.ativos == 0]:
+                await self._descartar_slot(slot)
+        print("[POOL] Opções de lançamento alteradas; navegadores serão reiniciados.")
+        await self._repor_aquecidos()
+
+    def estatisticas(self) -> dict:
+        return {
+            "browsers": len(self._slots),
+            "contextos_ativos": sum(s.ativos for s in self._slots),
+            "contextos_aquecidos": len(self._aquecidos),
+            "usos": [s.usos for s in self._slots],
+        }
+
+    # --- Internos ---
+    async def _obter_contexto(self, storage_state, context_options):
+        semente = _semente_storage_state(storage_state)
+        async with self._lock:
+            if not context_options:
+                while self._aquecidos:
+                    aquecido = self._aquecidos.pop(0)
+                    if aquecido.semente == semente and self._saudavel(aquecido.slot) and not aquecido.slot.aposentado:
+                        aquecido.slot.ativos += 1
+                        print("[POOL] Reutilizando contexto aquecido.")
+                        return aquecido.slot, aquecido.context
+                    await self._liberar_aquecido(aquecido)
+
+            slot = await self._escolher_slot()
+            context = await self._novo_contexto(slot, storage_state, context_options)
+            slot.ativos += 1
+            return slot, context
+
+    async def _novo_contexto(self, slot: _BrowserSlot, storage_state, context_options):
+        options = dict(context_options)
+        if storage_state:
+            options["storage_state"] = storage_state
+        context = await slot.browser.new_context(**options)
+        await context.new_page()
+        slot.usos += 1
+        slot.ultimo_uso = time.monotonic()
+        if slot.usos >= self.max_usos_por_browser:
+            print(f"[POOL] Navegador atingiu {slot.usos} usos. Será reciclado ao ficar livre.")
+            slot.aposentado = True
+        return context
+
+    async def _escolher_slot(self) -> _BrowserSlot:
+        for slot in list(self._slots):
+            if not self._saudavel(slot):
+                print("[POOL] Navegador desconectado removido do pool.")
+                await self._descartar_slot(slot)
+
+        candidatos = [s for s in self._slots if not s.aposentado]
+        if candidatos and (len(self._slots) >= self.max_browsers or all(s.ativos == 0 for s in candidatos)):
+            return min(candidatos, key=lambda s: s.ativos)
+
+        browser = await self._playwright.chromium.launch(**self.launch_options)
+        slot = _BrowserSlot(browser=browser)
+        self._slots.append(slot)
+        print(f"[POOL] Novo navegador iniciado ({len(self._slots)}/{self.max_browsers}).")
+        return slot
+
+    def _saudavel(self, slot: _BrowserSlot) -> bool:
+        return slot.browser.is_connected()
+
+    async def _repor_aquecidos(self):
+        async with self._lock:
+            semente = _semente_storage_state(self._storage_state_atual)
+            for aquecido in [a for a in self._aquecidos if a.semente != semente or not self._saudavel(a.slot)]:
+                self._aquecidos.remove(aquecido)
+                await self._liberar_aquecido(aquecido)
+            while len(self._aquecidos) < self.contextos_aquecidos:
+                try:
+                    slot = await self._escolher_slot()
+                    context = await self._novo_contexto(slot, self._storage_state_atual, {})
+                except Exception as e:
+                    print(f"[POOL] Falha ao aquecer contexto: {e}")
+                    return
+                slot.ativos += 1
+                self._aquecidos.append(_ContextoAquecido(slot=slot, context=context, semente=semente))
+
+    async def _liberar_aquecido(self, aquecido: _ContextoAquecido):
+        await self._fechar_silencioso(aquecido.context)
+        aquecido.slot.ativos -= 1
+        if aquecido.slot.aposentado and aquecido.slot.ativos == 0:
+            await self._descartar_slot(aquecido.slot)
+
+    async def _descartar_slot(self, slot: _BrowserSlot):
+        if slot in self._slots:
+            self._slots.remove(slot)
+        await self._fechar_silencioso(slot.browser)
+
+    async def _loop_manutencao(self):
+        while True:
+            await asyncio.sleep(30)
+            try:
+                await self._despejar_ociosos()
+            except Exception as e:
+                print(f"[POOL] Erro na manutenção do pool: {e}")
+
+    async def _despejar_ociosos(self):
+        agora = time.monotonic()
+        async with self._lock:
+            for aquecido in list(self._aquecidos):
+                if agora - aquecido.criado_em > self.tempo_ocioso_segundos:
+                    self._aquecidos.remove(aquecido)
+                    await self._liberar_aquecido(aquecido)
+            for slot in list(self._slots):
+                if not self._saudavel(slot) or (slot.ativos == 0 and agora - slot.ultimo_uso > self.tempo_ocioso_segundos):
+                    print("[POOL] Fechando navegador ocioso.")
+                    await self._descartar_slot(slot)
+
+    @staticmethod
+    async def _fechar_silencioso(recurso):
+        try:
+            await recurso.close()
+        except Exception:
+            pass
@@ -0,0 +1,220 @@
+"""
+Cache em memória (por processo) para resultados caros, como a raspagem da grade
+de cotações da Fertipar e os agregados de meses já fechados do dashboard.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LeituraInterrompida(Exception):
+    """A leitura compartilhada foi abortada pelo requisitante que a conduzia."""
+
+
+class _LeituraEmAndamento:
+    """Resultado parcial de uma leitura em curso, acompanhado pelos demais requisitantes."""
+
+    def __init__(self):
+        self.itens = []
+        self.concluida = False
+        self.erro = None
+        self._condicao = threading.Condition()
+
+    def publicar(self, item):
+        with self._condicao:
+            self.itens.append(item)
+            self._condicao.notify_all()
+
+    def encerrar(self, erro=None):
+        with self._condicao:
+            self.concluida = True
+            self.erro = erro
+            self._condicao.notify_all()
+
+    def acompanhar(self):
+        """Entrega os itens já lidos e, em seguida, os novos à medida que chegam."""
+        posicao = 0
+        while True:
+            with self._condicao:
+                while posicao >= len(self.itens) and not self.concluida:
+                    self._condicao.wait()
+                novos = self.itens[posicao:]
+                concluida, erro = self.concluida, self.erro
+            yield from novos
+            posicao += len(novos)
+            if concluida and posicao >= len(self.itens):
+                if erro is not None:
+                    raise erro
+                return
+
+
+class CacheLeituras:
+    """
+    Cache com TTL de leituras que produzem uma lista de itens, com "single-flight":
+    requisições simultâneas para a mesma chave compartilham uma única leitura e
+    recebem os itens em streaming conforme ela avança.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}  # chave -> (lido_em, itens)
+        self._em_andamento = {}  # chave -> _LeituraEmAndamento
+
+    def idade(self, chave):
+        """Segundos desde a última leitura armazenada para a chave (None se não houver)."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        return time.monotonic() - entrada[0] if entrada else None
+
+    def invalidar(self, chave=None):
+        with self._lock:
+            if chave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(chave, None)
+
+    def iterar(self, chave, ttl_segundos, produtor, forcar=False):
+        """
+        Itera os itens da chave: do cache (se mais novo que `ttl_segundos` e não `forcar`),
+        de uma leitura já em andamento, ou chamando `produtor()` (um iterável de itens).
+        Apenas leituras concluídas sem erro são armazenadas.
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and not forcar and time.monotonic() - entrada[0] < ttl_segundos:
+                itens = list(entrada[1])
+                leitura, conduz = None, False
+            else:
+                itens = None
+                leitura = self._em_andamento.get(chave)
+                conduz = leitura is None
+                if conduz:
+                    leitura = self._em_andamento[chave] = _LeituraEmAndamento()
+
+        if itens is not None:
+            yield from itens
+            return
+
+        if not conduz:
+            print(f"[CACHE] Aguardando leitura já em andamento para {chave}.")
+            yield from leitura.acompanhar()
+            return
+
+        erro = LeituraInterrompida("Leitura interrompida antes de terminar.")
+        try:
+            for item in produtor():
+                leitura.publicar(item)
+                yield item
+            erro = None
+            with self._lock:
+                self._entradas[chave] = (time.monotonic(), list(leitura.itens))
+        except Exception as e:
+            erro = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            leitura.encerrar(erro)
+
+
+class CachePeriodos:
+    """
+    Cache de resultados calculados sobre um intervalo de meses [inicio, fim).
+    Pensado para períodos já fechados, que não mudam: as entradas não expiram e só
+    saem quando um mês coberto por elas é invalidado (ou quando a mesma chave é
+    pedida para outro intervalo, como na virada do mês).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}  # chave -> (inicio, fim, valor)
+        self._geracao = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+
+    def obter(self, chave, inicio, fim, calcular):
+        """Retorna o valor da chave para o intervalo, chamando `calcular()` se não estiver em cache."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and entrada[:2] == (inicio, fim):
+                self.acertos += 1
+                return entrada[2]
+            self.falhas += 1
+            geracao = self._geracao
+
+        valor = calcular()
+        with self._lock:
+            # Uma invalidação durante o cálculo pode ter tornado o valor obsoleto: não armazena
+            if self._geracao == geracao:
+                self._entradas[chave] = (inicio, fim, valor)
+        return valor
+
+    def invalidar_meses(self, meses):
+        """Remove as entradas cujo intervalo cobre algum dos meses (datas do 1º dia do mês)."""
+        meses = list(meses)
+        if not meses:
+            return
+        with self._lock:
+            self._geracao += 1
+            for chave, (inicio, fim, _) in list(self._entradas.items()):
+                if any((inicio is None or inicio <= mes) and (fim is None or mes < fim) for mes in meses):
+                    del self._entradas[chave]
+                    self.invalidacoes += 1
+
+    def limpar(self):
+        """Remove todas as entradas (ex.: quando invalidações podem ter sido perdidas)."""
+        with self._lock:
+            self._geracao += 1
+            self.invalidacoes += len(self._entradas)
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "entradas": len(self._entradas),
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "invalidacoes": self.invalidacoes,
+                "taxa_acerto": round(self.acertos / consultas, 3) if consultas else None,
+            }
+
+
+class CacheTTL:
+    """Cache chave -> valor com validade fixa e limite de entradas (descarta as menos usadas)."""
+
+    def __init__(self, ttl_segundos, max_entradas=1000):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # chave -> (lido_em, valor)
+        self._geracao = 0
+
+    def obter(self, chave, calcular):
+        """Retorna o valor da chave, chamando `calcular()` se ausente ou vencido. None não é armazenado."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and time.monotonic() - entrada[0] < self.ttl_segundos:
+                self._entradas.move_to_end(chave)
+                return entrada[1]
+            geracao = self._geracao
+
+        valor = calcular()
+        if valor is not None:
+            with self._lock:
+                if self._geracao != geracao:
+                    return valor  # Invalidado durante o cálculo
+                self._entradas[chave] = (time.monotonic(), valor)
+                self._entradas.move_to_end(chave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self, chave=None):
+        with self._lock:
+            self._geracao += 1
+            if chave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(chave, None)
@@ -0,0 +1,116 @@
+"""
+Canal de eventos via Postgres LISTEN/NOTIFY.
+
+Uma única thread por processo escuta um canal do Postgres e repassa cada
+notificação (já transformada) para as filas dos assinantes, por exemplo as
+conexões SSE abertas pelos navegadores. Notificações emitidas por qualquer
+processo (Flask ou rpa_worker) chegam a todos os processos que escutam o canal.
+"""
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+# Entregue aos assinantes quando eventos podem ter sido perdidos: devem recarregar o estado completo.
+EVENTO_RESSINCRONIZAR = {"op": "resync"}
+
+
+class CanalEventos:
+    def __init__(self, canal, dsn, transformar=None, max_fila=1000):
+        """
+        Args:
+            canal (str): Nome do canal do Postgres (LISTEN <canal>).
+            dsn (str): String de conexão do Postgres.
+            transformar (callable): Recebe a lista de payloads (dict) recebidos de uma vez e
+                                    retorna a lista de eventos entregues aos assinantes.
+            max_fila (int): Limite de eventos pendentes por assinante; um assinante lento
+                            demais é descartado (o navegador reconecta e recarrega).
+        """
+        self.canal = canal
+        self.dsn = dsn
+        self.transformar = transformar or (lambda payloads: payloads)
+        self.max_fila = max_fila
+        self._assinantes = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def assinar(self):
+        """Registra um novo assinante e retorna sua fila de eventos."""
+        fila = queue.Queue(maxsize=self.max_fila)
+        with self._lock:
+            self._assinantes.add(fila)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._escutar, name=f"listen-{self.canal}", daemon=True)
+                self._thread.start()
+        return fila
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._assinantes.discard(fila)
+
+    def publicar(self, eventos):
+        """Entrega eventos diretamente aos assinantes deste processo."""
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for fila in assinantes:
+            for evento in eventos:
+                try:
+                    fila.put_nowait(evento)
+                except queue.Full:
+                    print(f"[EVENTOS] Assinante lento descartado do canal '{self.canal}'.")
+                    self.cancelar(fila)
+                    try:
+                        fila.get_nowait()
+                    except queue.Empty:
+                        pass
+                    fila.put_nowait(None)  # Sinaliza para a conexão encerrar
+                    break
+
+    def _escutar(self):
+        reconexao = False
+        while True:
+            conexao = None
+            try:
+                conexao = psycopg2.connect(self.dsn)
+                conexao.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conexao.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.canal};")
+                print(f"[EVENTOS] Escutando o canal '{self.canal}'.")
+                if reconexao:
+                    # Notificações emitidas enquanto a conexão esteve fora foram perdidas
+                    self.publicar([EVENTO_RESSINCRONIZAR])
+                reconexao = True
+                while True:
+                    with self._lock:
+                        if not self._assinantes:
+                            print(f"[EVENTOS] Sem assinantes; parando de escutar '{self.canal}'.")
+                            self._thread = None
+                            return
+                    if select.select([conexao], [], [], 15) == ([], [], []):
+                        continue
+                    conexao.poll()
+                    payloads = []
+                    while conexao.notifies:
+                        notificacao = conexao.notifies.pop(0)
+                        try:
+                            payloads.append(json.loads(notificacao.payload))
+                        except ValueError:
+                            print(f"[EVENTOS] Payload inválido ignorado: {notificacao.payload!r}")
+                    if payloads:
+                        try:
+                            eventos = self.transformar(payloads)
+                        except Exception as e:
+                            # Os eventos deste lote se perderam: os assinantes recarregam o estado completo
+                            print(f"[EVENTOS] Falha ao processar notificações do canal '{self.canal}': {e}")
+                            eventos = [EVENTO_RESSINCRONIZAR]
+                        self.publicar(eventos)
+            except Exception as e:
+                print(f"[EVENTOS] Conexão do canal '{self.canal}' perdida: {e}. Reconectando em 5s...")
+            finally:
+                if conexao is not None:
+                    conexao.close()
+            time.sleep(5)
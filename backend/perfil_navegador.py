@@ -0,0 +1,66 @@
+"""
+Perfis de navegador do robô.
+
+'completo' reproduz o navegador de sempre (tela cheia, todos os recursos da página).
+'enxuto' é pensado para execuções headless em links lentos: bloqueia imagens, fontes,
+mídia e requisições de terceiros, desliga recursos do Chromium que o robô não usa e
+usa uma janela pequena e fixa.
+"""
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext, Route
+
+PERFIL_COMPLETO = "completo"
+PERFIL_ENXUTO = "enxuto"
+
+ARGS_COMPLETO = ["--start-fullscreen"]
+ARGS_ENXUTO = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-features=Translate,MediaRouter,OptimizationHints",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+]
+VIEWPORT_ENXUTO = {"width": 1024, "height": 768}
+TIPOS_BLOQUEADOS = {"image", "font", "media"}
+
+
+def perfil_efetivo(config: dict) -> str:
+    """O perfil enxuto só vale para execuções headless; com a tela visível usa-se o completo."""
+    if config.get("perfil_navegador") == PERFIL_ENXUTO and not config.get("head_evento", False):
+        return PERFIL_ENXUTO
+    return PERFIL_COMPLETO
+
+
+def opcoes_lancamento(config: dict, slow_mo: int = 0) -> dict:
+    """Opções de `chromium.launch` para o perfil da configuração."""
+    args = ARGS_ENXUTO if perfil_efetivo(config) == PERFIL_ENXUTO else ARGS_COMPLETO
+    return {"headless": not config.get("head_evento", False), "slow_mo": slow_mo, "args": list(args)}
+
+
+def hosts_da_configuracao(config: dict) -> set:
+    """Hosts do próprio site (url_acesso / pagina_raspagem); o resto é tratado como terceiro."""
+    return {urlparse(url).hostname for url in (config.get("url_acesso"), config.get("pagina_raspagem")) if url}
+
+
+async def aplicar_perfil_enxuto(context: BrowserContext, hosts_permitidos: Iterable[str],
+                                viewport: Optional[dict] = None):
+    """Instala o bloqueio de recursos no contexto e ajusta o viewport das páginas já abertas."""
+    hosts = {h for h in hosts_permitidos if h}
+
+    async def _filtrar(route: Route):
+        request = route.request
+        if request.resource_type in TIPOS_BLOQUEADOS or (hosts and urlparse(request.url).hostname not in hosts):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", _filtrar)
+    for page in context.pages:
+        await page.set_viewport_size(viewport or VIEWPORT_ENXUTO)
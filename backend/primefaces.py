@@ -0,0 +1,33 @@
+"""
+Helpers para esperar o ciclo AJAX das páginas JSF/PrimeFaces do sisferweb.
+"""
+from typing import Optional, Union
+
+from playwright.async_api import Frame, Page
+
+# Verdadeiro quando não há requisição jQuery em andamento nem itens na fila AJAX do PrimeFaces.
+AJAX_OCIOSO_JS = """
+() => (!window.jQuery || jQuery.active === 0)
+    && (!window.PrimeFaces || !PrimeFaces.ajax || !PrimeFaces.ajax.Queue || PrimeFaces.ajax.Queue.isEmpty())
+"""
+
+
+def eh_resposta_ajax_jsf(response) -> bool:
+    """Identifica a resposta de uma requisição parcial do JSF (Faces-Request: partial/ajax)."""
+    return response.request.headers.get("faces-request") == "partial/ajax"
+
+
+async def aguardar_ajax(alvo: Union[Page, Frame], timeout: int = 30000):
+    """Aguarda até a fila AJAX do PrimeFaces/jQuery esvaziar na página (ou iframe) `alvo`."""
+    await alvo.wait_for_function(AJAX_OCIOSO_JS, timeout=timeout)
+
+
+async def aguardar_ajax_apos(page: Page, acao, timeout: int = 30000, frame: Optional[Frame] = None):
+    """
+    Executa `acao` (uma coroutine function sem argumentos) que dispara uma requisição
+    parcial do JSF e aguarda a resposta chegar e o DOM ser atualizado.
+    Se a ação acontece dentro de um iframe, informe-o em `frame`.
+    """
+    async with page.expect_response(eh_resposta_ajax_jsf, timeout=timeout):
+        await acao()
+    await aguardar_ajax(frame or page, timeout)
@@ -0,0 +1,117 @@
+"""
+Runtime assíncrono do robô dentro do processo web.
+
+Um único event loop de longa duração, em uma thread própria, é dono do driver do
+Playwright e dos BrowserPools. As rotas Flask (síncronas, uma thread por requisição)
+submetem corrotinas a esse loop em vez de criar um event loop e um Chromium a cada
+requisição: requisições simultâneas compartilham o driver, os navegadores e os
+contextos aquecidos com a sessão salva, e rodam de fato em paralelo no loop.
+"""
+import asyncio
+import threading
+from contextlib import aclosing
+from typing import Optional
+
+from playwright.async_api import async_playwright
+
+from browser_pool import BrowserPool
+from perfil_navegador import opcoes_lancamento
+from rpa_service import iter_fertipar_rows
+
+
+class RuntimeRPA:
+    def __init__(self, max_browsers: int = 2):
+        """
+        Args:
+            max_browsers (int): Navegadores por pool (um pool por conjunto de opções de lançamento).
+        """
+        self.max_browsers = max_browsers
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._playwright = None
+        self._pools = {}  # opções de lançamento -> BrowserPool (só acessado dentro do loop)
+
+    # --- Ciclo de vida ---
+    def iniciar(self) -> asyncio.AbstractEventLoop:
+        """Inicia a thread do event loop (se ainda não estiver rodando) e retorna o loop."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="rpa-runtime", daemon=True)
+                self._thread.start()
+                print("[RUNTIME] Event loop do robô iniciado.")
+            return self._loop
+
+    def encerrar(self, timeout: float = 30):
+        """Fecha navegadores e o driver do Playwright e para o event loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._fechar(), loop).result(timeout)
+        except Exception as e:
+            print(f"[RUNTIME] Erro ao fechar o Playwright: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+        print("[RUNTIME] Event loop do robô finalizado.")
+
+    async def _fechar(self):
+        pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            await pool.stop()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    # --- Ponte síncrono -> loop ---
+    def executar(self, corrotina, timeout: Optional[float] = None):
+        """Executa a corrotina no loop do runtime e aguarda o resultado (na thread chamadora)."""
+        futuro = asyncio.run_coroutine_threadsafe(corrotina, self.iniciar())
+        try:
+            return futuro.result(timeout)
+        except BaseException:
+            futuro.cancel()
+            raise
+
+    def iterar(self, gerador):
+        """Consome um async generator no loop do runtime como um iterador comum."""
+        loop = self.iniciar()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(gerador.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Consumidor interrompido (ex.: cliente desconectado): libera o contexto do navegador
+            asyncio.run_coroutine_threadsafe(gerador.aclose(), loop).result()
+
+    # --- Recursos compartilhados (usar dentro do loop) ---
+    async def pool_para(self, config: dict, slow_mo: int = 0) -> BrowserPool:
+        """BrowserPool para as opções de lançamento da configuração (criado no primeiro uso)."""
+        opcoes = opcoes_lancamento(config, slow_mo=slow_mo)
+        chave = (opcoes["headless"], opcoes["slow_mo"], tuple(opcoes["args"]))
+        pool = self._pools.get(chave)
+        if pool is None:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+                print("[RUNTIME] Playwright iniciado.")
+            pool = self._pools[chave] = await BrowserPool(
+                max_browsers=self.max_browsers, launch_options=opcoes, playwright=self._playwright,
+            ).start()
+        return pool
+
+    # --- Operações do robô ---
+    def raspar_cotacoes(self, config: dict, sessao: Optional[dict] = None):
+        """Iterador síncrono das linhas da grade de cotações (ver iter_fertipar_rows), lidas com o pool."""
+        async def _linhas():
+            pool = await self.pool_para(config)
+            async with aclosing(iter_fertipar_rows(config, sessao, browser_pool=pool)) as linhas:
+                async for row in linhas:
+                    yield row
+        return self.iterar(_linhas())
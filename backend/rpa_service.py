@@ -1,211 +1,379 @@
 import asyncio
-from typing import List, Dict, Optional, Tuple
+import random
+from contextlib import aclosing, asynccontextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 from playwright.async_api import async_playwright, Page, expect, TimeoutError
+from primefaces import aguardar_ajax, aguardar_ajax_apos
+from perfil_navegador import PERFIL_ENXUTO, perfil_efetivo, opcoes_lancamento, hosts_da_configuracao, aplicar_perfil_enxuto
 import re
 from time import sleep
 import traceback
 
-async def monitor_agendamento_status(config: dict, protocolo: str, pedido: str) -> dict:
-    """
-    Monitors the status of a specific order on the Fertipar website until it is
-    'APROVADO' or 'RECUSADO'.
-    """
-    if not config:
-        raise ValueError("Configuration object is required.")
+# Extrai cabeçalhos e células da grade de cotações em uma única avaliação no navegador.
+_EXTRAIR_GRADE_JS = """
+([headerSelector, rowSelector]) => ({
+    headers: Array.from(document.querySelectorAll(headerSelector), th => th.textContent),
+    rows: Array.from(document.querySelectorAll(rowSelector),
+        tr => Array.from(tr.querySelectorAll('td'), td => td.textContent.trim()))
+})
+"""
 
-    url_login = config.get("url_acesso")
-    filial = config.get("filial")
-    usuario_site = config.get("usuario_site")
-    senha_site = config.get("senha_site")
-    storage_state = config.get("storage_state")
+def _mapear_linhas(headers: List[str], rows: List[List[str]]) -> List[Dict[str, str]]:
+    """Converte as linhas cruas da grade em dicionários {cabeçalho: valor}."""
+    mapped = []
+    for cells in rows:
+        cols = cells[1:] # A primeira coluna é o expansor da linha (sem cabeçalho)
+        if len(cols) == len(headers):
+            mapped.append(dict(zip(headers, cols)))
+        else:
+            print(f"Aviso: Linha pulada por ter contagem de colunas diferente. Esperado {len(headers)}, encontrado {len(cols)}.")
+    return mapped
 
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=not config.get('head_evento', False), slow_mo=50)
-        context = await browser.new_context(storage_state=storage_state)
-        page = await context.new_page()
+# Situações de cotação que interessam à tela de agendamento
+SITUACOES_RASPAGEM = ['PENDENTE', 'APROVADO']
 
-        new_storage_state = None
+TABELA_COTACOES = '[id="form-minhas-cotacoes:tbFretes"]'
+THEAD_COTACOES = '#form-minhas-cotacoes\\:tbFretes_head'
+LINHAS_COTACOES = 'table[role="grid"] tbody tr'
+MAX_PAGINAS_RASPAGEM = 200
 
+# Monitoramento da 'Situação' das cotações (ver monitorar_situacoes)
+SITUACOES_FINAIS = ('APROVADO', 'RECUSADO')
+MONITOR_INTERVALO_INICIAL_S = 5
+MONITOR_INTERVALO_MAXIMO_S = 120
+MONITOR_FATOR_BACKOFF = 2
+MONITOR_JITTER = 0.25  # ±25% em cada espera, para vários monitores não sincronizarem
+MONITOR_PRAZO_S = 30 * 60
+
+
+
+class FalhaRaspagem(Exception):
+    """Falha que impede a raspagem (ex.: login recusado)."""
+
+
+async def _maximizar_linhas_por_pagina(page: Page):
+    """Seleciona a maior opção de 'linhas por página' do paginador, se existir."""
+    seletor = page.locator(f'{TABELA_COTACOES} select.ui-paginator-rpp-options').first
+    if await seletor.count() == 0:
+        return
+    valores = await seletor.evaluate("s => Array.from(s.options, o => o.value)")
+    alvo = '*' if '*' in valores else max((v for v in valores if v.isdigit()), key=int, default=None)
+    if alvo is None or alvo == await seletor.input_value():
+        return
+    print(f"Alterando paginador para {alvo} linhas por página.")
+    try:
+        await aguardar_ajax_apos(page, lambda: seletor.select_option(alvo), timeout=10000)
+    except TimeoutError:
+        await aguardar_ajax(page)
+
+async def _ler_paginas(page: Page, header_selector: str, row_selector: str):
+    """
+    Percorre todas as páginas do datatable PrimeFaces, entregando as linhas já
+    mapeadas de cada página assim que ela é lida.
+    """
+    await _maximizar_linhas_por_pagina(page)
+    headers = None
+    for numero in range(1, MAX_PAGINAS_RASPAGEM + 1):
+        grade = await page.evaluate(_EXTRAIR_GRADE_JS, [header_selector, row_selector])
+        if headers is None:
+            headers = [th.strip() for th in grade["headers"] if th.strip()]
+        print(f"Página {numero}: encontrado {len(grade['rows'])} linhas na tabela.")
+        yield _mapear_linhas(headers, grade["rows"])
+
+        proximo = page.locator(f'{TABELA_COTACOES} .ui-paginator-next').first
+        if await proximo.count() == 0 or 'ui-state-disabled' in (await proximo.get_attribute('class') or ''):
+            break
         try:
-            # --- Login Logic (copied and adapted from rpa_task_processor) ---
-            cotacoes_url = "https://sisferweb.fertipar.com.br/logistica/paginas/cotacoesTransportadora/index.xhtml"
-            await page.goto(cotacoes_url, timeout=60000)
-
-            login_needed = False
-            try:
-                await expect(page.locator("#filial_label")).to_be_visible(timeout=5000)
-                login_needed = True
-            except (TimeoutError, AssertionError):
-                # If login form is not there, check if the main grid is.
-                try:
-                    await expect(page.get_by_role("grid").first).to_be_visible(timeout=5000)
-                except TimeoutError:
-                    login_needed = True # Not on login page, but not on dashboard either. Force login.
-
-            if login_needed:
-                print("[MONITOR] Performing new login...")
-                await page.goto(url_login, timeout=60000)
-                await page.locator("#filial_label").click()
-                await page.get_by_role("option", name=filial).click()
-                await page.get_by_role("textbox", name="Usuário").fill(usuario_site)
-                await page.get_by_role("textbox", name="Senha").fill(senha_site)
-                await page.get_by_role("button", name=" Acessar").click()
-                await page.wait_for_load_state('networkidle', timeout=30000)
-                new_storage_state = await context.storage_state()
-                await page.goto(cotacoes_url, timeout=30000)
-                await expect(page.get_by_role("grid").first).to_be_visible(timeout=10000)
-
-            # --- Monitoring Loop ---
-            while True:
-                print(f"[MONITOR] Checking status for Protocolo: {protocolo}, Pedido: {pedido}")
-                
-                # Find the row
-                linha_do_item = page.locator(f'//tr[contains(., "{protocolo}") and contains(., "{pedido}")]')
-
-                if await linha_do_item.count() > 0:
-                    # Find the status column within that row. Assuming 'Situação' is the 5th column (index 4)
-                    # This might need adjustment based on the actual table structure.
-                    status_text = await linha_do_item.locator('td').nth(4).inner_text()
-                    print(f"[MONITOR] Found status: '{status_text}'")
-
-                    if "APROVADO" in status_text.upper():
-                        return {"success": True, "status": "APROVADO", "new_storage_state": new_storage_state}
-                    elif "RECUSADO" in status_text.upper():
-                        return {"success": False, "status": "RECUSADO", "message": "O agendamento foi recusado.", "new_storage_state": new_storage_state}
-                    # Else, it's PENDENTE, so we continue the loop
-                else:
-                    print(f"[MONITOR] Row for Protocolo {protocolo} not found yet.")
-
-                # Wait and refresh
-                print("[MONITOR] Status is PENDENTE or not found. Waiting 1 second and refreshing...")
-                await asyncio.sleep(1)
-                await page.reload(wait_until="networkidle")
-
-        except Exception as e:
-            tb_str = traceback.format_exc()
-            return {"success": False, "status": "ERRO", "message": tb_str}
-        finally:
-            if browser.is_connected():
-                await browser.close()
+            await aguardar_ajax_apos(page, proximo.click, timeout=10000)
+        except TimeoutError:
+            await aguardar_ajax(page)
 
-async def scrape_fertipar_data(config=None):
+async def iter_fertipar_rows(config: dict, sessao: Optional[dict] = None, browser_pool=None):
     """
-    Scrapes data from the Fertipar website using Playwright.
+    Raspa a grade de cotações da Fertipar página a página (async generator).
+
+    Se `config["storage_state"]` trouxer a sessão salva (RpaSessao), ela é reaproveitada
+    e o login só acontece quando o site redireciona para a tela de login.
 
     Args:
-        config (ConfiguracaoRobo): An object containing robot configuration.
+        config (dict): Configuração do robô (ver montar_config_rpa em app.py).
+        sessao (dict, opcional): Recebe em "new_storage_state" o estado da sessão
+                                 quando um novo login for feito.
+        browser_pool (BrowserPool, opcional): Se informado, a leitura usa um contexto do
+                                 pool e o navegador continua vivo ao final; senão um
+                                 Chromium é iniciado e fechado nesta chamada.
 
-    Returns:
-        list: A list of dictionaries, where each dictionary represents a row
-              from the scraped table. Returns None on failure.
+    Yields:
+        dict: Uma linha da tabela ({cabeçalho: valor}) com 'Situação' em SITUACOES_RASPAGEM,
+              assim que a página que a contém é lida.
+
+    Raises:
+        ValueError: Configuração ausente ou sem senha.
+        FalhaRaspagem: Login não concluído.
     """
     if config is None:
-        print("Erro: scrape_fertipar_data foi chamada sem um objeto de configuração válido.")
+        print("Erro: iter_fertipar_rows foi chamada sem um objeto de configuração válido.")
         raise ValueError("O objeto de configuração (config) é obrigatório para a raspagem de dados.")
-    
-    scraped_data = []
-    
-    if not config.senha_site or not config.senha_site.strip():
+
+    if not config.get("senha_site") or not config.get("senha_site").strip():
         print("ERRO CRÍTICO: A senha do site para o robô não está configurada.")
         raise ValueError("Senha do robô não configurada. Por favor, acesse a página de 'Administração -> Configurações do Robô' e defina a senha.")
     
-    # Extract config details
-    url_acesso = config.url_acesso
-    usuario_site = config.usuario_site
-    senha_site = config.senha_site
-    head_evento = config.head_evento
+    async with _pagina_cotacoes(config, browser_pool) as (page, context):
+        async with aclosing(_raspar_cotacoes(page, context, config, sessao)) as linhas:
+            async for row in linhas:
+                yield row
+
+@asynccontextmanager
+async def _pagina_cotacoes(config: dict, browser_pool=None):
+    """
+    Entrega (page, context) para trabalhar na grade de cotações: um contexto do pool, se
+    informado, ou um Chromium iniciado e fechado aqui. Aplica o perfil enxuto quando configurado.
+    """
+    storage_state = config.get("storage_state")
+
+    if browser_pool is not None:
+        async with browser_pool.contexto(storage_state=storage_state) as context:
+            page = context.pages[0] if context.pages else await context.new_page()
+            if perfil_efetivo(config) == PERFIL_ENXUTO:
+                await aplicar_perfil_enxuto(context, hosts_da_configuracao(config))
+            yield page, context
+        return
 
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=not head_evento)
-        page = await browser.new_page()
+        browser = await p.chromium.launch(**opcoes_lancamento(config))
+        context = await browser.new_context(storage_state=storage_state)
+        page = await context.new_page()
+        if perfil_efetivo(config) == PERFIL_ENXUTO:
+            await aplicar_perfil_enxuto(context, hosts_da_configuracao(config))
 
         try:
-            await page.goto(url_acesso, timeout=60000)
-            await page.wait_for_load_state('networkidle')
-            
-            is_on_login_page = "login.xhtml" in page.url
-            
-            if is_on_login_page:
-                print("Página de login detectada. Iniciando processo de login...")
-                username_selector = "#j_username"
-                password_selector = "#j_password"
-                login_button_selector = "#btLoginId"
-                
-                await page.fill(username_selector, usuario_site)
-                await page.fill(password_selector, senha_site)
-
-                if config.filial:
-                    await page.locator("#filial_label").click()
-                    await page.get_by_role("option", name=config.filial).click()
-                
-                await page.click(login_button_selector)
-                
-                try:
-                    # Wait for navigation away from the login page (i.e., 'login.xhtml' should no longer be in the URL)
-                    await page.wait_for_url(lambda url: "login.xhtml" not in url, timeout=30000)
-                    print("Navegação pós-login bem-sucedida.")
-                    await page.wait_for_load_state('networkidle', timeout=30000)
-                    print("Estado de carregamento da rede 'networkidle' alcançado após login.")
-                except TimeoutError:
-                    print("Aviso: Falha na navegação pós-login. Provavelmente credenciais inválidas, problema de rede ou página travou.")
-                    await page.screenshot(path="login_failure_screenshot.png")
-                    print("Screenshot 'login_failure_screenshot.png' salvo para depuração.")
-                    return None # Indica falha no login, interrompe o processo.
-            else:
-                print("Já logado, pulando etapa de login.")
-
-            if config.pagina_raspagem and config.pagina_raspagem not in page.url:
-                print(f"Navegando para a página de raspagem: {config.pagina_raspagem}")
-                await page.goto(config.pagina_raspagem, timeout=60000)
-                await page.wait_for_load_state('networkidle', timeout=30000)
-
-            print("Aguardando pela tabela de dados...")
-            table_selector = 'table[role="grid"]'
-            thead_selector = '#form-minhas-cotacoes\:tbFretes_head'
-            
-            try:
-                await expect(page.locator(thead_selector)).to_be_visible(timeout=30000)
-                print("Tabela encontrada.")
-                headers = [th.strip() for th in await page.locator(f'{thead_selector} th').all_text_contents() if th.strip()]
-                rows = await page.locator(f'{table_selector} tbody tr').all()
-                print(f"Encontrado {len(rows)} linhas na tabela.")
-
-                for row_element in rows:
-                    cols_text = await row_element.locator('td').all_text_contents()
-                    cols = [col.strip() for col in cols_text][1:]
-                    
-                    if len(cols) == len(headers):
-                        row_data = dict(zip(headers, cols))
-                        scraped_data.append(row_data)
-                    else:
-                        print(f"Aviso: Linha pulada por ter contagem de colunas diferente. Esperado {len(headers)}, encontrado {len(cols)}.")
-            except (TimeoutError, AssertionError) as e:
-                print(f"ERRO: Tabela de dados ('{thead_selector}') não encontrada após o tempo de espera. Salvando screenshot e HTML para depuração.")
-                print(f"Playwright Error: {e}")
-                await page.screenshot(path="rpa_error_screenshot.png")
-                html_content = await page.content()
-                with open("rpa_task_processor_error.log", "w", encoding='utf-8') as f:
-                    f.write(html_content)
-                print("Artefatos de depuração ('rpa_error_screenshot.png', 'rpa_task_processor_error.log') salvos.")
-                return [] # Retorna uma lista vazia para indicar que não há dados, sem ser um erro fatal
-        
-        except Exception as e:
-            print("--- ERRO FATAL NO RPA SERVICE ---")
-            import traceback
-            print(traceback.format_exc())
-            print("---------------------------------")
-            await page.screenshot(path="error_screenshot.png")
-            print("Screenshot 'error_screenshot.png' salvo para depuração.")
-            return None  # Sinaliza falha
-
+            yield page, context
         finally:
             print("Fechando navegador.")
             await browser.close()
+
+async def _abrir_grade_cotacoes(page: Page, context, config: dict, sessao: Optional[dict]) -> bool:
+    """
+    Leva a página até a grade de cotações, fazendo login se o site pedir.
+    Retorna False (após salvar artefatos de depuração) se a tabela não aparecer.
+    Raises: FalhaRaspagem se o login não for concluído.
+    """
+    url_acesso = config.get("url_acesso")
+    usuario_site = config.get("usuario_site")
+    senha_site = config.get("senha_site")
+    filial = config.get("filial")
+    pagina_raspagem = config.get("pagina_raspagem")
+    storage_state = config.get("storage_state")
+
+    # Com sessão salva, vai direto à grade; se ela tiver expirado o site redireciona para o login
+    destino = pagina_raspagem if storage_state and pagina_raspagem else url_acesso
+    await page.goto(destino, timeout=60000, wait_until='domcontentloaded')
     
-    if scraped_data:
-        print(f"Raspagem concluída. Total de {len(scraped_data)} linhas. Filtrando por 'Situação' == 'PENDENTE' ou 'APROVADO'...")
-        filtered_data = [row for row in scraped_data if row.get('Situação') in ['PENDENTE', 'APROVADO']]
-        print(f"Encontrado {len(filtered_data)} linhas após filtro.")
-        return filtered_data
+    is_on_login_page = "login.xhtml" in page.url
+    
+    if is_on_login_page:
+        print("Página de login detectada. Iniciando processo de login...")
+        username_selector = "#j_username"
+        password_selector = "#j_password"
+        login_button_selector = "#btLoginId"
+        
+        await page.fill(username_selector, usuario_site)
+        await page.fill(password_selector, senha_site)
+
+        if filial:
+            await page.locator("#filial_label").click()
+            await page.get_by_role("option", name=filial).click()
+        
+        await page.click(login_button_selector)
+        
+        try:
+            # Wait for navigation away from the login page (i.e., 'login.xhtml' should no longer be in the URL)
+            await page.wait_for_url(lambda url: "login.xhtml" not in url, timeout=30000, wait_until='domcontentloaded')
+            print("Navegação pós-login bem-sucedida.")
+            if sessao is not None:
+                sessao["new_storage_state"] = await context.storage_state()
+        except TimeoutError:
+            print("Aviso: Falha na navegação pós-login. Provavelmente credenciais inválidas, problema de rede ou página travou.")
+            await page.screenshot(path="login_failure_screenshot.png")
+            print("Screenshot 'login_failure_screenshot.png' salvo para depuração.")
+            raise FalhaRaspagem("Falha no login do site da Fertipar.")
+    else:
+        print("Sessão salva válida, pulando etapa de login.")
+
+    if pagina_raspagem and pagina_raspagem not in page.url:
+        print(f"Navegando para a página de raspagem: {pagina_raspagem}")
+        await page.goto(pagina_raspagem, timeout=60000, wait_until='domcontentloaded')
+
+    print("Aguardando pela tabela de dados...")
+    try:
+        await expect(page.locator(THEAD_COTACOES)).to_be_visible(timeout=30000)
+        print("Tabela encontrada.")
+        return True
+    except (TimeoutError, AssertionError) as e:
+        print(f"ERRO: Tabela de dados ('{THEAD_COTACOES}') não encontrada após o tempo de espera. Salvando screenshot e HTML para depuração.")
+        print(f"Playwright Error: {e}")
+        await page.screenshot(path="rpa_error_screenshot.png")
+        html_content = await page.content()
+        with open("rpa_task_processor_error.log", "w", encoding='utf-8') as f:
+            f.write(html_content)
+        print("Artefatos de depuração ('rpa_error_screenshot.png', 'rpa_task_processor_error.log') salvos.")
+        return False
+
+async def _raspar_cotacoes(page, context, config: dict, sessao: Optional[dict]):
+    """Login (se preciso) e leitura da grade de cotações na página informada (ver iter_fertipar_rows)."""
+    try:
+        if not await _abrir_grade_cotacoes(page, context, config, sessao):
+            return # Nenhuma linha, sem ser um erro fatal
+
+        async for linhas in _ler_paginas(page, f'{THEAD_COTACOES} th', LINHAS_COTACOES):
+            for row in linhas:
+                if row.get('Situação') in SITUACOES_RASPAGEM:
+                    yield row
+    
+    except FalhaRaspagem:
+        raise
+    except Exception as e:
+        print("--- ERRO FATAL NO RPA SERVICE ---")
+        print(traceback.format_exc())
+        print("---------------------------------")
+        await page.screenshot(path="error_screenshot.png")
+        print("Screenshot 'error_screenshot.png' salvo para depuração.")
+        raise
+
+def _situacao_final(texto: Optional[str]) -> Optional[str]:
+    texto = (texto or '').upper()
+    return next((final for final in SITUACOES_FINAIS if final in texto), None)
+
+async def _ler_situacoes(page: Page) -> Dict[Tuple[str, str], str]:
+    """Lê a grade inteira (todas as páginas) e retorna {(protocolo, pedido): situação}."""
+    situacoes = {}
+    async for linhas in _ler_paginas(page, f'{THEAD_COTACOES} th', LINHAS_COTACOES):
+        for row in linhas:
+            situacoes[(row.get('Protocolo', ''), row.get('Pedido', ''))] = row.get('Situação', '').strip().upper()
+    return situacoes
+
+async def _recarregar_grade(page: Page, context, config: dict, sessao: Optional[dict]):
+    await page.reload(wait_until='domcontentloaded')
+    if "login.xhtml" in page.url:
+        print("[MONITOR] Sessão expirada; entrando novamente.")
+        if not await _abrir_grade_cotacoes(page, context, config, sessao):
+            raise FalhaRaspagem("Grade de cotações não encontrada após novo login.")
+        return
+    await expect(page.locator(THEAD_COTACOES)).to_be_visible(timeout=30000)
+
+async def renovar_sessao(config: dict, sessao: dict, browser_pool=None) -> bool:
+    """
+    Keep-alive: abre a grade de cotações com a sessão salva, o que renova o tempo ocioso da
+    sessão no servidor. Se ela já tiver expirado, faz o login e deixa o novo estado em
+    sessao["new_storage_state"]. Retorna True se a sessão salva ainda era aceita.
+
+    Raises:
+        FalhaRaspagem: Login não concluído ou grade não encontrada.
+    """
+    async with _pagina_cotacoes(config, browser_pool) as (page, context):
+        if not await _abrir_grade_cotacoes(page, context, config, sessao):
+            raise FalhaRaspagem("Grade de cotações não encontrada.")
+        return "new_storage_state" not in sessao
+
+async def monitorar_situacoes(config: dict, pares: Iterable[Tuple[str, str]],
+                              prazo_segundos: float = MONITOR_PRAZO_S, sessao: Optional[dict] = None,
+                              browser_pool=None, ao_ler: Optional[Callable[[dict], Awaitable[Optional[bool]]]] = None,
+                              intervalo_inicial: float = MONITOR_INTERVALO_INICIAL_S,
+                              intervalo_maximo: float = MONITOR_INTERVALO_MAXIMO_S
+                              ) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Acompanha a 'Situação' de vários pares (protocolo, pedido) na grade de cotações até
+    todos chegarem a uma situação final (SITUACOES_FINAIS) ou o prazo acabar.
+
+    Cada rodada lê a grade uma única vez e atualiza todos os pares. Entre as rodadas a
+    espera cresce exponencialmente (com jitter) enquanto nada muda e volta ao intervalo
+    inicial quando alguma situação muda (com intervalo_inicial == intervalo_maximo, a
+    espera é fixa).
+
+    Args:
+        config (dict): Configuração do robô (ver montar_config_rpa em app.py).
+        pares: Pares (protocolo, pedido) a acompanhar.
+        prazo_segundos (float): Tempo máximo de monitoramento.
+        sessao (dict, opcional): Ver iter_fertipar_rows.
+        browser_pool (BrowserPool, opcional): Ver iter_fertipar_rows.
+        ao_ler (corrotina, opcional): Chamada após cada rodada com {par: situação atual};
+            se retornar True, o monitoramento termina (ex.: o conjunto de pares mudou).
+        intervalo_inicial (float): Espera após uma rodada em que alguma situação mudou.
+        intervalo_maximo (float): Teto da espera enquanto nada muda.
+
+    Returns:
+        dict: {par: situação final}; para os pares não finalizados no prazo, a última
+              situação lida (None se o par nunca apareceu na grade).
+
+    Raises:
+        ValueError: Configuração ausente.
+        FalhaRaspagem: Login não concluído ou grade não encontrada.
+    """
+    if not config:
+        raise ValueError("Configuration object is required.")
+    situacoes = {(str(protocolo), str(pedido)): None for protocolo, pedido in pares}
+    pendentes = set(situacoes)
+    if not pendentes:
+        return situacoes
+
+    loop = asyncio.get_running_loop()
+    prazo = loop.time() + prazo_segundos
+    intervalo = intervalo_inicial
+
+    async with _pagina_cotacoes(config, browser_pool) as (page, context):
+        if not await _abrir_grade_cotacoes(page, context, config, sessao):
+            raise FalhaRaspagem("Grade de cotações não encontrada.")
+        rodada = 0
+        while True:
+            rodada += 1
+            lidas = await _ler_situacoes(page)
+            mudou = False
+            for par in list(pendentes):
+                atual = lidas.get(par)
+                if atual != situacoes[par]:
+                    mudou = True
+                    situacoes[par] = atual
+                if _situacao_final(atual):
+                    situacoes[par] = _situacao_final(atual)
+                    pendentes.discard(par)
+            print(f"[MONITOR] Rodada {rodada}: {len(situacoes) - len(pendentes)}/{len(situacoes)} pares com situação final.")
+            parar = ao_ler is not None and await ao_ler(dict(situacoes))
+
+            restante = prazo - loop.time()
+            if not pendentes or parar:
+                break
+            if restante <= 0:
+                print(f"[MONITOR] Prazo de {prazo_segundos}s esgotado com {len(pendentes)} pares pendentes.")
+                break
+
+            intervalo = intervalo_inicial if mudou else min(intervalo * MONITOR_FATOR_BACKOFF, intervalo_maximo)
+            espera = min(intervalo * random.uniform(1 - MONITOR_JITTER, 1 + MONITOR_JITTER), restante)
+            print(f"[MONITOR] Próxima leitura em {espera:.1f}s.")
+            await asyncio.sleep(espera)
+            await _recarregar_grade(page, context, config, sessao)
+
+    return situacoes
+
+async def monitor_agendamento_status(config: dict, protocolo: str, pedido: str,
+                                     prazo_segundos: float = MONITOR_PRAZO_S, browser_pool=None) -> dict:
+    """
+    Monitors the status of a specific order on the Fertipar website until it is
+    'APROVADO' or 'RECUSADO' (ou até o prazo; ver monitorar_situacoes).
+    """
+    sessao = {}
+    try:
+        resultado = await monitorar_situacoes(config, [(protocolo, pedido)], prazo_segundos, sessao, browser_pool)
+    except ValueError:
+        raise
+    except Exception:
+        return {"success": False, "status": "ERRO", "message": traceback.format_exc()}
 
-    return scraped_data
+    situacao = resultado[(str(protocolo), str(pedido))]
+    new_storage_state = sessao.get("new_storage_state")
+    if situacao == "APROVADO":
+        return {"success": True, "status": "APROVADO", "new_storage_state": new_storage_state}
+    if situacao == "RECUSADO":
+        return {"success": False, "status": "RECUSADO", "message": "O agendamento foi recusado.", "new_storage_state": new_storage_state}
+    return {"success": False, "status": "TIMEOUT", "new_storage_state": new_storage_state,
+            "message": f"Situação não finalizada em {prazo_segundos}s (última: {situacao or 'não encontrada na grade'})."}
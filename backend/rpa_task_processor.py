@@ -3,8 +3,23 @@ import traceback
 import asyncio
 from datetime import datetime
 from playwright.async_api import async_playwright, Page, expect, TimeoutError
+from primefaces import aguardar_ajax, aguardar_ajax_apos
+from perfil_navegador import PERFIL_ENXUTO, perfil_efetivo, opcoes_lancamento, hosts_da_configuracao, aplicar_perfil_enxuto
 import re
-import re
+
+# Perfil 'seguro' (ConfiguracaoRobo.perfil_espera): mantém as esperas fixas antigas para
+# quando o site estiver instável. O perfil 'rapido' espera pelos sinais de AJAX do PrimeFaces.
+PERFIL_SEGURO = "seguro"
+ESPERA_SEGURA_PESQUISA_MS = 2000
+ESPERA_SEGURA_SALVAR_MS = 3000
+ATRASO_SEGURO_DIGITACAO_MS = 150
+SLOW_MO_SEGURO_MS = 50
+
+COTACOES_URL = "https://sisferweb.fertipar.com.br/logistica/paginas/cotacoesTransportadora/index.xhtml"
+COTACOES_HOST = "sisferweb.fertipar.com.br"
+
+# Mensagens (growl) exibidas pelo site após o 'Salvar'
+MENSAGEM_POS_SALVAR = re.compile(r'Agendamento realizado com sucesso|Carga indispon[ií]vel para', re.IGNORECASE)
 
 # Helper function (no changes needed here)
 async def try_locate_and_screenshot(page_object, context_frame_or_page, locators_with_names, element_description):
@@ -23,18 +38,201 @@ async def try_locate_and_screenshot(page_object, context_frame_or_page, locators
             print(f"  [FALHA] Seletor '{locator_description}' falhou. Erro: {e}")
     raise Exception(f"Elemento '{element_description}' não foi encontrado por nenhum dos seletores fornecidos.")
 
+# --- Mapa de campos do formulário 'Agendar Pedido' ---
+# Campos de texto: (rótulo no formulário, origem em rpa_params, chave). A origem 'telefone'
+# é o telefone da configuração já separado em DDD e número.
+CAMPOS_TEXTO = [
+    ("Contato*", "config", "contato"),
+    ("DDD*", "telefone", "ddd"),
+    ("Telefone*", "telefone", "numero"),
+    ("Placa*", "caminhao", "placa"),
+    ("Placa Reboque 1*", "caminhao", "placa_reboque1"),
+    ("Placa Reboque 2", "caminhao", "placa_reboque2"),
+    ("Placa Reboque 3", "caminhao", "placa_reboque3"),
+]
+
+# Dropdowns PrimeFaces (selectOneMenu): (descrição, id do componente, chave em rpa_params["caminhao"]).
+# Podem disparar AJAX e re-renderizar o formulário, por isso são selecionados um a um.
+CAMPOS_DROPDOWN = [
+    ("UF da Placa", "form-minhas-cotacoes:uf-placa", "uf"),
+    ("Tipo de Carroceria", "form-minhas-cotacoes:tipoCarroceria", "tipo_carroceria"),
+    ("UF Reboque 1", "form-minhas-cotacoes:uf-reboque", "uf1"),
+    ("UF Reboque 2", "form-minhas-cotacoes:uf-reboque-2", "uf2"),
+    ("UF Reboque 3", "form-minhas-cotacoes:uf-reboque-3", "uf3"),
+]
+
+# Preenche vários inputs (localizados pelo <label>) em uma única ida ao navegador.
+# Retorna os rótulos que não puderam ser preenchidos.
+_PREENCHER_INPUTS_JS = """
+(campos) => {
+    const labels = Array.from(document.querySelectorAll('label'));
+    return campos.filter(({rotulo, valor}) => {
+        const label = labels.find(l => l.textContent.trim() === rotulo);
+        const input = label && (label.htmlFor ? document.getElementById(label.htmlFor) : label.querySelector('input'));
+        if (!input || input.disabled || input.readOnly) return true;
+        input.focus();
+        input.value = valor;
+        input.dispatchEvent(new Event('input', {bubbles: true}));
+        input.dispatchEvent(new Event('change', {bubbles: true}));
+        input.blur();
+        return false;
+    }).map(c => c.rotulo);
+}
+"""
+
+# Lê o valor atual dos inputs pelo <label> ({rótulo: valor|null}).
+_LER_INPUTS_JS = """
+(rotulos) => {
+    const labels = Array.from(document.querySelectorAll('label'));
+    return Object.fromEntries(rotulos.map(rotulo => {
+        const label = labels.find(l => l.textContent.trim() === rotulo);
+        const input = label && (label.htmlFor ? document.getElementById(label.htmlFor) : label.querySelector('input'));
+        return [rotulo, input ? input.value : null];
+    }));
+}
+"""
+
+def _normalizar_valor(valor):
+    # Máscaras do site inserem pontuação (ex.: placa 'ABC-1234'); compara só letras e dígitos
+    return re.sub(r'\W', '', valor or '').upper()
+
+def _valores_campos_texto(config: dict, caminhao: dict) -> dict:
+    """Resolve o mapa CAMPOS_TEXTO em {rótulo: valor}, omitindo os campos vazios."""
+    telefone = {}
+    telefone_completo = config.get("telefone")
+    if telefone_completo:
+        match = re.search(r'\((\d{2})\)\s*(.*)', telefone_completo)
+        if match:
+            telefone = {"ddd": match.group(1), "numero": match.group(2).strip()}
+        else:
+            print(f"[INFO] Formato de 'Telefone' inválido. Pulando. Valor: {telefone_completo}")
+    origens = {"config": config, "caminhao": caminhao, "telefone": telefone}
+
+    valores = {}
+    for rotulo, origem, chave in CAMPOS_TEXTO:
+        valor = origens[origem].get(chave)
+        if valor:
+            valores[rotulo] = valor
+        else:
+            print(f"[INFO] Campo '{rotulo}' vazio no JSON. Pulando.")
+    return valores
+
+async def _preencher_campo_texto(page: Page, rotulo: str, valor: str):
+    try:
+        await page.get_by_role("textbox", name=rotulo).fill(valor)
+        print(f"[SUCESSO] Campo '{rotulo}' preenchido com: {valor}")
+    except TimeoutError:
+        print(f"[FALHA] Campo '{rotulo}' não encontrado ou não editável. Valor: {valor}")
+
+async def _preencher_formulario(page: Page, config: dict, caminhao: dict, perfil_seguro: bool = False):
+    """
+    Preenche o formulário de agendamento. Os inputs de texto vão em lote em um único
+    script na página; os dropdowns são selecionados em sequência aguardando o AJAX de
+    cada um. No fim os inputs são conferidos e os divergentes preenchidos um a um.
+    No perfil seguro todos os inputs são preenchidos individualmente.
+    """
+    valores = _valores_campos_texto(config, caminhao)
+
+    # O formulário é aberto por AJAX após 'Agendar Pedido'; o script em lote precisa dele já no DOM
+    try:
+        await expect(page.get_by_role("textbox", name="Placa*")).to_be_visible(timeout=10000)
+    except AssertionError:
+        print("[AVISO] Formulário de agendamento não ficou visível no tempo esperado.")
+
+    if perfil_seguro:
+        pendentes = list(valores)
+    else:
+        campos = [{"rotulo": rotulo, "valor": valor} for rotulo, valor in valores.items()]
+        pendentes = await page.evaluate(_PREENCHER_INPUTS_JS, campos)
+        print(f"[INFO] {len(campos) - len(pendentes)} campo(s) de texto preenchido(s) em lote.")
+
+    for descricao, componente, chave in CAMPOS_DROPDOWN:
+        valor = caminhao.get(chave)
+        if not valor:
+            print(f"[INFO] Campo '{descricao}' vazio no JSON. Pulando.")
+            continue
+        try:
+            await page.locator(f"[id='{componente}_label']").click()
+            await page.locator(f"//li[@data-label='{valor}']").click()
+            if not perfil_seguro:
+                await aguardar_ajax(page, timeout=10000)
+            print(f"[SUCESSO] {descricao} selecionado(a): {valor}")
+        except TimeoutError:
+            print(f"[FALHA] Não foi possível selecionar {descricao}: {valor}")
+
+    if not perfil_seguro:
+        # Um AJAX de dropdown pode ter re-renderizado inputs já preenchidos
+        atuais = await page.evaluate(_LER_INPUTS_JS, list(valores))
+        pendentes = [rotulo for rotulo, valor in valores.items()
+                     if _normalizar_valor(atuais.get(rotulo)) != _normalizar_valor(valor)]
+        if pendentes:
+            print(f"[INFO] Campos a preencher individualmente: {pendentes}")
+
+    for rotulo in pendentes:
+        await _preencher_campo_texto(page, rotulo, valores[rotulo])
+
 # --- 1. Refatorar a assinatura da função ---
-async def process_agendamento_main_task(rpa_params: dict, run_headless: bool = True):
+async def process_agendamento_main_task(rpa_params: dict, run_headless: bool = True, browser_pool=None):
     """
     Processa um agendamento no site da Fertipar usando Playwright,
     recebendo todos os parâmetros em um único dicionário.
+
+    Se `browser_pool` (BrowserPool) for informado, o agendamento roda em um contexto
+    aquecido do pool e o navegador permanece vivo ao final; caso contrário um
+    Chromium é iniciado e fechado nesta chamada.
     """
+    config = rpa_params.get("config", {})
+    storage_state = rpa_params.get("storage_state") # Novo: extrair storage_state
+
+    if browser_pool is not None:
+        async with browser_pool.contexto(storage_state=storage_state) as context:
+            page = context.pages[0] if context.pages else await context.new_page()
+            if perfil_efetivo(config) == PERFIL_ENXUTO:
+                await aplicar_perfil_enxuto(context, hosts_da_configuracao(config) | {COTACOES_HOST})
+            return await _executar_agendamento(page, context, rpa_params)
+
+    async with async_playwright() as playwright:
+        # Determina o modo headless com base na configuração 'head_evento' do JSON.
+        # head_evento: true (mostrar tela) -> headless=False
+        # head_evento: false (rodar em background) -> headless=True
+        mostrar_tela = config.get('head_evento', False)
+        run_headless_mode = not mostrar_tela
+        
+        print(f"Configuração 'head_evento' é {mostrar_tela}. Modo headless do navegador: {run_headless_mode}.")
+
+        slow_mo = SLOW_MO_SEGURO_MS if config.get('perfil_espera') == PERFIL_SEGURO else 0
+        browser = await playwright.chromium.launch(**opcoes_lancamento(config, slow_mo=slow_mo))
+        # Novo: Inicializa o contexto com o storage_state se ele existir
+        context = await browser.new_context(storage_state=storage_state if storage_state else {})
+        page = await context.new_page()
+        if perfil_efetivo(config) == PERFIL_ENXUTO:
+            print("[INFO] Perfil de navegador enxuto: imagens, fontes, mídia e terceiros bloqueados.")
+            await aplicar_perfil_enxuto(context, hosts_da_configuracao(config) | {COTACOES_HOST})
+
+        try:
+            return await _executar_agendamento(page, context, rpa_params)
+        finally:
+            # O navegador será fechado automaticamente ao finalizar a automação.
+            if browser.is_connected():
+                if run_headless_mode:
+                    print("Finalizando automação e fechando o navegador.")
+                    await browser.close()
+                else:
+                    print("Automação concluída. Pressione Enter no console para fechar o navegador...")
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(None, input)
+                    await browser.close()
+            else:
+                print("Automação finalizada. O navegador já foi desconectado.")
+
+
+async def _executar_agendamento(page: Page, context, rpa_params: dict):
+    """Executa o fluxo de agendamento em uma página já aberta."""
     # --- Extrair dados do dicionário rpa_params ---
     config = rpa_params.get("config", {})
     agenda_item = rpa_params.get("agenda", {})
     motorista = rpa_params.get("motorista", {})
     caminhao = rpa_params.get("caminhao", {})
-    storage_state = rpa_params.get("storage_state") # Novo: extrair storage_state
 
     url_login = config.get("url_acesso")
     filial = config.get("filial")
@@ -54,390 +252,263 @@ async def process_agendamento_main_task(rpa_params: dict, run_headless: bool = T
     
     masked_cpf = mask_cpf_for_assertion(nro_cpf)
     
-    placa_principal = caminhao.get("placa")
+    perfil_seguro = config.get("perfil_espera") == PERFIL_SEGURO
 
     print(f"Iniciando automação para Protocolo: {protocolo_procurado}, Pedido: {pedido_procurado}, CPF: {nro_cpf}")
 
-    async with async_playwright() as playwright:
-        # Determina o modo headless com base na configuração 'head_evento' do JSON.
-        # head_evento: true (mostrar tela) -> headless=False
-        # head_evento: false (rodar em background) -> headless=True
-        mostrar_tela = config.get('head_evento', False)
-        run_headless_mode = not mostrar_tela
-        
-        print(f"Configuração 'head_evento' é {mostrar_tela}. Modo headless do navegador: {run_headless_mode}.")
-
-        browser = await playwright.chromium.launch(headless=run_headless_mode, slow_mo=50, args=["--start-fullscreen"])
-        # Novo: Inicializa o contexto com o storage_state se ele existir
-        context = await browser.new_context(storage_state=storage_state if storage_state else {})
-        page = await context.new_page()
-
-        new_storage_state = None # Será preenchido se um novo login for realizado
+    new_storage_state = None # Será preenchido se um novo login for realizado
 
+    try:
+        print("--- Iniciando verificação de sessão e login condicional ---")
+        cotacoes_url = COTACOES_URL
+        
+        # Navegue para a página de cotações para verificar o estado da sessão
+        await page.goto(cotacoes_url, timeout=60000) # Increased timeout for initial navigation
+        
+        # Verifique se o elemento de login está visível. Se sim, a sessão é inválida.
+        login_needed = False
         try:
-            print("--- Iniciando verificação de sessão e login condicional ---")
-            cotacoes_url = "https://sisferweb.fertipar.com.br/logistica/paginas/cotacoesTransportadora/index.xhtml"
-            
-            # Navegue para a página de cotações para verificar o estado da sessão
-            await page.goto(cotacoes_url, timeout=60000) # Increased timeout for initial navigation
-            
-            # Verifique se o elemento de login está visível. Se sim, a sessão é inválida.
-            login_needed = False
+            # Usar um seletor que é único da página de login
+            await expect(page.locator("#filial_label")).to_be_visible(timeout=5000)
+            login_needed = True
+            print("[INFO] Elemento de login encontrado. Sessão inválida ou expirada.")
+        except (TimeoutError, AssertionError):
+            print("[INFO] Elemento de login NÃO encontrado. Sessão provavelmente ativa.")
+            # Adicionalmente, verificar se a página de destino (dashboard) está correta
             try:
-                # Usar um seletor que é único da página de login
-                await expect(page.locator("#filial_label")).to_be_visible(timeout=5000)
-                login_needed = True
-                print("[INFO] Elemento de login encontrado. Sessão inválida ou expirada.")
-            except (TimeoutError, AssertionError):
-                print("[INFO] Elemento de login NÃO encontrado. Sessão provavelmente ativa.")
-                # Adicionalmente, verificar se a página de destino (dashboard) está correta
-                try:
-                    await expect(page.get_by_role("grid").first).to_be_visible(timeout=5000)
-                    print("[INFO] Grid do dashboard encontrado. Sessão ativa e na página correta.")
-                except TimeoutError:
-                    print("[WARN] Grid do dashboard NÃO encontrado. A sessão pode estar ativa mas em uma página inesperada. Tentando login.")
-                    login_needed = True # Force login if dashboard not found, even if login elements weren't initially visible.
-
-            if login_needed:
-                print("[INFO] Realizando novo login...")
-                # --- ETAPA DE LOGIN COMPLETA (existente) ---
-                await page.goto(url_login, timeout=60000)
-                await page.locator("#filial_label").click()
-                await page.get_by_role("option", name=filial).click()
-                await page.get_by_role("textbox", name="Usuário").fill(usuario_site)
-                await page.get_by_role("textbox", name="Senha").fill(senha_site)
-                await page.get_by_role("button", name=" Acessar").click()
+                await expect(page.get_by_role("grid").first).to_be_visible(timeout=5000)
+                print("[INFO] Grid do dashboard encontrado. Sessão ativa e na página correta.")
+            except TimeoutError:
+                print("[WARN] Grid do dashboard NÃO encontrado. A sessão pode estar ativa mas em uma página inesperada. Tentando login.")
+                login_needed = True # Force login if dashboard not found, even if login elements weren't initially visible.
+
+        if login_needed:
+            print("[INFO] Realizando novo login...")
+            # --- ETAPA DE LOGIN COMPLETA (existente) ---
+            await page.goto(url_login, timeout=60000)
+            await page.locator("#filial_label").click()
+            await page.get_by_role("option", name=filial).click()
+            await page.get_by_role("textbox", name="Usuário").fill(usuario_site)
+            await page.get_by_role("textbox", name="Senha").fill(senha_site)
+            await page.get_by_role("button", name=" Acessar").click()
+            if perfil_seguro:
                 await page.wait_for_load_state('networkidle', timeout=30000)
-                print("Login realizado com sucesso.")
-
-                # Após login, navegue e verifique novamente a página de cotações
-                await page.goto(cotacoes_url, timeout=30000)
-                await expect(page.get_by_role("grid").first).to_be_visible(timeout=10000)
-                print("[SUCESSO] Navegação para 'Minhas Cotações' após novo login.")
-
-                # Capture o novo estado da sessão
-                new_storage_state = await context.storage_state()
             else:
-                print("[SUCESSO] Sessão ativa e na página correta. Prosseguindo sem login.")
-            
-            print(f"Procurando pelo protocolo: {protocolo_procurado} e pedido: {pedido_procurado}...")
+                await page.wait_for_url(lambda url: "login.xhtml" not in url, timeout=30000, wait_until='domcontentloaded')
+            print("Login realizado com sucesso.")
+
+            # Após login, navegue e verifique novamente a página de cotações
+            await page.goto(cotacoes_url, timeout=30000)
+            await expect(page.get_by_role("grid").first).to_be_visible(timeout=10000)
+            print("[SUCESSO] Navegação para 'Minhas Cotações' após novo login.")
+
+            # Capture o novo estado da sessão
+            new_storage_state = await context.storage_state()
+        else:
+            print("[SUCESSO] Sessão ativa e na página correta. Prosseguindo sem login.")
+        
+        print(f"Procurando pelo protocolo: {protocolo_procurado} e pedido: {pedido_procurado}...")
+        
+        linha_do_item = page.locator(f'//tr[contains(., "{protocolo_procurado}") and contains(., "{pedido_procurado}")]')
+        await expect(linha_do_item).to_be_visible(timeout=10000)
+
+        # --- LÓGICA DE VERIFICAÇÃO DE STATUS INTEGRADA ---
+        print("\n--- Verificando Status do Agendamento antes de prosseguir ---")
+        # A coluna 'Situação' é a 5ª (índice 4)
+        status_cell = linha_do_item.locator('td').nth(4)
+        status_text = (await status_cell.inner_text()).strip().upper()
+        print(f"[INFO] Status encontrado na página: '{status_text}'")
+
+        if "APROVADO" not in status_text:
+            message = f"O agendamento não pode prosseguir. Status atual: '{status_text}'."
+            print(f"[FALHA] {message}")
+            return {
+                "success": False, 
+                "status": "falhou", # Status unificado de falha
+                "message": message, 
+                "user_facing_message": message,
+                "new_storage_state": new_storage_state
+            }
+        
+        print("[SUCESSO] Status 'APROVADO'. Prosseguindo com o agendamento...")
+        # --- FIM DA VERIFICAÇÃO ---
+
+        if await linha_do_item.count() > 0:
+            print(f"Protocolo {protocolo_procurado} e Pedido {pedido_procurado} encontrados!")
+            botao_agendar = linha_do_item.locator(':text("Agendar Pedido")')
+            await botao_agendar.click()
             
-            linha_do_item = page.locator(f'//tr[contains(., "{protocolo_procurado}") and contains(., "{pedido_procurado}")]')
-            await expect(linha_do_item).to_be_visible(timeout=10000)
-
-            # --- LÓGICA DE VERIFICAÇÃO DE STATUS INTEGRADA ---
-            print("\n--- Verificando Status do Agendamento antes de prosseguir ---")
-            # A coluna 'Situação' é a 5ª (índice 4)
-            status_cell = linha_do_item.locator('td').nth(4)
-            status_text = (await status_cell.inner_text()).strip().upper()
-            print(f"[INFO] Status encontrado na página: '{status_text}'")
-
-            if "APROVADO" not in status_text:
-                message = f"O agendamento não pode prosseguir. Status atual: '{status_text}'."
-                print(f"[FALHA] {message}")
-                return {
-                    "success": False, 
-                    "status": "falhou", # Status unificado de falha
-                    "message": message, 
-                    "user_facing_message": message,
-                    "new_storage_state": new_storage_state
-                }
+            # --- PREENCHIMENTO DO FORMULÁRIO A PARTIR DO MAPA DE CAMPOS ---
+            print("\n--- Iniciando preenchimento de dados do veículo e contato ---")
+            await _preencher_formulario(page, config, caminhao, perfil_seguro)
+
+            # Continuação do fluxo original...
+            element_to_click = page.locator("[id=\"form-minhas-cotacoes:j_idt126\"]")
+            await expect(element_to_click).to_be_visible(timeout=10000)
+            await element_to_click.click()
+
+            print("\nProcurando pelo iframe 'Cadastro de Motorista Autônomo'...")
+            iframe_motorista = page.locator("iframe[title=\"Cadastro de Motorista Autônomo\"]")
+            await expect(iframe_motorista).to_be_visible(timeout=15000)
+            iframe_content = iframe_motorista.content_frame
+            iframe_frame = await (await iframe_motorista.element_handle()).content_frame()
+
+            campo_cpf_iframe = await try_locate_and_screenshot(
+                page_object=page,
+                context_frame_or_page=iframe_content,
+                locators_with_names=[
+                    # Novas tentativas de localização mais robustas
+                    (iframe_content.locator("input[id*='Cpf']"), "CSS: input[id*='Cpf'] (partial ID)"),
+                    (iframe_content.locator("input[name*='Cpf']"), "CSS: input[name*='Cpf'] (partial name)"),
+                    (iframe_content.locator("input[id*='cpf']"), "CSS: input[id*='cpf'] (partial ID lowercase)"),
+                    (iframe_content.locator("input[name*='cpf']"), "CSS: input[name*='cpf'] (partial name lowercase)"),
+                    # Locators originais
+                    (iframe_content.get_by_role("textbox", name="___.___.___-__"), "get_by_role(\"textbox\", name=\"___.___.___-__\")"),
+                    (iframe_content.get_by_placeholder("Nro.Cpf"), "get_by_placeholder(\"Nro.Cpf\")")
+                ],
+                element_description="Campo 'Nro.Cpf'"
+            )
+            await expect(campo_cpf_iframe).to_be_editable(timeout=10000)
             
-            print("[SUCESSO] Status 'APROVADO'. Prosseguindo com o agendamento...")
-            # --- FIM DA VERIFICAÇÃO ---
-
-            if await linha_do_item.count() > 0:
-                print(f"Protocolo {protocolo_procurado} e Pedido {pedido_procurado} encontrados!")
-                botao_agendar = linha_do_item.locator(':text("Agendar Pedido")')
-                await botao_agendar.click()
-                
-                # --- LÓGICA DE PREENCHIMENTO DE FORMULÁRIO REFINADA COM VALIDAÇÕES ---
-                print("\n--- Iniciando preenchimento de dados do veículo e contato ---")
-                
-                # Preencher Contato
-                contato_val = config.get("contato")
-                if contato_val:
-                    try:
-                        await page.get_by_role("textbox", name="Contato*").fill(contato_val)
-                        print(f"[SUCESSO] Campo 'Contato*' preenchido com: {contato_val}")
-                    except TimeoutError:
-                        print(f"[FALHA] Campo 'Contato*' não encontrado ou não editável. Valor: {contato_val}")
-                else:
-                    print("[INFO] Campo 'Contato' vazio no JSON. Pulando.")
-                
-                # Preencher DDD e Telefone
-                telefone_completo = config.get("telefone")
-                if telefone_completo:
-                    match = re.search(r'\((\d{2})\)\s*(.*)', telefone_completo)
-                    if match:
-                        ddd, numero = match.group(1), match.group(2).strip()
-                        try:
-                            await page.get_by_role("textbox", name="DDD*").fill(ddd)
-                            print(f"[SUCESSO] Campo 'DDD*' preenchido com: {ddd}")
-                            await page.get_by_role("textbox", name="Telefone*").fill(numero)
-                            print(f"[SUCESSO] Campo 'Telefone*' preenchido com: {numero}")
-                        except TimeoutError:
-                             print(f"[FALHA] Campos 'DDD*' ou 'Telefone*' não encontrados. Valores: DDD={ddd}, Telefone={numero}")
-                    else:
-                        print(f"[INFO] Formato de 'Telefone' inválido. Pulando. Valor: {telefone_completo}")
-                else:
-                    print("[INFO] Campo 'Telefone' vazio no JSON. Pulando.")
-                
-                # Preencher Placa Principal
-                placa_principal = caminhao.get("placa")
-                if placa_principal:
-                    try:
-                        await page.get_by_role("textbox", name="Placa*").fill(placa_principal)
-                        print(f"[SUCESSO] Campo 'Placa*' preenchido com: {placa_principal}")
-                    except TimeoutError:
-                        print(f"[FALHA] Campo 'Placa*' não encontrado ou não editável. Valor: {placa_principal}")
-                else:
-                    print("[INFO] Campo 'Placa' principal vazio no JSON. Pulando.")
-
-                # Selecionar UF da Placa (Dropdown)
-                uf_placa = caminhao.get("uf")
-                if uf_placa:
-                    try:
-                        await page.locator("[id='form-minhas-cotacoes:uf-placa_label']").click()
-                        await page.locator(f"//li[@data-label='{uf_placa}']").click()
-                        print(f"[SUCESSO] UF da Placa selecionada: {uf_placa}")
-                    except TimeoutError:
-                        print(f"[FALHA] Não foi possível selecionar a UF da Placa: {uf_placa}")
-                else:
-                    print("[INFO] Campo 'UF' da placa principal vazio no JSON. Pulando.")
+            # Preenchendo o CPF: digitação direta conferida contra a máscara; lenta apenas se a máscara perder caracteres
+            print(f"Preenchendo o campo CPF com: {nro_cpf}")
+            if perfil_seguro:
+                await campo_cpf_iframe.type(nro_cpf, delay=ATRASO_SEGURO_DIGITACAO_MS)
+            else:
+                await campo_cpf_iframe.type(nro_cpf)
+                try:
+                    await expect(campo_cpf_iframe).to_have_value(masked_cpf, timeout=2000)
+                except AssertionError:
+                    print("[INFO] Máscara do CPF não acompanhou a digitação rápida. Redigitando lentamente...")
+                    await campo_cpf_iframe.fill("")
+                    await campo_cpf_iframe.type(nro_cpf, delay=ATRASO_SEGURO_DIGITACAO_MS)
+            print("[SUCESSO] Campo CPF preenchido.")
+
+            # Clicar no botão 'Pesquisar'
+            botao_pesquisar_iframe = iframe_content.get_by_role("button", name=" Pesquisar")
+            await expect(botao_pesquisar_iframe).to_be_visible(timeout=5000)
+            if perfil_seguro:
+                await botao_pesquisar_iframe.click()
+                # Aguardar um momento para os resultados da pesquisa aparecerem
+                await page.wait_for_timeout(ESPERA_SEGURA_PESQUISA_MS)
+            else:
+                # Aguarda a resposta parcial do JSF da pesquisa e a atualização do iframe
+                await aguardar_ajax_apos(page, botao_pesquisar_iframe.click, timeout=15000, frame=iframe_frame)
+            print("Botão 'Pesquisar' foi clicado após preencher o CPF.")
+
+            # --- LÓGICA CONDICIONAL: TENTAR 'SELECIONAR' E, SE FALHAR, TENTAR 'SIM' ---
+            botao_selecionar = iframe_content.get_by_role("button", name=" Selecionar")
+            botao_sim = iframe_content.get_by_role("button", name=" Sim")
+            print("Tentando clicar no botão 'Selecionar'...")
+            if perfil_seguro:
+                try:
+                    await expect(botao_selecionar).to_be_visible(timeout=7000) # Aumentar timeout para dar tempo da busca acontecer
+                    selecionar_visivel = True
+                except AssertionError:
+                    selecionar_visivel = False
+            else:
+                # Espera por qualquer um dos dois botões em vez de esgotar o timeout do primeiro
+                await expect(botao_selecionar.or_(botao_sim).first).to_be_visible(timeout=7000)
+                selecionar_visivel = await botao_selecionar.is_visible()
+            if selecionar_visivel:
+                await botao_selecionar.click()
+                print("[SUCESSO] Botão 'Selecionar' clicado.")
+            else:
+                # Se 'Selecionar' não aparecer, pode ser que o motorista já esteja cadastrado
+                # e o sistema pergunte diretamente para confirmar
+                print("[INFO] Botão 'Selecionar' não encontrado. Tentando alternativa 'Sim'...")
+                await expect(botao_sim).to_be_visible(timeout=5000)
+                await botao_sim.click()
+                print("[SUCESSO] Botão 'Sim' clicado como alternativa.")
 
-                # Selecionar Tipo de Carroceria (Dropdown)
-                tipo_carroceria = caminhao.get("tipo_carroceria")
-                if tipo_carroceria:
-                    try:
-                        await page.locator("[id='form-minhas-cotacoes:tipoCarroceria_label']").click()
-                        await page.locator(f"//li[@data-label='{tipo_carroceria}']").click()
-                        print(f"[SUCESSO] Tipo de Carroceria selecionado: {tipo_carroceria}")
-                    except TimeoutError:
-                        print(f"[FALHA] Não foi possível selecionar o Tipo de Carroceria: {tipo_carroceria}")
-                else:
-                    print("[INFO] Campo 'Tipo de Carroceria' vazio no JSON. Pulando.")
-                
-                # Preencher Placa Reboque 1
-                placa_reboque1 = caminhao.get("placa_reboque1")
-                if placa_reboque1:
-                    try:
-                        await page.get_by_role("textbox", name="Placa Reboque 1*").fill(placa_reboque1)
-                        print(f"[SUCESSO] Campo 'Placa Reboque 1*' preenchido com: {placa_reboque1}")
-                    except TimeoutError:
-                        print(f"[FALHA] Campo 'Placa Reboque 1*' não encontrado. Valor: {placa_reboque1}")
-                else:
-                    print("[INFO] Campo 'Placa Reboque 1' vazio no JSON. Pulando.")
-                
-                # Selecionar UF Reboque 1 (Dropdown)
-                uf1 = caminhao.get("uf1")
-                if uf1:
-                    try:
-                        await page.locator("[id='form-minhas-cotacoes:uf-reboque_label']").click() # Corrected locator
-                        await page.locator(f"//li[@data-label='{uf1}']").click()
-                        print(f"[SUCESSO] UF Reboque 1 selecionada: {uf1}")
-                    except TimeoutError:
-                        print(f"[FALHA] Não foi possível selecionar a UF Reboque 1: {uf1}")
-                else:
-                    print("[INFO] Campo 'UF Reboque 1' vazio no JSON. Pulando.")
-                
-                # Preencher Placa Reboque 2
-                placa_reboque2 = caminhao.get("placa_reboque2")
-                if placa_reboque2:
-                    try:
-                        await page.get_by_role("textbox", name="Placa Reboque 2").fill(placa_reboque2)
-                        print(f"[SUCESSO] Campo 'Placa Reboque 2*' preenchido com: {placa_reboque2}")
-                    except TimeoutError:
-                        print(f"[FALHA] Campo 'Placa Reboque 2*' não encontrado. Valor: {placa_reboque2}")
-                else:
-                    print("[INFO] Campo 'Placa Reboque 2' vazio no JSON. Pulando.")
+            print("Automação de agendamento concluída com sucesso.")
 
-                # Selecionar UF Reboque 2 (Dropdown)
-                uf2 = caminhao.get("uf2")
-                if uf2:
-                    try:
-                        await page.locator("[id='form-minhas-cotacoes:uf-reboque-2_label']").click()
-                        await page.locator(f"//li[@data-label='{uf2}']").click()
-                        print(f"[SUCESSO] UF Reboque 2 selecionada: {uf2}")
-                    except TimeoutError:
-                        print(f"[FALHA] Não foi possível selecionar a UF Reboque 2: {uf2}")
-                else:
-                    print("[INFO] Campo 'UF Reboque 2' vazio no JSON. Pulando.")
+            # --- LÓGICA CONDICIONAL PARA SALVAR O AGENDAMENTO ---
+            modo_execucao = config.get("modo_execucao", "producao") # Default para 'producao' se não for especificado
 
-                # Preencher Placa Reboque 3
-                placa_reboque3 = caminhao.get("placa_reboque3")
-                if placa_reboque3:
-                    try:
-                        await page.get_by_role("textbox", name="Placa Reboque 3").fill(placa_reboque3)
-                        print(f"[SUCESSO] Campo 'Placa Reboque 3*' preenchido com: {placa_reboque3}")
-                    except TimeoutError:
-                        print(f"[FALHA] Campo 'Placa Reboque 3*' não encontrado. Valor: {placa_reboque3}")
+            salvar_button = page.get_by_role("button", name=" Salvar")
+            await expect(salvar_button).to_be_visible(timeout=5000)
+            
+            if modo_execucao == "teste":
+                print("\n[MODO TESTE] EVENTO EM TESTE - NAO ESTA AGENDANDO!")
+                print("[MODO TESTE] O botão 'Salvar' foi identificado, mas não será clicado.")
+            else:
+                print("\n[MODO PRODUCAO] EVENTO EM PRODUCAO - EFETUANDO AGENDANDAMENTO!")
+                if perfil_seguro:
+                    await salvar_button.click(force=True)
+                    # Espera um pouco para a página reagir e exibir a mensagem de sucesso ou erro.
+                    await page.wait_for_timeout(ESPERA_SEGURA_SALVAR_MS)
                 else:
-                    print("[INFO] Campo 'Placa Reboque 3' vazio no JSON. Pulando.")
-
-                # Selecionar UF Reboque 3 (Dropdown)
-                uf3 = caminhao.get("uf3")
-                if uf3:
+                    await aguardar_ajax_apos(page, lambda: salvar_button.click(force=True), timeout=30000)
                     try:
-                        await page.locator("[id='form-minhas-cotacoes:uf-reboque-3_label']").click()
-                        await page.locator(f"//li[@data-label='{uf3}']").click()
-                        print(f"[SUCESSO] UF Reboque 3 selecionada: {uf3}")
-                    except TimeoutError:
-                        print(f"[FALHA] Não foi possível selecionar a UF Reboque 3: {uf3}")
-                else:
-                    print("[INFO] Campo 'UF Reboque 3' vazio no JSON. Pulando.")
+                        # A resposta do 'Salvar' é exibida em um growl do PrimeFaces
+                        await expect(page.get_by_text(MENSAGEM_POS_SALVAR).first).to_be_visible(timeout=10000)
+                    except AssertionError:
+                        print("[AVISO] Nenhuma mensagem conhecida exibida após salvar.")
+
+                # Para depuração, salva o estado da página neste momento crítico
+                # (um arquivo por protocolo, já que várias agendas podem rodar em paralelo)
+                await page.screenshot(path=f"post_save_check_{protocolo_procurado}.png")
                 
-                # Continuação do fluxo original...
-                element_to_click = page.locator("[id=\"form-minhas-cotacoes:j_idt126\"]")
-                await expect(element_to_click).to_be_visible(timeout=10000)
-                await element_to_click.click()
-
-                print("\nProcurando pelo iframe 'Cadastro de Motorista Autônomo'...")
-                iframe_motorista = page.locator("iframe[title=\"Cadastro de Motorista Autônomo\"]")
-                await expect(iframe_motorista).to_be_visible(timeout=15000)
-                iframe_content = iframe_motorista.content_frame
-
-                campo_cpf_iframe = await try_locate_and_screenshot(
-                    page_object=page,
-                    context_frame_or_page=iframe_content,
-                    locators_with_names=[
-                        # Novas tentativas de localização mais robustas
-                        (iframe_content.locator("input[id*='Cpf']"), "CSS: input[id*='Cpf'] (partial ID)"),
-                        (iframe_content.locator("input[name*='Cpf']"), "CSS: input[name*='Cpf'] (partial name)"),
-                        (iframe_content.locator("input[id*='cpf']"), "CSS: input[id*='cpf'] (partial ID lowercase)"),
-                        (iframe_content.locator("input[name*='cpf']"), "CSS: input[name*='cpf'] (partial name lowercase)"),
-                        # Locators originais
-                        (iframe_content.get_by_role("textbox", name="___.___.___-__"), "get_by_role(\"textbox\", name=\"___.___.___-__\")"),
-                        (iframe_content.get_by_placeholder("Nro.Cpf"), "get_by_placeholder(\"Nro.Cpf\")")
-                    ],
-                    element_description="Campo 'Nro.Cpf'"
-                )
-                await expect(campo_cpf_iframe).to_be_editable(timeout=10000)
-                
-                # Preenchendo o CPF lentamente
-                print(f"Preenchendo o campo CPF com: {nro_cpf}")
-                await campo_cpf_iframe.type(nro_cpf, delay=150) # Adiciona um delay de 150ms entre cada caractere
-                print("[SUCESSO] Campo CPF preenchido.")
-
-                # Clicar no botão 'Pesquisar'
-                botao_pesquisar_iframe = iframe_content.get_by_role("button", name=" Pesquisar")
-                await expect(botao_pesquisar_iframe).to_be_visible(timeout=5000)
-                await botao_pesquisar_iframe.click()
-                print("Botão 'Pesquisar' foi clicado após preencher o CPF.")
-
-                # Aguardar um momento para os resultados da pesquisa aparecerem
-                await page.wait_for_timeout(2000)
-
-                # --- LÓGICA CONDICIONAL: TENTAR 'SELECIONAR' E, SE FALHAR, TENTAR 'SIM' ---
-                try:
-                    # Tenta clicar em 'Selecionar' primeiro
-                    print("Tentando clicar no botão 'Selecionar'...")
-                    botao_selecionar = iframe_content.get_by_role("button", name=" Selecionar")
-                    await expect(botao_selecionar).to_be_visible(timeout=7000) # Aumentar timeout para dar tempo da busca acontecer
-                    await botao_selecionar.click()
-                    print("[SUCESSO] Botão 'Selecionar' clicado.")
-                except TimeoutError:
-                    # Se 'Selecionar' não aparecer, pode ser que o motorista já esteja cadastrado
-                    # e o sistema pergunte diretamente para confirmar
-                    print("[INFO] Botão 'Selecionar' não encontrado. Tentando alternativa 'Sim'...")
-                    botao_sim = iframe_content.get_by_role("button", name=" Sim")
-                    await expect(botao_sim).to_be_visible(timeout=5000)
-                    await botao_sim.click()
-                    print("[SUCESSO] Botão 'Sim' clicado como alternativa.")
-
-                print("Automação de agendamento concluída com sucesso.")
-
-                # --- LÓGICA CONDICIONAL PARA SALVAR O AGENDAMENTO ---
-                modo_execucao = config.get("modo_execucao", "producao") # Default para 'producao' se não for especificado
-
-                salvar_button = page.get_by_role("button", name=" Salvar")
-                await expect(salvar_button).to_be_visible(timeout=5000)
+                # Verifica o conteúdo da página em busca da mensagem de erro
+                page_content = await page.content()
                 
-                if modo_execucao == "teste":
-                    print("\n[MODO TESTE] EVENTO EM TESTE - NAO ESTA AGENDANDO!")
-                    print("[MODO TESTE] O botão 'Salvar' foi identificado, mas não será clicado.")
+                # Usamos regex para encontrar a mensagem de erro de forma flexível e case-insensitive
+                match_indisponivel = re.search(r'Carga indisponivel para.*', page_content, re.IGNORECASE)
+                match_sucesso = re.search(r'Agendamento realizado com sucesso', page_content, re.IGNORECASE)
+
+                if match_indisponivel:
+                    # A mensagem de carga indisponível foi encontrada no HTML
+                    error_message = match_indisponivel.group(0).strip()
+                    # Remove tags HTML da mensagem para log limpo
+                    error_message = re.sub('<[^<]+?>', '', error_message) 
+                    print(f"[FALHA NO AGENDAMENTO] Mensagem de erro encontrada no HTML: '{error_message}'")
+                    return {
+                        "success": False,
+                        "status": "falhou",
+                        "message": error_message,
+                        "user_facing_message": error_message,
+                        "new_storage_state": new_storage_state
+                    }
+                elif match_sucesso:
+                    # A mensagem de sucesso foi encontrada no HTML
+                    print("[SUCESSO] Agendamento realizado com sucesso detectado no conteúdo da página.")
+                    return {"success": True, "message": "Agendamento processado com sucesso.", "new_storage_state": new_storage_state}
                 else:
-                    print("\n[MODO PRODUCAO] EVENTO EM PRODUCAO - EFETUANDO AGENDANDAMENTO!")
-                    await salvar_button.click(force=True)
-                    # Espera um pouco para a página reagir e exibir a mensagem de sucesso ou erro.
-                    await page.wait_for_timeout(3000) 
-
-                    # Para depuração, salva o estado da página neste momento crítico
-                    await page.screenshot(path="post_save_check.png")
-                    
-                    # Verifica o conteúdo da página em busca da mensagem de erro
-                    page_content = await page.content()
-                    
-                    # Usamos regex para encontrar a mensagem de erro de forma flexível e case-insensitive
-                    match_indisponivel = re.search(r'Carga indisponivel para.*', page_content, re.IGNORECASE)
-                    match_sucesso = re.search(r'Agendamento realizado com sucesso', page_content, re.IGNORECASE)
-
-                    if match_indisponivel:
-                        # A mensagem de carga indisponível foi encontrada no HTML
-                        error_message = match_indisponivel.group(0).strip()
-                        # Remove tags HTML da mensagem para log limpo
-                        error_message = re.sub('<[^<]+?>', '', error_message) 
-                        print(f"[FALHA NO AGENDAMENTO] Mensagem de erro encontrada no HTML: '{error_message}'")
-                        return {
-                            "success": False,
-                            "status": "falhou",
-                            "message": error_message,
-                            "user_facing_message": error_message,
-                            "new_storage_state": new_storage_state
-                        }
-                    elif match_sucesso:
-                        # A mensagem de sucesso foi encontrada no HTML
-                        print("[SUCESSO] Agendamento realizado com sucesso detectado no conteúdo da página.")
-                        return {"success": True, "message": "Agendamento processado com sucesso.", "new_storage_state": new_storage_state}
-                    else:
-                        # Nenhuma mensagem específica de falha ou sucesso encontrada. 
-                        # Isso pode indicar um problema ou um status intermediário.
-                        print("[AVISO] Status de agendamento indeterminado. Conteúdo da página após salvar (parcial):\n" + page_content[:1000] + "...") # Imprime um trecho para depuração
-                        return {
-                            "success": False,
-                            "status": "erro",
-                            "message": "Não foi possível determinar o status do agendamento após salvar. Verifique o screenshot e o log.",
-                            "user_facing_message": "Não foi possível determinar o status do agendamento. Verifique o log para detalhes.",
-                            "new_storage_state": new_storage_state
-                        }
-
-                # O navegador será fechado automaticamente ao finalizar a automação.
-                # Este retorno final só será alcançado se nenhuma das condições acima for atendida
-                # (o que não deve acontecer com a nova lógica).
-            else:
-                message = f"Não há dados para pesquisar - motivo: sem agenda no site fertipar para Protocolo {protocolo_procurado} e Pedido {pedido_procurado}."
-                print(message)
-                return {"success": False, "message": message, "new_storage_state": new_storage_state}
+                    # Nenhuma mensagem específica de falha ou sucesso encontrada. 
+                    # Isso pode indicar um problema ou um status intermediário.
+                    print("[AVISO] Status de agendamento indeterminado. Conteúdo da página após salvar (parcial):\n" + page_content[:1000] + "...") # Imprime um trecho para depuração
+                    return {
+                        "success": False,
+                        "status": "erro",
+                        "message": "Não foi possível determinar o status do agendamento após salvar. Verifique o screenshot e o log.",
+                        "user_facing_message": "Não foi possível determinar o status do agendamento. Verifique o log para detalhes.",
+                        "new_storage_state": new_storage_state
+                    }
 
-        except Exception as e:
-            tb_str = traceback.format_exc()
-            error_log_message = f"--- ERRO RPA TASK PROCESSOR EM {datetime.now()} ---\n"
-            error_log_message += f"\nErro inesperado: {e}\n"
-            error_log_message += f"Traceback:\n{tb_str}\n"
-            
-            # Imprime o erro detalhado no console do Flask
-            print(error_log_message)
-            
-            user_facing_message = "Ocorreu um erro durante a automação. Verifique o console para mais detalhes."
-            if "Target page, context or browser has been closed" in tb_str:
-                user_facing_message = "O navegador foi fechado inesperadamente durante a automação."
-            elif isinstance(e, TimeoutError):
-                 user_facing_message = "A automação excedeu o tempo de espera por um elemento na página."
-
-            # Em caso de erro, o navegador será fechado automaticamente.
+            # O navegador será fechado automaticamente ao finalizar a automação.
+            # Este retorno final só será alcançado se nenhuma das condições acima for atendida
+            # (o que não deve acontecer com a nova lógica).
+        else:
+            message = f"Não há dados para pesquisar - motivo: sem agenda no site fertipar para Protocolo {protocolo_procurado} e Pedido {pedido_procurado}."
+            print(message)
+            return {"success": False, "message": message, "new_storage_state": new_storage_state}
+
+    except Exception as e:
+        tb_str = traceback.format_exc()
+        error_log_message = f"--- ERRO RPA TASK PROCESSOR EM {datetime.now()} ---\n"
+        error_log_message += f"\nErro inesperado: {e}\n"
+        error_log_message += f"Traceback:\n{tb_str}\n"
+        
+        # Imprime o erro detalhado no console do Flask
+        print(error_log_message)
+        
+        user_facing_message = "Ocorreu um erro durante a automação. Verifique o console para mais detalhes."
+        if "Target page, context or browser has been closed" in tb_str:
+            user_facing_message = "O navegador foi fechado inesperadamente durante a automação."
+        elif isinstance(e, TimeoutError):
+             user_facing_message = "A automação excedeu o tempo de espera por um elemento na página."
 
-            return {"success": False, "message": tb_str, "user_facing_message": user_facing_message, "new_storage_state": new_storage_state}
+        # Em caso de erro, o navegador será fechado automaticamente.
 
-        finally:
-            # O navegador será fechado automaticamente ao finalizar a automação.
-            if browser.is_connected():
-                if run_headless_mode:
-                    print("Finalizando automação e fechando o navegador.")
-                    await browser.close()
-                else:
-                    print("Automação concluída. Pressione Enter no console para fechar o navegador...")
-                    loop = asyncio.get_running_loop()
-                    await loop.run_in_executor(None, input)
-                    await browser.close()
-            else:
-                print("Automação finalizada. O navegador já foi desconectado.")
+        return {"success": False, "message": tb_str, "user_facing_message": user_facing_message, "new_storage_state": new_storage_state}
@@ -0,0 +1,426 @@
+# rpa_worker.py
+"""
+Worker do robô: consome a fila `rpa_job` e executa os agendamentos na Fertipar.
+
+Roda em um processo separado do Flask, com um único event loop e um BrowserPool
+de longa duração. Vários workers podem rodar em paralelo (inclusive em máquinas
+diferentes): a reserva de jobs usa SELECT ... FOR UPDATE SKIP LOCKED, a da agenda um
+UPDATE condicional ('espera'/'erro' -> 'processando') e fertipar_protocolo é único, então o
+mesmo formulário nunca é enviado duas vezes ao mesmo tempo.
+
+Também vigia a 'Situação' das agendas em espera/processamento na grade de cotações com
+monitorar_situacoes: uma leitura da grade por rodada atualiza todas elas de uma vez (um
+worker por banco), até cada uma chegar a APROVADO/RECUSADO.
+Com modo_execucao 'agendado', a grade é lida a cada poucos segundos e as agendas que
+ficam APROVADAS entram na fila na mesma rodada.
+
+E mantém viva a sessão salva (RpaSessao): pouco antes de ela expirar por ociosidade o
+robô abre a grade com ela; se já tiver expirado, faz o login antes da próxima agenda.
+
+Uso:
+    python rpa_worker.py [--intervalo 2] [--worker-id nome] [--intervalo-situacoes 60] [--intervalo-aprovacao 5]
+                         [--intervalo-sessao 60]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import traceback
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app import (app, db, Agenda, Motorista, Caminhao, ConfiguracaoRobo, RpaJob,
+                 montar_config_rpa, montar_rpa_params, carregar_storage_state, salvar_storage_state,
+                 aplicar_resultado_rpa, reivindicar_jobs, recuperar_jobs_orfaos, reservar_agenda,
+                 pares_monitorados, aplicar_situacoes_fertipar, enfileirar_aprovadas,
+                 registrar_uso_sessao, segundos_para_renovar_sessao)
+from browser_pool import BrowserPool
+from rpa_service import MONITOR_PRAZO_S, monitorar_situacoes, renovar_sessao
+from rpa_task_processor import process_agendamento_main_task, PERFIL_SEGURO, SLOW_MO_SEGURO_MS
+from perfil_navegador import opcoes_lancamento
+
+
+def _descartar_job(job, mensagem):
+    job.status = 'erro'
+    job.resultado = json.dumps({"success": False, "message": mensagem})
+    job.finalizado_em = datetime.now(timezone.utc)
+    db.session.commit()
+    print(f"[WORKER] Job {job.id} descartado: {mensagem}")
+
+
+def _preparar_job(job_id):
+    """
+    Reserva a agenda ('espera'/'erro' -> 'processando') e monta os parâmetros do robô.
+    Retorna (rpa_params, dev_mode) ou None se o job não deve rodar.
+    """
+    with app.app_context():
+        job = db.session.get(RpaJob, job_id)
+        agenda = db.session.get(Agenda, job.agenda_id) if job else None
+        config = db.session.query(ConfiguracaoRobo).first()
+        if not job or not agenda or not config:
+            if job:
+                _descartar_job(job, "Agenda ou configuração do robô não encontrada.")
+            return None
+
+        motorista = db.session.get(Motorista, agenda.motorista_id)
+        caminhao = db.session.get(Caminhao, agenda.caminhao_id)
+        if not motorista or not caminhao:
+            _descartar_job(job, "Motorista ou Caminhão da agenda não encontrados.")
+            return None
+
+        dev_mode = job.modo == 'dev'
+        if not reservar_agenda(agenda.id, 'processando (Dev)' if dev_mode else 'processando'):
+            db.session.rollback()
+            _descartar_job(job, f"Agenda não pode mais ser executada (status atual: {agenda.status}).")
+            return None
+        db.session.commit()
+        rpa_params = montar_rpa_params(agenda, config, motorista, caminhao, carregar_storage_state())
+        print("\n--- PARÂMETROS PARA EXECUÇÃO DO RPA (JSON) ---")
+        params_to_print = {k: v for k, v in rpa_params.items() if k != 'storage_state'}
+        params_to_print["config"] = {k: v for k, v in params_to_print["config"].items() if k != 'senha_site'}
+        print(json.dumps(params_to_print, indent=4))
+        print("--------------------------------------------\n")
+        return rpa_params, dev_mode
+
+
+def _finalizar_job(job_id, result, dev_mode, storage_state_usado):
+    """Persiste o retorno do robô na agenda, no job e (se houver) o novo estado de sessão."""
+    with app.app_context():
+        registrar_uso_sessao(storage_state_usado, expirada=bool(result.get('new_storage_state')))
+        salvar_storage_state(result.get('new_storage_state'))
+        job = db.session.get(RpaJob, job_id)
+        agenda = db.session.get(Agenda, job.agenda_id)
+        sucesso, mensagem = aplicar_resultado_rpa(agenda, result, dev_mode=dev_mode)
+        job.status = 'concluido' if sucesso else 'erro'
+        job.resultado = json.dumps({"success": sucesso, "status": agenda.status, "message": mensagem})
+        job.finalizado_em = datetime.now(timezone.utc)
+        db.session.commit()
+        print(f"[WORKER] Job {job_id} finalizado: {job.status} ({agenda.status}).")
+
+
+def _falhar_job(job_id, erro):
+    with app.app_context():
+        db.session.rollback()
+        job = db.session.get(RpaJob, job_id)
+        if not job or job.status != 'executando':
+            # _finalizar_job já gravou o resultado (ou o job foi devolvido/descartado): a exceção
+            # veio depois do commit e não pode desfazer um agendamento concluído
+            return
+        agenda = db.session.get(Agenda, job.agenda_id)
+        sufixo = ' (Dev)' if job.modo == 'dev' else ''
+        if agenda and agenda.status != 'agendado':
+            agenda.status = f'erro{sufixo}'
+            agenda.log_retorno = f"Erro inesperado no worker: {erro}"
+        job.status = 'erro'
+        job.resultado = json.dumps({"success": False, "message": "Erro interno ao executar a automação do robô."})
+        job.finalizado_em = datetime.now(timezone.utc)
+        db.session.commit()
+
+
+async def executar_job(job_id, pool):
+    try:
+        preparado = await asyncio.to_thread(_preparar_job, job_id)
+        if preparado is None:
+            return
+        rpa_params, dev_mode = preparado
+        result = await process_agendamento_main_task(rpa_params, browser_pool=pool)
+        await asyncio.to_thread(_finalizar_job, job_id, result, dev_mode, rpa_params.get("storage_state"))
+    except Exception as e:
+        print(f"[WORKER] Erro ao executar job {job_id}: {e}\n{traceback.format_exc()}")
+        await asyncio.to_thread(_falhar_job, job_id, e)
+
+
+def _opcoes_navegador():
+    with app.app_context():
+        config = db.session.query(ConfiguracaoRobo).first()
+        if not config:
+            return opcoes_lancamento({})
+        slow_mo = SLOW_MO_SEGURO_MS if config.perfil_espera == PERFIL_SEGURO else 0
+        return opcoes_lancamento(montar_config_rpa(config), slow_mo=slow_mo)
+
+
+def _reivindicar(worker_id, limite):
+    with app.app_context():
+        return reivindicar_jobs(worker_id, limite=limite)
+
+
+INTERVALO_RECUPERACAO_ORFAOS_S = 60
+
+
+def _recuperar_orfaos():
+    with app.app_context():
+        return recuperar_jobs_orfaos()
+
+
+def _limite_paralelismo():
+    with app.app_context():
+        config = db.session.query(ConfiguracaoRobo).first()
+        return max(1, config.max_execucoes_paralelas) if config else 1
+
+
+# --- Tarefas de um único worker por banco ---
+# Cada tarefa (vigia da grade, keep-alive da sessão) roda só no worker que segura o seu
+# advisory lock; o lock fica em uma conexão dedicada e cai junto com ela.
+CHAVE_LOCK_VIGIA = 7301
+CHAVE_LOCK_SESSAO = 7303
+_conexoes_lideranca = {}
+
+
+def _assumir_lideranca(chave, tarefa):
+    """True se este processo segura o advisory lock `chave` (tenta obtê-lo se ainda não tiver)."""
+    with app.app_context():
+        conexao = _conexoes_lideranca.get(chave)
+        if conexao is not None:
+            try:
+                conexao.execute(text("SELECT 1"))
+                conexao.commit()
+                return True
+            except Exception as e:
+                print(f"[WORKER] Conexão do lock de {tarefa} perdida: {e}")
+                conexao.invalidate()
+                del _conexoes_lideranca[chave]
+
+        conexao = db.engine.connect()
+        obtido = conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {"chave": chave}).scalar()
+        conexao.commit()
+        if not obtido:
+            conexao.close()
+            return False
+        _conexoes_lideranca[chave] = conexao
+        print(f"[WORKER] Este worker passou a cuidar de: {tarefa}.")
+        return True
+
+
+# --- Vigia de situações da grade ---
+INTERVALO_SITUACOES_MAXIMO_S = 600
+FATOR_BACKOFF_SITUACOES = 2
+JITTER_SITUACOES = 0.25  # ±25% em cada espera, para as leituras não baterem sempre no mesmo instante
+
+
+def _carregar_monitorados():
+    """(config do robô com storage_state, pares monitorados) ou None se o robô não está configurado."""
+    with app.app_context():
+        config = db.session.query(ConfiguracaoRobo).first()
+        if not config or not config.senha_site:
+            return None
+        return {**montar_config_rpa(config), "storage_state": carregar_storage_state()}, pares_monitorados()
+
+
+def _gravar_situacoes(situacoes, new_storage_state, storage_state_usado):
+    """
+    Grava as situações lidas e enfileira as agendas aprovadas.
+    Retorna (ids alterados, jobs criados, pares ainda monitorados).
+    """
+    with app.app_context():
+        registrar_uso_sessao(storage_state_usado, expirada=bool(new_storage_state))
+        salvar_storage_state(new_storage_state)
+        return aplicar_situacoes_fertipar(situacoes), enfileirar_aprovadas(), pares_monitorados()
+
+
+async def _vigiar_janela(pool, config_rpa, pares, intervalo_inicial, intervalo_maximo, fila_alterada):
+    """
+    Uma janela do vigia: monitorar_situacoes acompanha `pares` (uma leitura da grade por
+    rodada, gravada em lote) até todos chegarem a uma situação final, o prazo MONITOR_PRAZO_S
+    acabar ou o conjunto de agendas monitoradas mudar. Retorna True se alguma agenda mudou.
+    """
+    sessao = {}
+    storage_state_usado = config_rpa["storage_state"]
+    houve_mudanca = False
+
+    async def ao_ler(situacoes):
+        nonlocal storage_state_usado, houve_mudanca
+        lidas = {par: situacao for par, situacao in situacoes.items() if situacao is not None}
+        new_storage_state = sessao.pop("new_storage_state", None)
+        alterados, jobs, atuais = await asyncio.to_thread(_gravar_situacoes, lidas, new_storage_state, storage_state_usado)
+        if new_storage_state:
+            storage_state_usado = new_storage_state
+        print(f"[VIGIA] {len(lidas)}/{len(pares)} agendas encontradas na grade; {len(alterados)} atualizada(s).")
+        if jobs:
+            print(f"[VIGIA] {len(jobs)} agenda(s) aprovada(s) enviada(s) para a fila.")
+            fila_alterada.set()
+        houve_mudanca = houve_mudanca or bool(alterados)
+        if atuais != pares:
+            print("[VIGIA] O conjunto de agendas monitoradas mudou; reiniciando o monitoramento.")
+            houve_mudanca = True
+            return True
+        return False
+
+    await monitorar_situacoes(config_rpa, pares, MONITOR_PRAZO_S, sessao, pool, ao_ler,
+                              intervalo_inicial=intervalo_inicial, intervalo_maximo=intervalo_maximo)
+    return houve_mudanca
+
+
+async def vigiar_situacoes(pool, intervalo_base, intervalo_aprovacao, fila_alterada):
+    """
+    Acompanha a 'Situação' das agendas monitoradas com o motor de rpa_service
+    (monitorar_situacoes), em janelas de no máximo MONITOR_PRAZO_S: cada par deixa de ser
+    lido ao chegar a APROVADO/RECUSADO, e a espera entre leituras dobra enquanto nada muda.
+    No modo 'agendado' a espera fica fixa em `intervalo_aprovacao`: cargas aprovadas são
+    disputadas por ordem de chegada, e os jobs criados acordam o despacho na hora.
+
+    Entre as janelas (e após falhas) o vigia espera `intervalo`, que também dobra (até
+    INTERVALO_SITUACOES_MAXIMO_S) enquanto nada muda ou a leitura continua falhando.
+    """
+    intervalo = intervalo_base
+    while True:
+        try:
+            lider = await asyncio.to_thread(_assumir_lideranca, CHAVE_LOCK_VIGIA, "vigia da grade")
+            carregado = await asyncio.to_thread(_carregar_monitorados) if lider else None
+            if carregado:
+                config_rpa, pares = carregado
+                agendado = config_rpa["modo_execucao"] == 'agendado'
+                if pares:
+                    mudou = await _vigiar_janela(
+                        pool, config_rpa, pares,
+                        intervalo_aprovacao if agendado else intervalo_base,
+                        intervalo_aprovacao if agendado else INTERVALO_SITUACOES_MAXIMO_S,
+                        fila_alterada,
+                    )
+                else:
+                    # Nada a ler na grade, mas agendas já APROVADAS podem estar fora da fila
+                    _, jobs, _ = await asyncio.to_thread(_gravar_situacoes, {}, None, None)
+                    if jobs:
+                        print(f"[VIGIA] {len(jobs)} agenda(s) aprovada(s) enviada(s) para a fila.")
+                        fila_alterada.set()
+                    mudou = bool(jobs)
+                if agendado:
+                    intervalo = intervalo_aprovacao
+                else:
+                    intervalo = intervalo_base if mudou else min(intervalo * FATOR_BACKOFF_SITUACOES, INTERVALO_SITUACOES_MAXIMO_S)
+            else:
+                intervalo = intervalo_base
+        except Exception as e:
+            intervalo = min(intervalo * FATOR_BACKOFF_SITUACOES, INTERVALO_SITUACOES_MAXIMO_S)
+            print(f"[VIGIA] Falha ao ler as situações da grade: {e}. Nova tentativa em ~{intervalo}s.")
+        await asyncio.sleep(intervalo * random.uniform(1 - JITTER_SITUACOES, 1 + JITTER_SITUACOES))
+
+
+# --- Keep-alive da sessão ---
+def _carregar_sessao():
+    """(config do robô com storage_state, segundos até renovar a sessão) ou None sem configuração."""
+    with app.app_context():
+        config = db.session.query(ConfiguracaoRobo).first()
+        if not config or not config.senha_site:
+            return None
+        return {**montar_config_rpa(config), "storage_state": carregar_storage_state()}, segundos_para_renovar_sessao()
+
+
+def _gravar_sessao(valida, new_storage_state, storage_state_usado):
+    with app.app_context():
+        registrar_uso_sessao(storage_state_usado, expirada=not valida)
+        salvar_storage_state(new_storage_state)
+
+
+async def manter_sessao(pool, intervalo):
+    """
+    Renova a sessão salva quando ela fica ociosa por FRACAO_RENOVACAO_SESSAO da duração
+    medida. Se ela já tiver expirado, faz o login e reaquece o pool com o novo estado, para
+    que a primeira agenda depois de um período ocioso não pague o login.
+    """
+    while True:
+        espera = intervalo
+        try:
+            lider = await asyncio.to_thread(_assumir_lideranca, CHAVE_LOCK_SESSAO, "keep-alive da sessão")
+            carregado = await asyncio.to_thread(_carregar_sessao) if lider else None
+            if carregado:
+                config_rpa, restante = carregado
+                if restante <= 0:
+                    sessao = {}
+                    valida = await renovar_sessao(config_rpa, sessao, browser_pool=pool)
+                    await asyncio.to_thread(_gravar_sessao, valida, sessao.get("new_storage_state"), config_rpa["storage_state"])
+                    if valida:
+                        print("[SESSAO] Sessão renovada.")
+                    else:
+                        print("[SESSAO] Sessão havia expirado: novo login feito antes da próxima agenda.")
+                        await pool.aquecer(sessao["new_storage_state"])
+                else:
+                    espera = min(intervalo, restante)
+        except Exception as e:
+            print(f"[SESSAO] Falha ao renovar a sessão: {e}")
+        await asyncio.sleep(espera)
+
+
+async def main(intervalo, worker_id, intervalo_situacoes=60, intervalo_aprovacao=5, intervalo_sessao=60):
+    print(f"[WORKER] Iniciando worker '{worker_id}' (intervalo de {intervalo}s).")
+    recuperados = await asyncio.to_thread(_recuperar_orfaos)
+    if recuperados:
+        print(f"[WORKER] {recuperados} job(s) órfão(s) devolvido(s) à fila.")
+
+    # Um único navegador compartilhado: cada agenda roda em seu próprio contexto (aba isolada),
+    # então a falha de um formulário não derruba as outras execuções.
+    async with BrowserPool(max_browsers=1, launch_options=await asyncio.to_thread(_opcoes_navegador)) as pool:
+        with app.app_context():
+            storage_state = carregar_storage_state()
+        await pool.aquecer(storage_state)
+
+        fila_alterada = asyncio.Event()
+        tarefas = []
+        if intervalo_situacoes > 0:
+            tarefas.append(asyncio.create_task(vigiar_situacoes(pool, intervalo_situacoes, intervalo_aprovacao, fila_alterada)))
+        if intervalo_sessao > 0:
+            tarefas.append(asyncio.create_task(manter_sessao(pool, intervalo_sessao)))
+        try:
+            await _despachar(pool, intervalo, worker_id, fila_alterada)
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+
+async def _despachar(pool, intervalo, worker_id, fila_alterada):
+    em_execucao = set()
+    loop = asyncio.get_running_loop()
+    proxima_recuperacao = loop.time() + INTERVALO_RECUPERACAO_ORFAOS_S
+    while True:
+        # Jobs de workers que morreram depois da partida deste também voltam à fila
+        if loop.time() >= proxima_recuperacao:
+            proxima_recuperacao = loop.time() + INTERVALO_RECUPERACAO_ORFAOS_S
+            recuperados = await asyncio.to_thread(_recuperar_orfaos)
+            if recuperados:
+                print(f"[WORKER] {recuperados} job(s) órfão(s) devolvido(s) à fila.")
+
+        limite = await asyncio.to_thread(_limite_paralelismo)
+        # perfil_navegador/perfil_espera alterados na administração valem sem reiniciar o worker
+        opcoes = await asyncio.to_thread(_opcoes_navegador)
+        if opcoes != pool.launch_options:
+            await pool.reconfigurar(opcoes)
+        livres = limite - len(em_execucao)
+        if livres <= 0:
+            await asyncio.wait(em_execucao, return_when=asyncio.FIRST_COMPLETED)
+            continue
+
+        fila_alterada.clear()
+        job_ids = await asyncio.to_thread(_reivindicar, worker_id, livres)
+        if not job_ids:
+            # Acorda ao fim do intervalo, quando uma execução termina ou quando o vigia enfileira algo
+            aviso = asyncio.create_task(fila_alterada.wait())
+            await asyncio.wait({aviso, *em_execucao}, timeout=intervalo, return_when=asyncio.FIRST_COMPLETED)
+            aviso.cancel()
+            continue
+
+        for job_id in job_ids:
+            print(f"[WORKER] Executando job {job_id} ({len(em_execucao) + 1}/{limite} em paralelo)...")
+            tarefa = asyncio.create_task(executar_job(job_id, pool))
+            em_execucao.add(tarefa)
+            tarefa.add_done_callback(em_execucao.discard)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker da fila de execuções do robô Fertipar.")
+    parser.add_argument("--intervalo", type=float, default=float(os.getenv("RPA_WORKER_INTERVALO", 2)),
+                        help="Segundos entre consultas à fila quando ela está vazia.")
+    parser.add_argument("--worker-id", default=os.getenv("RPA_WORKER_ID", f"{socket.gethostname()}-{os.getpid()}"))
+    parser.add_argument("--intervalo-situacoes", type=float, default=float(os.getenv("RPA_INTERVALO_SITUACOES", 60)),
+                        help="Segundos entre leituras da grade para atualizar a situação das agendas (0 desliga).")
+    parser.add_argument("--intervalo-aprovacao", type=float, default=float(os.getenv("RPA_INTERVALO_APROVACAO", 5)),
+                        help="Segundos entre leituras da grade no modo 'agendado' (execução automática das aprovadas).")
+    parser.add_argument("--intervalo-sessao", type=float, default=float(os.getenv("RPA_INTERVALO_SESSAO", 60)),
+                        help="Segundos entre verificações do keep-alive da sessão do site (0 desliga).")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.intervalo, args.worker_id, args.intervalo_situacoes, args.intervalo_aprovacao,
+                         args.intervalo_sessao))
+    except KeyboardInterrupt:
+        print("[WORKER] Encerrado.")
@@ -31,6 +31,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const LAST_READ_KEY = 'lastFertiparRead';
     const FIVE_MINUTES_MS = 5 * 60 * 1000;
     const POLLING_INTERVAL_MS = 5000; // 5 segundos para o auto-refresh
+    const PAGE_SIZE_AGENDAS = 50; // Linhas pedidas por vez à API (a próxima página vem ao rolar até o fim)
+
+    // Estado da grade de agendas (filtros, ordenação e paginação ficam no servidor)
+    let ordenacaoGrid = '-data';
+    let proximoCursorGrid = null;
+    let geracaoGrid = 0; // Descarta respostas de cargas anteriores a uma mudança de filtro/ordem
 
     // --- Funções Auxiliares ---
     function getAuthHeaders() {
@@ -177,11 +183,22 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
-    // Nova função para buscar agendas, agora com filtros de ano e mês
-    async function fetchAgendasData(year, month) {
-        let url = `/api/agendas_agendadas?year=${year}&month=${month}`;
+    // Filtros de coluna da grade: { motorista: 'jo', status: 'agend', ... }
+    function filtrosDaGrade() {
+        const filtros = {};
+        $('#filter-row input[data-filtro]').each(function() {
+            const valor = $(this).val().trim();
+            if (valor) filtros[$(this).data('filtro')] = valor;
+        });
+        return filtros;
+    }
+
+    // Busca uma página de agendas do mês/ano com os filtros e a ordenação da grade
+    async function fetchAgendasData(year, month, cursor = null) {
+        const params = new URLSearchParams({ year, month, page_size: PAGE_SIZE_AGENDAS, sort: ordenacaoGrid, ...filtrosDaGrade() });
+        if (cursor) params.set('cursor', cursor);
         try {
-            const response = await fetch(url, { headers: getAuthHeaders() });
+            const response = await fetch(`/api/agendas_agendadas?${params}`, { headers: getAuthHeaders() });
             if (!response.ok) {
                 throw new Error(`Erro HTTP: ${response.status}`);
             }
@@ -189,75 +206,126 @@ document.addEventListener('DOMContentLoaded', function() {
         } catch (error) {
             console.error('Erro ao buscar agendas:', error);
             showAlert('Falha ao carregar agendas. Verifique sua conexão ou autenticação.', 'danger');
-            return [];
+            return { agendas: [], next_cursor: null, has_more: false };
         }
     }
 
-    // Nova função para renderizar as agendas no DOM
-    async function renderAgendas(agendas) { 
+    // Renderiza as agendas no DOM (substituindo a tabela ou anexando uma nova página)
+    async function renderAgendas(agendas, anexar = false) { 
         if (!agendasEmEsperaBody) return; // Se o elemento não existe na página, não faz nada
-        agendasEmEsperaBody.innerHTML = ''; // Limpa o conteúdo atual da tabela
+        if (!anexar) agendasEmEsperaBody.innerHTML = ''; // Limpa o conteúdo atual da tabela
 
-        if (agendas.length === 0) {
+        if (!anexar && agendas.length === 0) {
             agendasEmEsperaBody.innerHTML = '<tr><td colspan="9" class="text-center">Nenhuma agenda encontrada para o período selecionado.</td></tr>';
             return;
         }
 
         for (const agenda of agendas) { 
-            const row = agendasEmEsperaBody.insertRow();
-            
-            // Lógica de Status e Cor
-            let statusBadgeClass = 'badge-secondary'; // Cor padrão
-            let rowClass = ''; // Classe da linha
-            const status = agenda.status ? agenda.status.toLowerCase() : '';
-
-            if (status === 'agendado') {
-                statusBadgeClass = 'badge-success';
-            } else if (status.includes('erro') || status.includes('falhou')) { 
-                statusBadgeClass = 'badge-danger';
-                rowClass = 'table-danger'; // Vermelho para a linha toda
-            } else if (['processando', 'monitorando', 'aprovado_e_agendando'].some(s => status.includes(s))) {
-                statusBadgeClass = 'badge-info';
-            } else if (status === 'cancelado' || status === 'recusado') { 
-                statusBadgeClass = 'badge-warning';
-                if (status === 'recusado') {
-                    rowClass = 'table-warning'; // Amarelo para a linha toda
-                }
-            } else if (status === 'espera') {
-                statusBadgeClass = 'badge-primary';
-            }
+            preencherLinhaAgenda(agendasEmEsperaBody.insertRow(), agenda);
+        }
+    }
 
-            // Formata as informações do caminhão
-            let caminhaoDisplay = agenda.caminhao.placa || 'N/A';
-            if (agenda.caminhao.tipo_carroceria) {
-                caminhaoDisplay += ` - ${agenda.caminhao.tipo_carroceria}`;
-            }
-            if (agenda.caminhao.reboques && agenda.caminhao.reboques.length > 0) {
-                caminhaoDisplay += ` | ${agenda.caminhao.reboques.join(', ')}`;
-            }
+    // Linha no fim da tabela que pede a próxima página quando fica visível
+    const observadorFimGrade = window.IntersectionObserver
+        ? new IntersectionObserver((entradas) => {
+            if (entradas.some(entrada => entrada.isIntersecting)) carregarProximaPagina();
+        })
+        : null;
+
+    function atualizarLinhaCarregarMais() {
+        if (!agendasEmEsperaBody) return;
+        const existente = agendasEmEsperaBody.querySelector('tr.linha-carregar-mais');
+        if (existente) {
+            if (observadorFimGrade) observadorFimGrade.unobserve(existente);
+            existente.remove();
+        }
+        if (!proximoCursorGrid) return;
+
+        const row = agendasEmEsperaBody.insertRow();
+        row.className = 'linha-carregar-mais';
+        row.innerHTML = '<td colspan="9" class="text-center text-muted"><a href="#">Carregar mais agendas...</a></td>';
+        row.querySelector('a').addEventListener('click', (e) => {
+            e.preventDefault();
+            carregarProximaPagina();
+        });
+        if (observadorFimGrade) observadorFimGrade.observe(row);
+    }
 
-            row.className = rowClass; // Aplica a classe de cor na linha
-            row.innerHTML = `
-                <td>${agenda.data_agendamento}</td>
-                <td>${agenda.motorista}</td>
-                <td>${caminhaoDisplay}</td>
-                <td>${agenda.protocolo}</td>
-                <td>${agenda.pedido}</td>
-                <td>${agenda.destino}</td>
-                <td>${agenda.carga_solicitada !== null ? agenda.carga_solicitada : 'N/A'}</td>
-                <td><span class="badge ${statusBadgeClass}">${(agenda.status || '').toUpperCase()}</span></td>
-                <td>
-                    <button class="btn btn-sm btn-info btn-executar-agenda" title="Executar" data-id="${agenda.id}" ${status !== 'espera' ? 'disabled' : ''}><i class="fas fa-play"></i></button>
-                    <button class="btn btn-sm btn-danger btn-cancelar-agenda" title="Cancelar" data-id="${agenda.id}" ${status !== 'espera' ? 'disabled' : ''}><i class="fas fa-times"></i></button>
-                </td>
-            `;
-
-            const executeButton = row.querySelector('.btn-executar-agenda');
-            if (executeButton) {
-                executeButton.addEventListener('click', async () => {
-                    await executeAgenda(agenda.id);
-                });
+    let carregandoPagina = false;
+    async function carregarProximaPagina() {
+        if (carregandoPagina || !proximoCursorGrid) return;
+        carregandoPagina = true;
+        const geracao = geracaoGrid;
+        try {
+            const pagina = await fetchAgendasData(selectAnoFiltro.value, selectMesFiltro.value, proximoCursorGrid);
+            if (geracao !== geracaoGrid) return; // A grade foi recarregada enquanto a página chegava
+            await renderAgendas(pagina.agendas, true);
+            proximoCursorGrid = pagina.next_cursor;
+            atualizarLinhaCarregarMais();
+        } finally {
+            carregandoPagina = false;
+        }
+    }
+
+    // Preenche (ou atualiza) a linha da tabela de agendas com os dados de uma agenda
+    function preencherLinhaAgenda(row, agenda) {
+        // Lógica de Status e Cor
+        let statusBadgeClass = 'badge-secondary'; // Cor padrão
+        let rowClass = ''; // Classe da linha
+        const status = agenda.status ? agenda.status.toLowerCase() : '';
+
+        if (status === 'agendado') {
+            statusBadgeClass = 'badge-success';
+        } else if (status.includes('erro') || status.includes('falhou')) { 
+            statusBadgeClass = 'badge-danger';
+            rowClass = 'table-danger'; // Vermelho para a linha toda
+        } else if (['processando', 'monitorando', 'aprovado_e_agendando'].some(s => status.includes(s))) {
+            statusBadgeClass = 'badge-info';
+        } else if (status === 'cancelado' || status === 'recusado') { 
+            statusBadgeClass = 'badge-warning';
+            if (status === 'recusado') {
+                rowClass = 'table-warning'; // Amarelo para a linha toda
             }
+        } else if (status === 'espera') {
+            statusBadgeClass = 'badge-primary';
+        }
+
+        // Formata as informações do caminhão
+        let caminhaoDisplay = agenda.caminhao.placa || 'N/A';
+        if (agenda.caminhao.tipo_carroceria) {
+            caminhaoDisplay += ` - ${agenda.caminhao.tipo_carroceria}`;
+        }
+        if (agenda.caminhao.reboques && agenda.caminhao.reboques.length > 0) {
+            caminhaoDisplay += ` | ${agenda.caminhao.reboques.join(', ')}`;
+        }
+
+        row.className = rowClass; // Aplica a classe de cor na linha
+        row.dataset.id = agenda.id;
+        row.dataset.ordem = valorOrdenacao(agenda);
+        row.innerHTML = `
+            <td>${agenda.data_agendamento}</td>
+            <td>${agenda.motorista}</td>
+            <td>${caminhaoDisplay}</td>
+            <td>${agenda.protocolo}</td>
+            <td>${agenda.pedido}</td>
+            <td>${agenda.destino}</td>
+            <td>${agenda.carga_solicitada !== null ? agenda.carga_solicitada : 'N/A'}</td>
+            <td>
+                <span class="badge ${statusBadgeClass}">${(agenda.status || '').toUpperCase()}</span>
+                ${agenda.situacao_fertipar ? `<small class="text-muted d-block">${agenda.situacao_fertipar}</small>` : ''}
+            </td>
+            <td>
+                <button class="btn btn-sm btn-info btn-executar-agenda" title="${status.startsWith('erro') ? 'Executar novamente' : 'Executar'}" data-id="${agenda.id}" ${status !== 'espera' && !status.startsWith('erro') ? 'disabled' : ''}><i class="fas fa-play"></i></button>
+                <button class="btn btn-sm btn-danger btn-cancelar-agenda" title="Cancelar" data-id="${agenda.id}" ${status !== 'espera' ? 'disabled' : ''}><i class="fas fa-times"></i></button>
+                <button class="btn btn-sm ${agenda.prioridade > 0 ? 'btn-warning' : 'btn-outline-warning'} btn-prioridade-agenda" title="${agenda.prioridade > 0 ? 'Remover urgência' : 'Marcar como urgente'}" data-id="${agenda.id}" data-prioridade="${agenda.prioridade || 0}" ${status !== 'espera' ? 'disabled' : ''}><i class="fas fa-bolt"></i></button>
+            </td>
+        `;
+
+        const executeButton = row.querySelector('.btn-executar-agenda');
+        if (executeButton) {
+            executeButton.addEventListener('click', async () => {
+                await executeAgenda(agenda.id);
+            });
         }
     }
 
@@ -275,7 +343,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
 
-            const result = await response.json();
+            let result = await response.json();
+            if (response.status === 202 && result.job_id) {
+                showAlert(result.message || 'Agenda enviada para a fila do robô (DEV).', 'info');
+                result = await aguardarJob(result.job_id);
+            }
 
             if (result.success) {
                 showAlert(result.message || 'Comando RPA (DEV) executado com sucesso!', 'success');
@@ -306,6 +378,40 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Aguarda o worker do robô concluir um job enfileirado (resposta 202 dos endpoints de execução)
+    const JOB_POLLING_INTERVAL_MS = 3000;
+    // Um job que nem começou nesse tempo indica que o rpa_worker não está rodando
+    const JOB_MAX_ESPERA_FILA_MS = 60000;
+    const JOB_MAX_ESPERA_MS = 10 * 60000;
+    async function aguardarJob(jobId) {
+        const inicio = Date.now();
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, JOB_POLLING_INTERVAL_MS));
+            const response = await fetch(`/api/jobs/${jobId}`, { headers: getAuthHeaders() });
+            if (!response.ok) {
+                throw new Error(`Erro HTTP: ${response.status}`);
+            }
+            const { job } = await response.json();
+            if (job.status === 'concluido' || job.status === 'erro') {
+                const resultado = job.resultado || {};
+                return {
+                    success: job.status === 'concluido',
+                    status: resultado.status || job.agenda_status,
+                    message: resultado.message,
+                    user_facing_message: resultado.message
+                };
+            }
+
+            const decorrido = Date.now() - inicio;
+            if ((job.status === 'pendente' && decorrido >= JOB_MAX_ESPERA_FILA_MS) || decorrido >= JOB_MAX_ESPERA_MS) {
+                const message = job.status === 'pendente'
+                    ? `O job ${jobId} continua na fila: verifique se o worker do robô (rpa_worker.py) está em execução.`
+                    : `O job ${jobId} ainda está em execução; acompanhe o status da agenda na tabela.`;
+                return { success: false, status: job.status, message: message, user_facing_message: message };
+            }
+        }
+    }
+
     async function executeRpaTask(agenda) {
         try {
             const response = await fetch(`/api/agendas/execute/${agenda.id}`, {
@@ -314,6 +420,9 @@ document.addEventListener('DOMContentLoaded', function() {
             });
 
             const result = await response.json();
+            if (response.status === 202 && result.job_id) {
+                return await aguardarJob(result.job_id);
+            }
             return result; // Retorna o resultado JSON bruto do backend
         } catch (error) {
             console.error('Erro de conexão ao chamar executeRpaTask:', error);
@@ -543,14 +652,16 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     if (btnLerDadosFertipar) {
-        btnLerDadosFertipar.addEventListener('click', async function() {
+        btnLerDadosFertipar.addEventListener('click', async function(event) {
+            // Shift+clique ignora o cache do servidor e força uma nova leitura na Fertipar
+            const force = event.shiftKey ? '&force=1' : '';
             btnLerDadosFertipar.disabled = true;
             lastReadStatus.innerHTML = '<span class="text-info">Lendo dados...</span>';
             fertiparDataTableBody.innerHTML = '<tr><td colspan="11" class="text-center"><div class="spinner-border text-primary" role="status"><span class="sr-only">Carregando...</span></div></td></tr>';
 
             try {
                 const [fertiparResponse, agendasEmEspera] = await Promise.all([
-                    fetch('/api/scrape_fertipar_data', { headers: getAuthHeaders() }),
+                    fetch(`/api/scrape_fertipar_data?stream=1${force}`, { headers: getAuthHeaders() }),
                     fetchAgendasProcessarData()
                 ]);
 
@@ -561,22 +672,62 @@ document.addEventListener('DOMContentLoaded', function() {
                     return;
                 }
 
-                const result = await fertiparResponse.json();
+                if (!fertiparResponse.ok) {
+                    const result = await fertiparResponse.json();
+                    populateFertiparTable([], agendasEmEspera);
+                    showAlert(result.message || 'Ocorreu um erro desconhecido ao buscar os dados.', 'danger');
+                    lastReadStatus.innerHTML = '<span class="text-danger">Erro na leitura.</span>';
+                    return;
+                }
 
-                if (result.success) {
-                    if (result.data.length > 0) {
-                        populateFertiparTable(result.data, agendasEmEspera);
+                // Lê o NDJSON linha a linha e redesenha a tabela conforme as páginas da grade chegam
+                const rows = [];
+                let erro = null;
+                let renderPendente = null;
+                const agendarRender = () => {
+                    if (renderPendente) return;
+                    renderPendente = requestAnimationFrame(() => {
+                        renderPendente = null;
+                        populateFertiparTable(rows, agendasEmEspera);
+                        lastReadStatus.innerHTML = `<span class="text-info">Lendo dados... ${rows.length} cotação(ões) recebida(s).</span>`;
+                    });
+                };
+
+                const reader = fertiparResponse.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const linhas = buffer.split('\n');
+                    buffer = linhas.pop();
+                    for (const linha of linhas) {
+                        if (!linha.trim()) continue;
+                        const evento = JSON.parse(linha);
+                        if (evento.type === 'row') {
+                            rows.push(evento.data);
+                            agendarRender();
+                        } else if (evento.type === 'error') {
+                            erro = evento.message;
+                        }
+                    }
+                }
+
+                if (renderPendente) cancelAnimationFrame(renderPendente);
+                populateFertiparTable(rows, agendasEmEspera);
+
+                if (erro) {
+                    showAlert(erro || 'Ocorreu um erro desconhecido ao buscar os dados.', 'danger');
+                    lastReadStatus.innerHTML = '<span class="text-danger">Erro na leitura.</span>';
+                } else {
+                    if (rows.length > 0) {
                         showAlert('Dados Fertipar lidos com sucesso!', 'success');
                     } else {
-                        populateFertiparTable([], agendasEmEspera);
-                        showAlert(result.message || 'Não há dados de cotação disponíveis no momento.', 'info');
+                        showAlert('Nenhuma cotação disponível no momento.', 'info');
                     }
                     localStorage.setItem(LAST_READ_KEY, new Date().toISOString());
                     updateLastReadStatus();
-                } else {
-                    populateFertiparTable([], agendasEmEspera);
-                    showAlert(result.message || 'Ocorreu um erro desconhecido ao buscar os dados.', 'danger');
-                    lastReadStatus.innerHTML = '<span class="text-danger">Erro na leitura.</span>';
                 }
             } catch (error) {
                 console.error('Erro ao ler dados Fertipar:', error);
@@ -752,37 +903,6 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // --- Lógica de Agendamento (Subgrid) ---
-    async function startStatusMonitoring(protocolo, pedido) {
-        showAlert(`Iniciando monitoramento de status para Protocolo ${protocolo}...`, 'info', true);
-    
-        try {
-            const response = await fetch('/api/agendas/monitor_status', {
-                method: 'POST',
-                headers: getAuthHeaders(),
-                body: JSON.stringify({ protocolo: protocolo, pedido: pedido }),
-            });
-    
-            const result = await response.json();
-    
-            if (result.success) {
-                showAlert(`Protocolo ${protocolo}: APROVADO! Iniciando agendamento...`, 'success', true);
-                updateTableRowStatus(protocolo, pedido, 'aprovado_e_agendando'); // A new temporary status
-                return true; // Indicate success to proceed with scheduling
-            } else {
-                const finalStatus = result.status || 'erro'; // 'RECUSADO' or 'ERRO'
-                const message = result.message || `O monitoramento falhou ou o item foi recusado.`;
-                showAlert(`Protocolo ${protocolo}: ${finalStatus}. ${message}`, 'danger', true);
-                updateTableRowStatus(protocolo, pedido, finalStatus.toLowerCase());
-                return false; // Indicate failure
-            }
-        } catch (error) {
-            console.error('Erro de conexão durante o monitoramento de status:', error);
-            showAlert('Erro de conexão com o servidor durante o monitoramento. Verifique o console.', 'danger', true);
-            updateTableRowStatus(protocolo, pedido, 'erro');
-            return false; // Indicate failure
-        }
-    }
-
     async function agendarViaSubgrid(button) {
         const subgridContent = $(button).closest('.subgrid-content');
         const mainRow = subgridContent.closest('.fertipar-subgrid-row').prev('.fertipar-main-row');
@@ -888,24 +1008,35 @@ document.addEventListener('DOMContentLoaded', function() {
     const btnAgendarTodos = document.getElementById('btnAgendarTodos');
     if (btnAgendarTodos) {
         btnAgendarTodos.addEventListener('click', async function() {
+            if (!confirm('Enviar TODAS as agendas em espera para execução do robô?')) {
+                return;
+            }
+            btnAgendarTodos.disabled = true;
             try {
-                showAlert('Iniciando o processamento de "Agendar Todos". Verifique o console do navegador para os detalhes.', 'info'); // Alerta moderno
-                
-                const agendas = await fetchAgendasProcessarData();
-                if (agendas.length === 0) {
-                    showAlert('Nenhuma agenda em espera para agendar.', 'info');
+                // O worker executa as agendas em paralelo (limite definido em Configurações do Robô)
+                const response = await fetch('/api/agendas/execute_batch', {
+                    method: 'POST',
+                    headers: getAuthHeaders(),
+                    body: JSON.stringify({}),
+                });
+
+                if (response.status === 401) {
+                    showAlert('Sessão expirada ou inválida. Por favor, faça login novamente.', 'danger');
                     return;
                 }
 
-                // Imprime os dados formatados em JSON no console do navegador
-                console.log('Dados das Agendas em Espera (JSON):');
-                console.log(JSON.stringify(agendas, null, 2));
-                
-                showAlert(`Foram encontrados ${agendas.length} agendas em espera. Dados impressos no console.`, 'success');
-
+                const result = await response.json();
+                if (result.success) {
+                    showAlert(result.message || 'Agendas enviadas para a fila do robô.', 'success');
+                } else {
+                    showAlert(result.message || 'Nenhuma agenda em espera para agendar.', 'info');
+                }
+                await loadAndRenderAgendas();
             } catch (error) {
                 console.error('Erro ao agendar todos:', error);
                 showAlert('Erro ao processar as agendas em espera. Verifique o console para mais detalhes.', 'danger');
+            } finally {
+                btnAgendarTodos.disabled = false;
             }
         });
     }
@@ -941,7 +1072,33 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // --- Event listener para os botões de cancelar ---
+    // --- Urgência: agendas com prioridade maior saem antes da fila do robô ---
+    async function alternarPrioridadeAgenda(agendaId, prioridadeAtual) {
+        try {
+            const response = await fetch(`/api/agenda/${agendaId}/prioridade`, {
+                method: 'PUT',
+                headers: getAuthHeaders(),
+                body: JSON.stringify({ prioridade: prioridadeAtual > 0 ? 0 : 1 }),
+            });
+
+            if (response.status === 401) {
+                showAlert('Sessão expirada ou inválida. Por favor, faça login novamente.', 'danger');
+                return;
+            }
+
+            const result = await response.json();
+            if (result.success) {
+                loadAndRenderAgendas();
+            } else {
+                showAlert('Erro ao alterar prioridade: ' + (result.message || 'Erro desconhecido'), 'danger');
+            }
+        } catch (error) {
+            console.error('Erro de conexão ao alterar prioridade:', error);
+            showAlert('Erro de conexão ao alterar prioridade.', 'danger');
+        }
+    }
+
+    // --- Event listener para os botões de cancelar e de urgência ---
     if (agendasEmEsperaBody) {
         agendasEmEsperaBody.addEventListener('click', function(event) {
             const target = event.target.closest('.btn-cancelar-agenda');
@@ -951,6 +1108,10 @@ document.addEventListener('DOMContentLoaded', function() {
                     deleteAgenda(agendaId);
                 }
             }
+            const botaoPrioridade = event.target.closest('.btn-prioridade-agenda');
+            if (botaoPrioridade) {
+                alternarPrioridadeAgenda(botaoPrioridade.dataset.id, parseInt(botaoPrioridade.dataset.prioridade, 10) || 0);
+            }
         });
     }
 
@@ -1117,11 +1278,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
 
-            const result = await response.json();
+            let result = await response.json();
+            if (response.status === 202 && result.job_id) {
+                showAlert(result.message || 'Agenda enviada para a fila do robô.', 'info');
+                await loadAndRenderAgendas(); // Mostra o status enquanto o worker processa
+                result = await aguardarJob(result.job_id);
+            }
 
             if (result.success) {
                 showAlert(result.message || 'Agenda executada com sucesso!', 'success');
-                // Re-render the table to reflect status change (e.g., from 'espera'/'erro' to 'processando' then 'agendado')
+                // Recarrega a tabela: a agenda ('espera' ou 'erro', que pode ser reexecutada) passou por 'processando' e está 'agendado'
                 await loadAndRenderAgendas(); 
             } else {
                 showAlert(result.message || 'Ocorreu um erro ao executar a agenda.', 'danger');
@@ -1139,9 +1305,12 @@ document.addEventListener('DOMContentLoaded', function() {
     async function loadAndRenderAgendas() {
         const selectedYear = selectAnoFiltro.value;
         const selectedMonth = selectMesFiltro.value;
-        const agendas = await fetchAgendasData(selectedYear, selectedMonth); 
-        await renderAgendas(agendas);
-        // lastKnownStatuses não é mais necessário com o refresh completo a cada poll.
+        const geracao = ++geracaoGrid;
+        const pagina = await fetchAgendasData(selectedYear, selectedMonth); 
+        if (geracao !== geracaoGrid) return; // Filtro/ordem mudou enquanto a página chegava
+        await renderAgendas(pagina.agendas);
+        proximoCursorGrid = pagina.next_cursor;
+        atualizarLinhaCarregarMais();
     }
 
     // 1. Configurar valores padrões para ano e mês
@@ -1154,44 +1323,150 @@ document.addEventListener('DOMContentLoaded', function() {
         selectAnoFiltro.addEventListener('change', loadAndRenderAgendas);
         selectMesFiltro.addEventListener('change', loadAndRenderAgendas);
 
-        // 3. Inicializar a carga e configurar o polling de 5 segundos
-        async function pollForAgendaUpdates() {
-            const selectedYear = selectAnoFiltro.value;
-            const selectedMonth = selectMesFiltro.value;
-            const agendas = await fetchAgendasData(selectedYear, selectedMonth);
-            await renderAgendas(agendas);
-        }
-
+        // 3. Inicializar a carga e receber as alterações por SSE (polling incremental só como fallback)
         loadAndRenderAgendas(); // Executa uma vez imediatamente
-        setInterval(pollForAgendaUpdates, 10000); // Executa a cada 10 segundos
+        if (window.EventSource) {
+            iniciarStreamAgendas();
+        } else {
+            iniciarPollingAlteracoes();
+        }
     }
 
-    // Lógica de Filtragem da Tabela de Agendas
-    function applyGridFilters() {
-        const filters = {};
-        $('#filter-row input').each(function() {
-            const colIndex = $(this).data('column');
-            const value = $(this).val().toLowerCase();
-            if (value) {
-                filters[colIndex] = value;
+    // Fallback sem SSE: consulta a cada 10 segundos só o que mudou desde o último cursor
+    async function iniciarPollingAlteracoes() {
+        const buscarAlteracoes = async (query) => {
+            const response = await fetch(`/api/agendas/changes${query}`, { headers: getAuthHeaders() });
+            if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
+            return response.json();
+        };
+
+        let { cursor } = await buscarAlteracoes('');
+        await loadAndRenderAgendas(); // Recarrega depois de obter o cursor para não perder alterações no intervalo
+
+        setInterval(async () => {
+            try {
+                let resposta;
+                let anterior;
+                do {
+                    anterior = cursor;
+                    resposta = await buscarAlteracoes(`?since=${cursor}`);
+                    resposta.removed.forEach(id => aplicarEventoAgenda({ op: 'delete', id }));
+                    resposta.changes.forEach(agenda => aplicarEventoAgenda({ op: 'upsert', agenda }));
+                    cursor = resposta.cursor;
+                } while (resposta.has_more && cursor !== anterior);
+            } catch (error) {
+                console.error('Erro ao buscar alterações das agendas:', error);
             }
-        });
+        }, 10000);
+    }
 
-        $('#agendas-em-espera-body tr').each(function() {
-            let rowVisible = true;
-            const row = $(this);
-            
-            for (const colIndex in filters) {
-                const cellText = row.find('td').eq(colIndex).text().toLowerCase();
-                if (!cellText.includes(filters[colIndex])) {
-                    rowVisible = false;
-                    break;
-                }
+    // A agenda pertence ao mês/ano selecionado e passa nos filtros da grade?
+    // (data_agendamento vem como 'dd/mm/aaaa hh:mm'; os filtros são os mesmos do servidor)
+    function agendaNoFiltro(agenda) {
+        const [, mes, ano] = (agenda.data_agendamento || '').split(' ')[0].split('/');
+        if (Number(ano) !== Number(selectAnoFiltro.value) || Number(mes) !== Number(selectMesFiltro.value)) return false;
+        const valores = {
+            status: agenda.status, motorista: agenda.motorista, placa: agenda.caminhao && agenda.caminhao.placa,
+            protocolo: agenda.protocolo, pedido: agenda.pedido, destino: agenda.destino,
+        };
+        return Object.entries(filtrosDaGrade()).every(([campo, valor]) =>
+            String(valores[campo] || '').toLowerCase().includes(valor.toLowerCase()));
+    }
+
+    // Aplica um evento do stream na tabela, alterando apenas a linha da agenda afetada
+    function aplicarEventoAgenda(evento) {
+        if (!agendasEmEsperaBody) return;
+        if (evento.op === 'resync') {
+            loadAndRenderAgendas();
+            return;
+        }
+        const id = evento.op === 'delete' ? evento.id : evento.agenda.id;
+        const existente = agendasEmEsperaBody.querySelector(`tr[data-id="${id}"]`);
+
+        if (evento.op === 'delete' || !agendaNoFiltro(evento.agenda)) {
+            if (existente) existente.remove();
+            return;
+        }
+        const mudouPosicao = !existente || existente.dataset.ordem !== valorOrdenacao(evento.agenda);
+        if (existente) preencherLinhaAgenda(existente, evento.agenda);
+        if (!mudouPosicao) return;
+
+        if (ordenacaoGrid.replace(/^-/, '') !== 'data') {
+            // Textos são ordenados pela collation do banco: a posição certa vem do servidor
+            recarregarGradeEmBreve();
+            return;
+        }
+        if (!agendasEmEsperaBody.querySelector('tr[data-id]')) agendasEmEsperaBody.innerHTML = '';
+        const row = existente || document.createElement('tr');
+        if (!existente) preencherLinhaAgenda(row, evento.agenda);
+        inserirNaOrdem(row, evento.agenda);
+    }
+
+    // Valor da agenda no campo da ordenação atual (o mesmo de ORDENACOES_AGENDA no servidor)
+    function valorOrdenacao(agenda) {
+        switch (ordenacaoGrid.replace(/^-/, '')) {
+            case 'data': {
+                const [dia, mes, resto] = agenda.data_agendamento.split('/'); // 'dd/mm/aaaa hh:mm'
+                return `${resto.slice(0, 4)}${mes}${dia}${resto.slice(5)}`;
             }
-            row.toggle(rowVisible);
+            case 'motorista': return agenda.motorista || '';
+            case 'protocolo': return agenda.protocolo || '';
+            case 'status': return agenda.status || '';
+        }
+        return '';
+    }
+
+    // Coloca a linha na posição da ordenação atual (valor e, no empate, id, como no servidor)
+    function inserirNaOrdem(row, agenda) {
+        const decrescente = ordenacaoGrid.startsWith('-');
+        const valor = valorOrdenacao(agenda);
+        const vemAntes = (linha) => {
+            const outro = linha.dataset.ordem;
+            const comparacao = valor < outro ? -1 : valor > outro ? 1 : agenda.id - Number(linha.dataset.id);
+            return decrescente ? comparacao > 0 : comparacao < 0;
+        };
+        const seguinte = Array.from(agendasEmEsperaBody.querySelectorAll('tr[data-id]')).find(linha => linha !== row && vemAntes(linha));
+        if (!seguinte && proximoCursorGrid) {
+            row.remove(); // Pertence a uma página ainda não carregada: chega quando ela for carregada
+            return;
+        }
+        agendasEmEsperaBody.insertBefore(row, seguinte || agendasEmEsperaBody.querySelector('tr.linha-carregar-mais'));
+    }
+
+    let temporizadorRecarga = null;
+    function recarregarGradeEmBreve() {
+        clearTimeout(temporizadorRecarga);
+        temporizadorRecarga = setTimeout(loadAndRenderAgendas, 500);
+    }
+
+    function iniciarStreamAgendas() {
+        const stream = new EventSource('/api/agendas/stream');
+        let conectadoAntes = false;
+        stream.addEventListener('open', () => {
+            // Após uma reconexão, eventos podem ter sido perdidos: recarrega a lista uma vez
+            if (conectadoAntes) loadAndRenderAgendas();
+            conectadoAntes = true;
+        });
+        stream.addEventListener('agenda', (e) => aplicarEventoAgenda(JSON.parse(e.data)));
+        stream.addEventListener('error', () => {
+            // Erros de rede reconectam sozinhos (CONNECTING); uma resposta recusada, como o 503
+            // do limite de streams do servidor, fecha o EventSource: passa para o polling
+            if (stream.readyState === EventSource.CLOSED) iniciarPollingAlteracoes();
         });
     }
 
-    // Adiciona o event listener para os campos de filtro
-    $(document).on('keyup', '#filter-row input', applyGridFilters);
+    // Filtros e ordenação da grade: executados no servidor, recarregando a primeira página
+    let temporizadorFiltros = null;
+    $(document).on('input', '#filter-row input', function() {
+        clearTimeout(temporizadorFiltros);
+        temporizadorFiltros = setTimeout(loadAndRenderAgendas, 300);
+    });
+
+    $(document).on('click', 'th[data-sort]', function() {
+        const campo = $(this).data('sort');
+        ordenacaoGrid = ordenacaoGrid === `-${campo}` ? campo : `-${campo}`;
+        $('th[data-sort] i').remove();
+        $(this).append(` <i class="fas ${ordenacaoGrid.startsWith('-') ? 'fa-sort-down' : 'fa-sort-up'}"></i>`);
+        loadAndRenderAgendas();
+    });
 });